@@ -6,7 +6,7 @@ from fastapi import APIRouter
 
 from src.mappers.forecast_mapper import map_forecast
 from src.types import ForecastDto
-from shared.src.database.forecasts import get_forecast_data_from_database
+from shared.src.database.forecasts import get_forecast_data_from_database_async
 from shared.src.database.locations import AirQualityLocationType
 
 router = APIRouter()
@@ -25,7 +25,7 @@ async def get_forecast_data(
             base_time, valid_time_from, valid_time_to, location_type
         )
     )
-    db_results = get_forecast_data_from_database(
+    db_results = await get_forecast_data_from_database_async(
         valid_time_from,
         valid_time_to,
         location_type.value,
@@ -1,8 +1,10 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from logging import config
 from . import forecast_controller, measurements_controller, texture_controller
+from shared.src.database.mongo_db_operations import close_clients
 
 origins = [
     "http://localhost:5173",
@@ -16,7 +18,14 @@ origins = [
 load_dotenv()
 config.fileConfig("./logging.ini", disable_existing_loggers=False)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
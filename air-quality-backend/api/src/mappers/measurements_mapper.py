@@ -1,8 +1,10 @@
 from datetime import UTC
 from typing import List
 
+import numpy as np
+
 from src.types import MeasurementDto, MeasurementSummaryDto
-from shared.src.aqi.calculator import get_pollutant_index_level, get_overall_aqi_level
+from shared.src.aqi.calculator import get_pollutant_index_levels, get_overall_aqi_level
 from shared.src.aqi.pollutant_type import PollutantType
 from shared.src.database.in_situ import InSituMeasurement, InSituAveragedMeasurement
 
@@ -34,6 +36,7 @@ def map_measurements(measurements: list[InSituMeasurement]) -> list[MeasurementD
 
 def map_summarized_measurement(
     measurement: InSituAveragedMeasurement,
+    aqi_levels: dict[PollutantType, int],
 ) -> MeasurementSummaryDto:
     pollutant_data = {}
     mean_aqi_values = []
@@ -41,10 +44,7 @@ def map_summarized_measurement(
         pollutant_value = pollutant_type.literal()
         avg_value = measurement[pollutant_value]["mean"]
         if avg_value is not None:
-            aqi = get_pollutant_index_level(
-                avg_value,
-                pollutant_type,
-            )
+            aqi = aqi_levels[pollutant_type]
             if pollutant_value not in pollutant_data:
                 pollutant_data[pollutant_value] = {}
             pollutant_data[pollutant_value]["mean"] = {
@@ -65,7 +65,28 @@ def map_summarized_measurement(
 def map_summarized_measurements(
     averages: List[InSituAveragedMeasurement],
 ) -> List[MeasurementSummaryDto]:
-    return list(map(map_summarized_measurement, averages))
+    # Classify every location's mean for a pollutant in one call, missing means
+    # become NaN and are skipped when mapping
+    aqi_levels_by_pollutant = {
+        pollutant_type: get_pollutant_index_levels(
+            np.array(
+                [average[pollutant_type.literal()]["mean"] for average in averages],
+                dtype=float,
+            ),
+            pollutant_type,
+        ).tolist()
+        for pollutant_type in PollutantType
+    }
+    return [
+        map_summarized_measurement(
+            average,
+            {
+                pollutant_type: aqi_levels[index]
+                for pollutant_type, aqi_levels in aqi_levels_by_pollutant.items()
+            },
+        )
+        for index, average in enumerate(averages)
+    ]
 
 
 def map_measurement_counts(measurements):
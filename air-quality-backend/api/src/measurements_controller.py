@@ -10,7 +10,11 @@ from src.mappers.measurements_mapper import (
     map_measurement_counts,
 )
 from .types import MeasurementSummaryDto, MeasurementDto
-from shared.src.database.in_situ import ApiSource, get_averaged, find_by_criteria
+from shared.src.database.in_situ import (
+    ApiSource,
+    get_averaged_async,
+    find_by_criteria_async,
+)
 from shared.src.database.locations import AirQualityLocationType
 
 router = APIRouter()
@@ -27,7 +31,7 @@ async def get_measurements(
     log.info(
         f"Fetching measurements between {date_from} - {date_to} for {location_type}"
     )
-    db_results = find_by_criteria(
+    db_results = await find_by_criteria_async(
         date_from, date_to, location_type, location_names, api_source
     )
 
@@ -46,7 +50,7 @@ async def get_measurements_summary(
             measurement_base_time, measurement_time_range, location_type
         )
     )
-    averaged_measurements = get_averaged(
+    averaged_measurements = await get_averaged_async(
         measurement_base_time, measurement_time_range, location_type
     )
     log.info(f"Found results for {len(averaged_measurements)} locations")
@@ -64,7 +68,7 @@ async def get_measurement_counts(
     log.info(
         f"Fetching measurement counts between {date_from} - {date_to} for {location_type}"
     )
-    measurements = find_by_criteria(
+    measurements = await find_by_criteria_async(
         date_from,
         date_to,
         location_type,
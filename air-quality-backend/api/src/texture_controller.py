@@ -7,7 +7,7 @@ from fastapi.responses import JSONResponse
 
 from src.mappers.texture_mapper import map_texture
 from src.types import TextureDto
-from shared.src.database.forecasts import get_data_textures_from_database
+from shared.src.database.forecasts import get_data_textures_from_database_async
 
 router = APIRouter()
 
@@ -17,7 +17,7 @@ async def get_data_texture(base_time: datetime) -> List[TextureDto]:
     try:
         log.info(f"Fetching forecast data texture URIs for base time {base_time}")
 
-        db_results = get_data_textures_from_database(base_time)
+        db_results = await get_data_textures_from_database_async(base_time)
         log.info(f"Fetched {len(db_results)} results from the database")
 
         if not db_results:
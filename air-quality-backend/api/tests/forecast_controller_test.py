@@ -19,7 +19,7 @@ default_request_params = {
 
 def test__get_forecast_data__no_city_name():
     with patch(
-        "src.forecast_controller.get_forecast_data_from_database",
+        "src.forecast_controller.get_forecast_data_from_database_async",
         return_value=[],
     ) as mock_fetch_data:
         response = client.get("/air-pollutant/forecast", params=default_request_params)
@@ -36,7 +36,7 @@ def test__get_forecast_data__no_city_name():
 
 def test__get_forecast_data__with_city_name():
     with patch(
-        "src.forecast_controller.get_forecast_data_from_database",
+        "src.forecast_controller.get_forecast_data_from_database_async",
         return_value=[],
     ) as mock_fetch_data:
         params = {**default_request_params, "location_name": "Test City"}
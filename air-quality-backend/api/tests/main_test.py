@@ -0,0 +1,13 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+
+
+@patch("src.main.close_clients")
+def test__app_shutdown__database_clients_closed(mock_close_clients):
+    with TestClient(app):
+        mock_close_clients.assert_not_called()
+
+    mock_close_clients.assert_called_once()
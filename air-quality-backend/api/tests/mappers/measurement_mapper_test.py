@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 from unittest.mock import patch
 
+import numpy as np
+
 from src.mappers.measurements_mapper import (
     map_measurements,
     map_summarized_measurements,
@@ -45,8 +47,8 @@ def test__map_measurements():
 
 
 @patch(
-    "src.mappers.measurements_mapper.get_pollutant_index_level",
-    return_value=1.0,
+    "src.mappers.measurements_mapper.get_pollutant_index_levels",
+    return_value=np.array([1]),
 )
 @patch(
     "src.mappers.measurements_mapper.get_overall_aqi_level",
@@ -77,3 +79,38 @@ def test__map_summarized_measurements(m1, m2):
             },
         },
     ]
+
+
+def test__map_summarized_measurements__aqi_levels_calculated_per_location():
+    result = map_summarized_measurements(
+        [
+            create_mock_averaged_measurement_document(
+                {
+                    "name": "City 1",
+                    "o3": {"mean": 45.0},
+                    "no2": {"mean": 95.0},
+                    "so2": {"mean": None},
+                    "pm2_5": {"mean": None},
+                    "pm10": {"mean": None},
+                }
+            ),
+            create_mock_averaged_measurement_document(
+                {
+                    "name": "City 2",
+                    "o3": {"mean": None},
+                    "no2": {"mean": 10.0},
+                    "so2": {"mean": None},
+                    "pm2_5": {"mean": 80.0},
+                    "pm10": {"mean": None},
+                }
+            ),
+        ]
+    )
+    assert result[0]["o3"] == {"mean": {"aqi_level": 1, "value": 45.0}}
+    assert result[0]["no2"] == {"mean": {"aqi_level": 3, "value": 95.0}}
+    assert result[0]["overall_aqi_level"] == {"mean": 3}
+    assert "pm2_5" not in result[0]
+    assert result[1]["no2"] == {"mean": {"aqi_level": 1, "value": 10.0}}
+    assert result[1]["pm2_5"] == {"mean": {"aqi_level": 6, "value": 80.0}}
+    assert result[1]["overall_aqi_level"] == {"mean": 6}
+    assert "o3" not in result[1]
@@ -93,7 +93,7 @@ def test__measurements_applies_appropriate_filters__when_request_valid():
         "api_source": "OpenAQ",
     }
     with patch(
-        "src.measurements_controller.find_by_criteria", return_value=[]
+        "src.measurements_controller.find_by_criteria_async", return_value=[]
     ) as mock_find_criteria:
         response = client.get("/air-pollutant/measurements", params=params)
         assert response.status_code == 200
@@ -174,7 +174,7 @@ def test__summary_invalid_query_params__throw_error(field, params, expected_msg)
 
 def test__summary_applies_appropriate_filters__when_request_valid():
     with patch(
-        "src.measurements_controller.get_averaged", return_value=[]
+        "src.measurements_controller.get_averaged_async", return_value=[]
     ) as mock_get_averaged:
         response = client.get(
             "/air-pollutant/measurements/summary", params=summary_request_defaults
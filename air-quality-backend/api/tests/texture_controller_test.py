@@ -14,7 +14,7 @@ default_request_params = {
 
 def test__get_data_texture__no_results():
     with patch(
-        "src.texture_controller.get_data_textures_from_database",
+        "src.texture_controller.get_data_textures_from_database_async",
         return_value=[],
     ) as mock_fetch_data:
         response = client.get(
@@ -85,7 +85,7 @@ def test__get_data_texture__with_results():
         },
     ]
     with patch(
-        "src.texture_controller.get_data_textures_from_database",
+        "src.texture_controller.get_data_textures_from_database_async",
         return_value=mock_db_results,
     ) as mock_fetch_data:
         response = client.get(
@@ -101,7 +101,7 @@ def test__get_data_texture__with_results():
 
 def test__get_data_texture__exception_handling():
     with patch(
-        "src.texture_controller.get_data_textures_from_database",
+        "src.texture_controller.get_data_textures_from_database_async",
         side_effect=Exception("Database error"),
     ) as mock_fetch_data:
         response = client.get(
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import xarray as xr
+
+from shared.src.aqi import calculator as aqi_calculator
+from shared.src.aqi.pollutant_type import PollutantType
+
+# Full CAMS global grid at 0.4 degree resolution
+LATITUDES = np.linspace(90, -90, 451)
+LONGITUDES = np.arange(-180, 180, 0.4)
+
+
+def _create_global_grid(pollutant_type: PollutantType) -> xr.DataArray:
+    rng = np.random.default_rng(seed=len(pollutant_type.value))
+    values = rng.gamma(shape=2.0, scale=25.0, size=(len(LATITUDES), len(LONGITUDES)))
+    return xr.DataArray(
+        values,
+        dims=["latitude", "longitude"],
+        coords={"latitude": LATITUDES, "longitude": LONGITUDES},
+    )
+
+
+def _time(function) -> tuple[float, xr.DataArray]:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def _per_element(data: xr.DataArray, pollutant_type: PollutantType) -> xr.DataArray:
+    return xr.apply_ufunc(
+        aqi_calculator.get_pollutant_fractional_index_level,
+        data,
+        pollutant_type,
+        vectorize=True,
+    )
+
+
+def _vectorized(data: xr.DataArray, pollutant_type: PollutantType) -> xr.DataArray:
+    return xr.apply_ufunc(
+        aqi_calculator.get_pollutant_fractional_index_levels,
+        data,
+        kwargs={"pollutant_type": pollutant_type},
+    )
+
+
+def main():
+    print(
+        f"Fractional AQI for one time step on a "
+        f"{len(LATITUDES)} x {len(LONGITUDES)} grid"
+    )
+    total_per_element = 0.0
+    total_vectorized = 0.0
+    for pollutant_type in PollutantType:
+        data = _create_global_grid(pollutant_type)
+        per_element_time, expected = _time(lambda: _per_element(data, pollutant_type))
+        vectorized_time, result = _time(lambda: _vectorized(data, pollutant_type))
+        xr.testing.assert_equal(result, expected)
+
+        total_per_element += per_element_time
+        total_vectorized += vectorized_time
+        print(
+            f"{pollutant_type.value:>6}: per-element {per_element_time:8.3f}s, "
+            f"vectorized {vectorized_time:8.4f}s, "
+            f"speedup {per_element_time / vectorized_time:6.1f}x"
+        )
+
+    print(
+        f" total: per-element {total_per_element:8.3f}s, "
+        f"vectorized {total_vectorized:8.4f}s, "
+        f"speedup {total_per_element / total_vectorized:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
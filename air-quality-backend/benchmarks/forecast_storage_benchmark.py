@@ -0,0 +1,126 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import bson
+import numpy as np
+from dotenv import load_dotenv
+
+from shared.src.aqi.pollutant_type import PollutantType
+from shared.src.database import forecasts
+from shared.src.database.mongo_db_operations import close_clients, get_client
+
+# One CAMS forecast run: 41 three hourly steps for each city
+CITY_COUNT = 150
+STEP_COUNT = 41
+BASE_TIME = datetime(2024, 6, 1, 0, 0, tzinfo=timezone.utc)
+QUERY_REPEATS = 20
+
+
+def _create_forecast_documents() -> list[forecasts.Forecast]:
+    rng = np.random.default_rng(seed=1)
+    documents = []
+    for city in range(CITY_COUNT):
+        location = {
+            "type": "Point",
+            "coordinates": [float(rng.uniform(-180, 180)), float(rng.uniform(-90, 90))],
+        }
+        for step in range(STEP_COUNT):
+            documents.append(
+                {
+                    "name": f"City {city}",
+                    "location_type": "city",
+                    "location": location,
+                    "forecast_base_time": BASE_TIME,
+                    "forecast_valid_time": BASE_TIME + timedelta(hours=3 * step),
+                    "forecast_range": 3 * step,
+                    "overall_aqi_level": int(rng.integers(1, 7)),
+                    "source": "cams-production",
+                    **{
+                        pollutant_type.value: {
+                            "aqi_level": int(rng.integers(1, 7)),
+                            "value": float(rng.gamma(2.0, 25.0)),
+                        }
+                        for pollutant_type in PollutantType
+                    },
+                }
+            )
+    return documents
+
+
+def _time(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _print_storage_sizes(documents: list[forecasts.Forecast]):
+    columnar_documents = forecasts.to_columnar_forecasts(documents)
+    document_bytes = sum(len(bson.encode(document)) for document in documents)
+    columnar_bytes = sum(len(bson.encode(document)) for document in columnar_documents)
+    print(f"Forecast storage for {CITY_COUNT} cities x {STEP_COUNT} steps")
+    print(f"  document: {len(documents):6} documents, {document_bytes:9} BSON bytes")
+    print(
+        f"  columnar: {len(columnar_documents):6} documents, "
+        f"{columnar_bytes:9} BSON bytes"
+    )
+
+
+def _benchmark_database(documents: list[forecasts.Forecast], storage: str):
+    query_params = (
+        BASE_TIME + timedelta(hours=24),
+        BASE_TIME + timedelta(hours=48),
+        "city",
+        BASE_TIME,
+    )
+    with mock.patch.dict(os.environ, {"FORECAST_STORAGE": storage}):
+        insert_time = _time(lambda: forecasts.insert_data(documents))
+        query_time = (
+            sum(
+                _time(lambda: forecasts.get_forecast_data_from_database(*query_params))
+                for _ in range(QUERY_REPEATS)
+            )
+            / QUERY_REPEATS
+        )
+        single_city_time = (
+            sum(
+                _time(
+                    lambda: forecasts.get_forecast_data_from_database(
+                        *query_params, "City 1"
+                    )
+                )
+                for _ in range(QUERY_REPEATS)
+            )
+            / QUERY_REPEATS
+        )
+    print(
+        f"  {storage}: insert {insert_time:7.3f}s, "
+        f"query all cities {query_time * 1000:8.2f}ms, "
+        f"query one city {single_city_time * 1000:8.2f}ms"
+    )
+
+
+def main():
+    load_dotenv()
+    documents = _create_forecast_documents()
+    _print_storage_sizes(documents)
+
+    if os.environ.get("MONGO_DB_URI") is None:
+        print("Set MONGO_DB_URI to also benchmark inserts and queries")
+        return
+
+    # Write to a separate database so stored forecasts are left untouched
+    database_name = os.environ.get("BENCHMARK_DB_NAME", "air_quality_benchmark")
+    print(f"Database timings against {database_name}, one day window")
+    with mock.patch.dict(os.environ, {"MONGO_DB_NAME": database_name}):
+        try:
+            for storage in ["document", "columnar"]:
+                _benchmark_database(documents, storage)
+        finally:
+            get_client().drop_database(database_name)
+            close_clients()
+
+
+if __name__ == "__main__":
+    main()
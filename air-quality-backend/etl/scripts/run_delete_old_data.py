@@ -4,12 +4,21 @@ from dotenv import load_dotenv
 import logging
 from logging import config
 
+from etl.src.forecast.forecast_artifact_store import (
+    delete_artifacts_before,
+    get_artifact_store_location,
+)
 from etl.src.forecast.forecast_texture_storer import delete_data_textures_before
 from shared.src.database.forecasts import (
     delete_forecast_data_before,
     delete_data_texture_data_before,
 )
-from shared.src.database.in_situ import delete_in_situ_data_before
+from shared.src.database.in_situ import (
+    delete_in_situ_data_before,
+    ensure_in_situ_data_expiry,
+    in_situ_data_expires,
+)
+from shared.src.database.mongo_db_operations import close_clients
 
 config.fileConfig("./logging.ini")
 
@@ -27,10 +36,20 @@ def main():
 
     logging.info(f"Deleting data earlier than {initial_valid_date}")
     delete_forecast_data_before(initial_valid_date)
-    delete_in_situ_data_before(initial_valid_date)
+    if in_situ_data_expires():
+        ensure_in_situ_data_expiry()
+        logging.info("In situ data expires from its time series collection")
+    else:
+        delete_in_situ_data_before(initial_valid_date)
     delete_data_texture_data_before(initial_valid_date)
     delete_data_textures_before(initial_valid_date)
+    artifact_store_location = get_artifact_store_location()
+    if artifact_store_location is not None:
+        delete_artifacts_before(artifact_store_location, initial_valid_date)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close_clients()
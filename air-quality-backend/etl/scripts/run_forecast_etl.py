@@ -1,11 +1,13 @@
 import logging
+import os
 
 from logging import config
 
 from dotenv import load_dotenv
 from etl.src.forecast.forecast_date_retriever import retrieve_dates_requiring_forecast
-from etl.src.forecast.forecast_orchestrator import process_forecast
+from etl.src.forecast.forecast_orchestrator import process_forecast, process_forecasts
 from shared.src.database.locations import get_locations_by_type, AirQualityLocationType
+from shared.src.database.mongo_db_operations import close_clients
 
 config.fileConfig("./logging.ini")
 
@@ -19,9 +21,17 @@ def main():
     base_dates = retrieve_dates_requiring_forecast()
     logging.info(f"Finding data for {len(base_dates)} dates")
 
-    for base_date in base_dates:
-        process_forecast(cities, base_date)
+    workers = int(os.getenv("FORECAST_BACKFILL_WORKERS", 1))
+    if workers > 1 and len(base_dates) > 1:
+        logging.info(f"Backfilling forecast data with {workers} workers")
+        process_forecasts(cities, base_dates, workers)
+    else:
+        for base_date in base_dates:
+            process_forecast(cities, base_date)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close_clients()
@@ -1,13 +1,20 @@
 import logging
 import os
+from datetime import timedelta
 from logging import config
 
 from dotenv import load_dotenv
 
-from etl.src.in_situ.openaq_date_retriever import retrieve_dates_requiring_in_situ_data
+from etl.src.in_situ.openaq_date_retriever import (
+    merge_in_situ_windows,
+    retrieve_dates_requiring_in_situ_data,
+    split_measurements_by_date,
+)
 from etl.src.in_situ.openaq_orchestrator import retrieve_openaq_in_situ_data
+from etl.src.in_situ.openaq_response_cache import evict_cached_responses
 from shared.src.database.in_situ import insert_data
 from shared.src.database.locations import get_locations_by_type, AirQualityLocationType
+from shared.src.database.mongo_db_operations import close_clients
 
 config.fileConfig("./logging.ini")
 
@@ -24,14 +31,37 @@ def main():
         cities = [city for city in cities if city["name"] in open_aq_cities.split(",")]
     logging.info(f"Finding data for {cities.__len__()} cities")
 
-    in_situ_dates = retrieve_dates_requiring_in_situ_data()
+    in_situ_dates = sorted(retrieve_dates_requiring_in_situ_data())
+    evict_cached_responses()
 
-    for date in in_situ_dates:
-        logging.info(f"Finding in-situ data for the 24 hour period before {date}")
+    # Contiguous missing days are fetched as one window, up to the length the
+    # forecast data fetched alongside them can cover
+    max_window_hours = int(os.getenv("IN_SITU_MAX_WINDOW_HOURS", 96))
+    windows = merge_in_situ_windows(in_situ_dates, 24, max_window_hours)
+    logging.info(
+        f"Finding in-situ data for {len(in_situ_dates)} dates in {len(windows)} windows"
+    )
+
+    for end_date, period_hours in windows:
+        logging.info(
+            f"Finding in-situ data for the {period_hours} hour period before {end_date}"
+        )
 
-        open_aq_data = retrieve_openaq_in_situ_data(cities, date, 24)
-        insert_data(open_aq_data)
+        open_aq_data = retrieve_openaq_in_situ_data(cities, end_date, period_hours)
+        window_dates = [
+            date
+            for date in in_situ_dates
+            if end_date - timedelta(hours=period_hours) < date <= end_date
+        ]
+        for date, date_data in zip(
+            window_dates, split_measurements_by_date(open_aq_data, window_dates)
+        ):
+            logging.info(f"Persisting {len(date_data)} in-situ measurements for {date}")
+            insert_data(date_data)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        close_clients()
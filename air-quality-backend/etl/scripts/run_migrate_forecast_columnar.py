@@ -0,0 +1,23 @@
+from dotenv import load_dotenv
+import logging
+from logging import config
+
+from shared.src.database.forecasts import migrate_to_columnar_forecasts
+from shared.src.database.mongo_db_operations import close_clients
+
+config.fileConfig("./logging.ini")
+
+
+def main():
+    load_dotenv()
+
+    logging.info("Migrating forecast data to the columnar forecast collection")
+    migrated = migrate_to_columnar_forecasts()
+    logging.info(f"Migrated {migrated} columnar forecast documents")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        close_clients()
@@ -0,0 +1,25 @@
+from dotenv import load_dotenv
+import logging
+import os
+from logging import config
+
+from shared.src.database.in_situ import migrate_to_time_series_collection
+from shared.src.database.mongo_db_operations import close_clients
+
+config.fileConfig("./logging.ini")
+
+
+def main():
+    load_dotenv()
+
+    batch_size = int(os.getenv("IN_SITU_MIGRATION_BATCH_SIZE", 10000))
+
+    logging.info("Migrating in situ data to the time series collection")
+    migrate_to_time_series_collection(batch_size)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        close_clients()
@@ -0,0 +1,22 @@
+from dotenv import load_dotenv
+import logging
+from logging import config
+
+from shared.src.database.indexes import ensure_indexes
+from shared.src.database.mongo_db_operations import close_clients
+
+config.fileConfig("./logging.ini")
+
+
+def main():
+    load_dotenv()
+
+    logging.info("Updating database indexes")
+    ensure_indexes()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        close_clients()
@@ -1,11 +1,17 @@
 from datetime import datetime, timezone
-from decimal import Decimal
 from typing import List, Dict, Tuple
 import logging
-from typing import TypedDict
-from .forecast_data import ForecastData, convert_to_forecast_data_type
-from .forecast_texture_storer import save_data_textures
-from shared.src.xarray_utils import get_dim_names
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+from .forecast_data import ForecastData, ForecastDataType, convert_to_forecast_data_type
+from .forecast_texture_storer import (
+    create_texture_documents,
+    prepare_data_textures,
+    save_data_textures,
+    write_texture_to_disk,
+)
+from shared.src.xarray_utils import get_chunk_slices, get_dim_names
 from shared.src.database.locations import AirQualityLocation
 from shared.src.aqi import calculator as aqi_calculator
 from shared.src.aqi.pollutant_type import PollutantType
@@ -26,111 +32,103 @@ VARIABLE_RANGES = {
 }
 
 
-class PollutantData(TypedDict):
-    values_ug_m3: list[float]
-    aqi_values: list[int]
+# CAMS concentrations are in kg m-3, forecasts are stored in µg m-3
+KG_M3_TO_UG_M3 = 1e9
 
 
-def _convert_pollutant_values(pollutant_type: PollutantType, raw_values: list[float]):
+def _get_aqi_levels(values_ug_m3: np.ndarray, pollutant_types: list) -> np.ndarray:
     """
-    Convert pollutant values to appropriate units and add aqi_values
-    :param pollutant_type:
-    :param raw_values:
-    :return:
+    Classify (location, pollutant, step) concentrations into AQI levels
+    :param values_ug_m3:
+    :param pollutant_types: pollutant for each entry on the second axis
+    :return: integer AQI levels with the same shape as values_ug_m3
     """
-    pollutant_forecast_values_ug_m3 = [
-        float(Decimal(str(x)) * Decimal(10**9)) for x in raw_values
-    ]
-    return {
-        "values_ug_m3": pollutant_forecast_values_ug_m3,
-        "aqi_values": list(
-            map(
-                lambda x: aqi_calculator.get_pollutant_index_level(x, pollutant_type),
-                pollutant_forecast_values_ug_m3,
-            )
-        ),
-    }
-
-
-def _get_overall_aqi_value_for_step(
-    location_forecast_data_by_type: dict[PollutantType:PollutantData], index: int
-) -> int:
-    """
-    Calculate overall AQI value for pollutants at single forecast_valid_time (step)
-    :param location_forecast_data_by_type:
-    :param index:
-    :return: overall_aqi_value
-    """
-    return aqi_calculator.get_overall_aqi_level(
-        list(
-            map(
-                lambda x: x["aqi_values"][index],
-                location_forecast_data_by_type.values(),
-            )
-        )
+    return np.stack(
+        [
+            aqi_calculator.get_pollutant_index_levels(values_ug_m3[:, j], pollutant)
+            for j, pollutant in enumerate(pollutant_types)
+        ],
+        axis=1,
     )
 
 
 def transform(forecast_data: ForecastData, locations: list[AirQualityLocation]) -> list:
-    pollutant_data_with_location = forecast_data.get_pollutant_data_for_locations(
-        locations, list(PollutantType)
+    """
+    Interpolate the forecast to each location and build one document per
+    location and step. Values, AQI levels and the overall level are computed
+    as (location, pollutant, step) arrays before any document is created.
+    :param forecast_data:
+    :param locations:
+    :return: forecast documents, ordered by location then step
+    """
+    pollutant_types = list(PollutantType)
+    values_ug_m3 = (
+        forecast_data.get_pollutant_values_for_locations(locations, pollutant_types)
+        * KG_M3_TO_UG_M3
     )
+    aqi_levels = _get_aqi_levels(values_ug_m3, pollutant_types)
+    overall_aqi_levels = aqi_levels.max(axis=1)
 
-    valid_time_values = forecast_data.get_valid_time_values()
-    step_values = forecast_data.get_step_values()
     model_base_time = datetime.fromtimestamp(
         forecast_data.get_time_value(), timezone.utc
     )
-    pollutant_forecast_for_location = []
-
-    for location, data_by_pollutant in pollutant_data_with_location:
-        location_name = location["name"]
-        location_type = location["type"]
-        logging.debug(f"Processing location: {location_name} ({location_type})")
-        forecast_data_by_type = {
-            pollutant_type: _convert_pollutant_values(pollutant_type, data)
-            for pollutant_type, data in data_by_pollutant.items()
-        }
-
-        for i in range(0, step_values.size):
-            measurement_timestamp = valid_time_values[i]
-            measurement_date = datetime.fromtimestamp(
-                measurement_timestamp, timezone.utc
-            )
-            overall_aqi_value = _get_overall_aqi_value_for_step(
-                forecast_data_by_type, i
-            )
+    valid_times = [
+        datetime.fromtimestamp(valid_time, timezone.utc)
+        for valid_time in forecast_data.get_valid_time_values()
+    ]
+    forecast_ranges = [int(step) for step in forecast_data.get_step_values()]
+    logging.info(
+        f"Creating {len(locations) * len(valid_times)} forecast documents "
+        f"for {len(locations)} locations"
+    )
 
-            pollutant_data = {
-                pollutant_type.value: {
-                    "aqi_level": forecast_data_by_type[pollutant_type]["aqi_values"][i],
-                    "value": forecast_data_by_type[pollutant_type]["values_ug_m3"][i],
-                }
-                for pollutant_type in PollutantType
-            }
+    # Plain Python values, so documents hold no numpy scalars
+    values_ug_m3 = values_ug_m3.tolist()
+    aqi_levels = aqi_levels.tolist()
+    overall_aqi_levels = overall_aqi_levels.tolist()
 
+    pollutant_forecast_for_location = []
+    for i, location in enumerate(locations):
+        coordinates = [location["longitude"], location["latitude"]]
+        for step, (valid_time, forecast_range) in enumerate(
+            zip(valid_times, forecast_ranges)
+        ):
             document = {
-                "name": location_name,
-                "location_type": location_type,
-                "location": {
-                    "type": "Point",
-                    "coordinates": [location["longitude"], location["latitude"]],
-                },
+                "name": location["name"],
+                "location_type": location["type"],
+                "location": {"type": "Point", "coordinates": list(coordinates)},
                 "forecast_base_time": model_base_time,
-                "forecast_valid_time": measurement_date,
-                "forecast_range": int(step_values[i]),
-                "overall_aqi_level": overall_aqi_value,
+                "forecast_valid_time": valid_time,
+                "forecast_range": forecast_range,
+                "overall_aqi_level": overall_aqi_levels[i][step],
                 "source": "cams-production",
-                **pollutant_data,
             }
+            for j, pollutant_type in enumerate(pollutant_types):
+                document[pollutant_type.value] = {
+                    "aqi_level": aqi_levels[i][j][step],
+                    "value": values_ug_m3[i][j][step],
+                }
             pollutant_forecast_for_location.append(document)
     return pollutant_forecast_for_location
 
 
-def _normalise_data(arr: np.ndarray, norm_min: float, norm_max: float) -> np.ndarray:
+def _normalise_data(
+    arr: np.ndarray, norm_min: float, norm_max: float, out: np.ndarray = None
+) -> np.ndarray:
+    """
+    Scale values so norm_min maps to 0 and norm_max maps to 1, writing into out
+    when given to avoid allocating a new array
+    """
+    if out is None:
+        if norm_min == norm_max:
+            return np.zeros_like(arr)
+        return (arr - norm_min) / (norm_max - norm_min)
     if norm_min == norm_max:
-        return np.zeros_like(arr)
-    return (arr - norm_min) / (norm_max - norm_min)
+        out[...] = 0
+        return out
+    np.subtract(arr, norm_min, out=out)
+    np.divide(out, norm_max - norm_min, out=out)
+    return out
 
 
 def _calc_aqi_2D(data: xr.Dataset) -> xr.DataArray:
@@ -145,30 +143,89 @@ def _calc_aqi_2D(data: xr.Dataset) -> xr.DataArray:
         PollutantType.SULPHUR_DIOXIDE,
     ]
 
-    aqi_levels = []
+    aqi = None
     for pollutant_type in pollutant_types:
         pollutant_name = pollutant_type.literal()
         if pollutant_name in data:
             aqi_level = xr.apply_ufunc(
-                aqi_calculator.get_pollutant_fractional_index_level,
+                aqi_calculator.get_pollutant_fractional_index_levels,
                 data[pollutant_name],
-                pollutant_type,
-                vectorize=True,
+                kwargs={"pollutant_type": pollutant_type},
                 dask="parallelized",
-                output_dtypes=[float],
+                output_dtypes=[data[pollutant_name].dtype],
             )
-            aqi_levels.append(aqi_level)
-
-    aqi = xr.concat(aqi_levels, dim="pollutant").max(dim="pollutant")
+            # Running maximum keeps a single grid alive instead of one per pollutant
+            aqi = aqi_level if aqi is None else np.maximum(aqi, aqi_level)
 
     return aqi.round(decimals=1)
 
 
+def _to_texture_layout(
+    data: xr.DataArray, lat_dim: str, lon_dim: str, time_dim: str, scale: float = 1.0
+) -> np.ndarray:
+    """
+    Lay out a (lat, lon, time) cube as a float32 (lat, lon * time) array, with each
+    time step occupying a contiguous block of longitudes.
+
+    :param data: The data to lay out.
+    :param lat_dim: Name of the latitude dimension.
+    :param lon_dim: Name of the longitude dimension.
+    :param time_dim: Name of the time dimension.
+    :param scale: Factor applied in place to the values.
+
+    :return: The float32 array, owned by the caller and safe to modify in place.
+    """
+    cube = np.ascontiguousarray(
+        data.transpose(lat_dim, time_dim, lon_dim).values, dtype=np.float32
+    )
+    if scale != 1.0:
+        cube *= scale
+    num_lat, num_time, num_lon = cube.shape
+    return cube.reshape(num_lat, num_time * num_lon)
+
+
+def _encode_channel(
+    layout: np.ndarray, min_val: float, max_val: float, channel: np.ndarray
+):
+    """
+    Normalise, scale and clip the layout in place, then write it into the uint8
+    texture channel.
+    """
+    _normalise_data(layout, min_val, max_val, out=layout)
+    layout *= 255
+    np.clip(layout, 0, 255, out=layout)
+    channel[...] = layout
+
+
+def _encode_variable(
+    data: xr.DataArray,
+    dims: Tuple[str, str, str],
+    min_val: float,
+    max_val: float,
+    channel: np.ndarray,
+    scale: float = 1.0,
+):
+    """
+    Encode a (lat, lon, time) cube into a texture channel. Lazy data is computed
+    one chunk of time steps at a time, each filling its own block of longitudes.
+    """
+    lat_dim, lon_dim, time_dim = dims
+    num_lon = data.sizes[lon_dim]
+    for time_slice in get_chunk_slices(data, time_dim):
+        start, stop, _ = time_slice.indices(data.sizes[time_dim])
+        _encode_channel(
+            _to_texture_layout(data.isel({time_dim: time_slice}), *dims, scale=scale),
+            min_val,
+            max_val,
+            channel[:, start * num_lon : stop * num_lon],
+        )
+
+
 def _convert_data(
     input_data: xr.Dataset, variable: str
 ) -> Tuple[np.ndarray, float, float, str, int, xr.DataArray]:
     """
-    Convert data to numpy array.
+    Convert data to numpy array, encoding every time step in a single pass.
 
     :param input_data: The input dataset.
     :param variable: The variable to convert.
@@ -178,50 +235,49 @@ def _convert_data(
     """
     lat, lon, time = get_dim_names(input_data)
     num_lat, num_lon, num_time = len(lat), len(lon), len(time)
+    dims = (lat.dims[0], lon.dims[0], time.dims[0])
+
+    min_val, max_val = VARIABLE_RANGES.get(variable, (0, 1))
 
     if variable == WIND_10M:
         rgb_data_array = np.zeros((num_lat, num_lon * num_time, 3), dtype=np.uint8)
         units = input_data["u10"].attrs.get("units", "Unknown")
+        for channel, component in enumerate(["u10", "v10"]):
+            _encode_variable(
+                input_data[component],
+                dims,
+                min_val,
+                max_val,
+                rgb_data_array[:, :, channel],
+            )
     elif variable == "aqi":
         rgb_data_array = np.zeros((num_lat, num_lon * num_time, 1), dtype=np.uint8)
         units = "fractional overall AQI"
+        pollutant_data = xr.Dataset()
+        for pollutant_type in PollutantType:
+            pollutant_name = pollutant_type.literal()
+            if pollutant_name in input_data:
+                scaled = input_data[pollutant_name].astype(np.float32)
+                scaled *= 1e9
+                pollutant_data[pollutant_name] = scaled
+        _encode_variable(
+            _calc_aqi_2D(pollutant_data),
+            dims,
+            min_val,
+            max_val,
+            rgb_data_array[:, :, 0],
+        )
     else:
         rgb_data_array = np.zeros((num_lat, num_lon * num_time, 1), dtype=np.uint8)
         units = input_data[variable].attrs.get("units", "Unknown") + " * 1e-9"
-
-    min_val, max_val = VARIABLE_RANGES.get(variable, (0, 1))
-
-    time_dim = time.dims[0]  # Extract the dimension name as a string
-
-    for tt in range(num_time):
-        start_index = tt * num_lon
-        end_index = (tt + 1) * num_lon
-        if variable == WIND_10M:
-            normalised_data_U = _normalise_data(
-                input_data["u10"].isel({time_dim: tt}), min_val, max_val
-            )
-            normalised_data_V = _normalise_data(
-                input_data["v10"].isel({time_dim: tt}), min_val, max_val
-            )
-            rgb_data_array[:, start_index:end_index, 0] = np.clip(
-                normalised_data_U * 255, 0, 255
-            )
-            rgb_data_array[:, start_index:end_index, 1] = np.clip(
-                normalised_data_V * 255, 0, 255
-            )
-        elif variable == "aqi":
-            aqi_data = _calc_aqi_2D(input_data.isel({time_dim: tt}) * 1e9)
-            normalised_data = _normalise_data(aqi_data, min_val, max_val)
-            rgb_data_array[:, start_index:end_index, 0] = np.clip(
-                normalised_data * 255, 0, 255
-            )
-        else:
-            normalised_data = _normalise_data(
-                input_data[variable].isel({time_dim: tt}) * 1e9, min_val, max_val
-            )
-            rgb_data_array[:, start_index:end_index, 0] = np.clip(
-                normalised_data * 255, 0, 255
-            )
+        _encode_variable(
+            input_data[variable],
+            dims,
+            min_val,
+            max_val,
+            rgb_data_array[:, :, 0],
+            scale=1e9,
+        )
 
     return rgb_data_array, min_val, max_val, units, num_lon, time
 
@@ -261,49 +317,137 @@ def _process_variable(
     return documents
 
 
+# Forecast data being turned into textures, read by pool workers so only variable
+# names are sent to them. Forked worker processes inherit it without pickling.
+_texture_forecast_data: ForecastData = None
+
+
+def _get_texture_variables() -> List[Tuple[str, str]]:
+    """
+    :return: (data type, texture variable name) for every data texture, in the
+    order their metadata is returned
+    """
+    return [
+        (convert_to_forecast_data_type(pollutant).value, pollutant.value)
+        for pollutant in PollutantType
+    ] + [("aqi", "aqi"), (WIND_10M, WIND_10M)]
+
+
+def _get_texture_dataset(forecast_data: ForecastData, data_type: str) -> xr.Dataset:
+    if data_type == "aqi":
+        return xr.merge(
+            [forecast_data._single_level_data, forecast_data._multi_level_data]
+        )
+    if data_type == WIND_10M:
+        return forecast_data._single_level_data
+    return forecast_data.get_data_set(ForecastDataType(data_type))
+
+
+def _convert_texture_variable(
+    data_type: str,
+) -> Tuple[np.ndarray, float, float, str, int, xr.DataArray]:
+    return _convert_data(
+        _get_texture_dataset(_texture_forecast_data, data_type), data_type
+    )
+
+
+def _create_texture_pool(workers: int, pool_type: str):
+    if pool_type == "process":
+        if "fork" in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("fork").Pool(workers)
+        logging.warning("Process pools need fork support, using threads instead")
+    elif pool_type != "thread":
+        raise ValueError(f"Unsupported texture pool type '{pool_type}'")
+    return ThreadPool(workers)
+
+
+def _create_data_textures_in_parallel(
+    forecast_data: ForecastData, forecast_date: str, workers: int, pool_type: str
+) -> List[Dict[str, str]]:
+    """
+    Convert each variable, then write every chunk of every variable, across a pool
+    of workers. Metadata is returned in the same order as the serial path.
+    """
+    global _texture_forecast_data
+    texture_variables = _get_texture_variables()
+    logging.info(
+        f"Creating data textures for {len(texture_variables)} variables "
+        f"with {workers} {pool_type} workers"
+    )
+
+    _texture_forecast_data = forecast_data
+    try:
+        with _create_texture_pool(workers, pool_type) as pool:
+            converted_variables = pool.map(
+                _convert_texture_variable,
+                [data_type for data_type, _ in texture_variables],
+            )
+
+            prepared_textures = []
+            all_write_arguments = []
+            for (_, variable_name), converted in zip(
+                texture_variables, converted_variables
+            ):
+                rgb_data_array, min_value, max_value, units, num_lon, time = converted
+                write_arguments, chunk_dict = prepare_data_textures(
+                    rgb_data_array, num_lon, time, variable_name, forecast_date
+                )
+                all_write_arguments.extend(write_arguments)
+                prepared_textures.append(
+                    (variable_name, chunk_dict, min_value, max_value, units)
+                )
+
+            output_files = pool.starmap(write_texture_to_disk, all_write_arguments)
+    finally:
+        _texture_forecast_data = None
+
+    db_metadata = []
+    first_file = 0
+    for variable_name, chunk_dict, min_value, max_value, units in prepared_textures:
+        num_chunks = len(chunk_dict)
+        db_metadata.extend(
+            create_texture_documents(
+                output_files[first_file : first_file + num_chunks],
+                chunk_dict,
+                variable_name,
+                forecast_date,
+                min_value,
+                max_value,
+                units,
+            )
+        )
+        first_file += num_chunks
+    return db_metadata
+
+
 def create_data_textures(forecast_data: ForecastData):
     """
-    Create gridded data textures from forecast data for frontend maps
+    Create gridded data textures from forecast data for frontend maps.
+    Set TEXTURE_WORKERS above 1 to spread the work over a pool, with
+    TEXTURE_POOL_TYPE choosing "thread" (default) or "process" workers.
     :param forecast_data:
     :return: List of dictionaries containing data texture metadata for database
     """
     forecast_date = datetime.fromtimestamp(
         forecast_data.get_time_value(), timezone.utc
     ).strftime("%Y-%m-%d_%H")
-    db_metadata = []
 
-    for pollutant in PollutantType:
-        logging.info(f"Creating data textures for {pollutant.name}")
-        forecast_data_type = convert_to_forecast_data_type(pollutant)
-        dataset = forecast_data._get_data_set(forecast_data_type)
+    workers = int(os.environ.get("TEXTURE_WORKERS", 1))
+    if workers > 1:
+        pool_type = os.environ.get("TEXTURE_POOL_TYPE", "thread")
+        return _create_data_textures_in_parallel(
+            forecast_data, forecast_date, workers, pool_type
+        )
+
+    db_metadata = []
+    for data_type, variable_name in _get_texture_variables():
+        logging.info(f"Creating data textures for {variable_name}")
         new_documents = _process_variable(
-            dataset,
-            forecast_data_type.value,
-            pollutant.value,
+            _get_texture_dataset(forecast_data, data_type),
+            data_type,
+            variable_name,
             forecast_date,
         )
         db_metadata.extend(new_documents)
 
-    logging.info("Creating data textures for AQI")
-    combined_data = xr.merge(
-        [forecast_data._single_level_data, forecast_data._multi_level_data]
-    )
-    new_documents = _process_variable(
-        combined_data,
-        "aqi",
-        "aqi",
-        forecast_date,
-    )
-    logging.info(new_documents)
-    db_metadata.extend(new_documents)
-
-    logging.info("Creating data textures for WINDS")
-    new_documents = _process_variable(
-        forecast_data._single_level_data,
-        WIND_10M,
-        WIND_10M,
-        forecast_date,
-    )
-    db_metadata.extend(new_documents)
-
     return db_metadata
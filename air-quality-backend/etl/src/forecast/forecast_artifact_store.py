@@ -0,0 +1,141 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+
+from .forecast_cache import DATASET_NAMES, get_netcdf_encoding, open_stored_dataset
+from .forecast_data import ForecastData
+
+ARTIFACT_DATE_FORMAT = "%Y-%m-%d_%H"
+# Bumped whenever the stored layout or conversions change
+ARTIFACT_VERSION = "1"
+
+
+def get_artifact_store_location() -> str | None:
+    """
+    Directory of the forecast artifact store shared by the forecast and in situ
+    ETL jobs, set with FORECAST_ARTIFACT_STORE. Disabled when it is not set.
+    """
+    return os.environ.get("FORECAST_ARTIFACT_STORE")
+
+
+def get_artifact_directory(
+    store_location: str, base_datetime: datetime, request_bodies: list[dict]
+) -> str:
+    """
+    Directory of the artifact for a forecast base time, keyed by the variables
+    and levels requested. Lead times and area are not part of the key, so a
+    stored global forecast serves any request for the same or fewer steps.
+    """
+    variable_set = [
+        {
+            name: value
+            for name, value in request_body.items()
+            if name in ["variable", "model_level"]
+        }
+        for request_body in request_bodies
+    ]
+    content = json.dumps([ARTIFACT_VERSION, variable_set], sort_keys=True)
+    variable_key = hashlib.sha256(content.encode()).hexdigest()[:16]
+    return os.path.join(
+        store_location, base_datetime.strftime(ARTIFACT_DATE_FORMAT), variable_key
+    )
+
+
+@contextmanager
+def lock_artifact(artifact_directory: str):
+    """
+    Hold an exclusive file lock on an artifact, so only one job at a time reads,
+    fetches or publishes it. A job waiting on the lock then finds the artifact
+    the other job published instead of downloading it again.
+    """
+    os.makedirs(os.path.dirname(artifact_directory), exist_ok=True)
+    with open(f"{artifact_directory}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_artifact(
+    artifact_directory: str, no_of_forecast_times: int, area: list[float] = None
+) -> ForecastData | None:
+    """
+    Open a published artifact, taking the first no_of_forecast_times steps
+    :param artifact_directory:
+    :param no_of_forecast_times:
+    :param area: optional [north, west, south, east] area to crop the data to
+    :return: the forecast data, or None if there is no artifact with enough steps
+    """
+    files = [os.path.join(artifact_directory, f"{name}.nc") for name in DATASET_NAMES]
+    if not all(os.path.exists(file) for file in files):
+        logging.info(f"No forecast artifact in {artifact_directory}")
+        return None
+
+    datasets = [open_stored_dataset(file) for file in files]
+    stored_steps = min(dataset.sizes["step"] for dataset in datasets)
+    if stored_steps < no_of_forecast_times:
+        logging.info(
+            f"Forecast artifact in {artifact_directory} has {stored_steps} steps, "
+            f"{no_of_forecast_times} are needed"
+        )
+        for dataset in datasets:
+            dataset.close()
+        return None
+
+    logging.info(f"Using forecast artifact in {artifact_directory}")
+    return ForecastData(
+        *[dataset.isel(step=slice(0, no_of_forecast_times)) for dataset in datasets],
+        area=area,
+        converted=True,
+    )
+
+
+def publish_artifact(artifact_directory: str, forecast_data: ForecastData):
+    """
+    Write converted global forecast data to a temporary directory, then rename it
+    into place so other jobs only ever see a complete artifact. Must be called
+    while holding lock_artifact.
+    """
+    temporary_directory = f"{artifact_directory}.tmp-{os.getpid()}"
+    os.makedirs(temporary_directory, exist_ok=True)
+    datasets = [forecast_data._single_level_data, forecast_data._multi_level_data]
+    for name, dataset in zip(DATASET_NAMES, datasets):
+        dataset.to_netcdf(
+            os.path.join(temporary_directory, f"{name}.nc"),
+            engine="netcdf4",
+            encoding=get_netcdf_encoding(dataset),
+        )
+
+    replaced_directory = None
+    if os.path.exists(artifact_directory):
+        replaced_directory = f"{artifact_directory}.old-{os.getpid()}"
+        os.rename(artifact_directory, replaced_directory)
+    os.rename(temporary_directory, artifact_directory)
+    if replaced_directory is not None:
+        shutil.rmtree(replaced_directory)
+    logging.info(f"Published forecast artifact to {artifact_directory}")
+
+
+def delete_artifacts_before(store_location: str, archive_date: datetime):
+    """
+    Delete the artifacts of every forecast base time before archive_date
+    """
+    if not os.path.exists(store_location):
+        return
+
+    deleted = 0
+    for folder in os.listdir(store_location):
+        try:
+            base_datetime = datetime.strptime(folder, ARTIFACT_DATE_FORMAT)
+        except ValueError:
+            continue
+        if base_datetime < archive_date:
+            shutil.rmtree(os.path.join(store_location, folder))
+            deleted += 1
+    logging.info(f"Deleted {deleted} forecast artifact folders from {store_location}")
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+from threading import Lock
+
+import xarray as xr
+
+from .forecast_data import ForecastData
+
+# Bumped whenever the stored layout or conversions change, so old entries miss
+CACHE_VERSION = "1"
+CACHE_FILE_SUFFIX = ".nc"
+TEMPORARY_FILE_SUFFIX = ".tmp"
+DATASET_NAMES = ["single_level", "multi_level"]
+
+
+class ForecastCacheMetrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record(self, hits: int = 0, misses: int = 0, evictions: int = 0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+    def get_metrics(self) -> dict[str, int]:
+        """Get cache hits, misses and evicted entries since the process started"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+forecast_cache_metrics = ForecastCacheMetrics()
+
+
+def get_cache_location() -> str | None:
+    """
+    Directory of the forecast cache, set with FORECAST_CACHE. The cache is
+    disabled when it is not set.
+    """
+    return os.environ.get("FORECAST_CACHE")
+
+
+def get_cache_key(request_bodies: list[dict]) -> str:
+    """
+    :return: hash of the CAMS requests, identifying the forecast data they return
+    """
+    content = json.dumps([CACHE_VERSION, request_bodies], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _get_cache_files(cache_location: str, key: str) -> list[str]:
+    return [
+        os.path.join(cache_location, f"{key}_{name}{CACHE_FILE_SUFFIX}")
+        for name in DATASET_NAMES
+    ]
+
+
+def read_forecast_data(cache_location: str, key: str) -> ForecastData | None:
+    """
+    Open cached forecast data, with units and longitudes already converted.
+    Variables are read from disk as they are used, or loaded by ForecastData.
+    :return: the forecast data, or None if it is not in the cache
+    """
+    files = _get_cache_files(cache_location, key)
+    if not all(os.path.exists(file) for file in files):
+        forecast_cache_metrics.record(misses=1)
+        logging.info(f"Forecast cache miss for {key}, {_format_metrics()}")
+        return None
+
+    forecast_cache_metrics.record(hits=1)
+    logging.info(f"Forecast cache hit for {key}, {_format_metrics()}")
+    return _open_forecast_data(files)
+
+
+def _open_forecast_data(files: list[str]) -> ForecastData:
+    # Reading marks the entry as recently used for eviction
+    for file in files:
+        os.utime(file)
+    datasets = [open_stored_dataset(file) for file in files]
+    return ForecastData(*datasets, converted=True)
+
+
+def open_stored_dataset(file: str) -> xr.Dataset:
+    """
+    Open forecast data stored as NetCDF. Times are not decoded, so time and
+    valid_time stay in seconds since the epoch and step in hours, as they are
+    when the GRIB files are read.
+    """
+    return xr.open_dataset(
+        file, engine="netcdf4", decode_times=False, decode_timedelta=False
+    )
+
+
+def write_forecast_data(
+    cache_location: str, key: str, forecast_data: ForecastData
+) -> ForecastData:
+    """
+    Store converted forecast data, chunked by step, then evict the least
+    recently used entries above FORECAST_CACHE_MAX_MB (default 10240)
+    :return: the forecast data read back from the cache, which no longer depends
+    on the files forecast_data was read from
+    """
+    os.makedirs(cache_location, exist_ok=True)
+    datasets = [forecast_data._single_level_data, forecast_data._multi_level_data]
+    files = _get_cache_files(cache_location, key)
+    for dataset, file in zip(datasets, files):
+        # Written to a temporary file first so readers never see a partial entry
+        temporary_file = f"{file}.{os.getpid()}{TEMPORARY_FILE_SUFFIX}"
+        try:
+            dataset.to_netcdf(
+                temporary_file, engine="netcdf4", encoding=get_netcdf_encoding(dataset)
+            )
+            os.replace(temporary_file, file)
+        finally:
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+    logging.info(f"Stored forecast data in cache as {key}")
+
+    max_bytes = float(os.environ.get("FORECAST_CACHE_MAX_MB", 10240)) * 1024**2
+    evict_least_recently_used(cache_location, max_bytes, keep=key)
+    return _open_forecast_data(files)
+
+
+def get_netcdf_encoding(dataset: xr.Dataset) -> dict:
+    """
+    NetCDF4 encoding storing each step of a variable as its own chunk, so single
+    steps can be read without reading the whole variable
+    """
+    encoding = {}
+    for name, variable in dataset.data_vars.items():
+        if "step" in variable.dims:
+            chunk_sizes = [
+                1 if dim == "step" else variable.sizes[dim] for dim in variable.dims
+            ]
+            encoding[name] = {"chunksizes": chunk_sizes}
+    return encoding
+
+
+def evict_least_recently_used(cache_location: str, max_bytes: float, keep: str = None):
+    """
+    Delete whole cache entries, least recently used first, until the cache fits
+    within max_bytes
+    :param cache_location:
+    :param max_bytes:
+    :param keep: key of an entry never to evict, such as the one just written
+    """
+    entries = {}
+    temporary_bytes = 0
+    for file_name in os.listdir(cache_location):
+        if file_name.endswith(TEMPORARY_FILE_SUFFIX):
+            file = os.path.join(cache_location, file_name)
+            if _is_abandoned(file_name):
+                logging.info(f"Removing abandoned forecast cache file {file_name}")
+                os.remove(file)
+            else:
+                temporary_bytes += os.stat(file).st_size
+            continue
+        if not file_name.endswith(CACHE_FILE_SUFFIX):
+            continue
+        key = file_name.split("_", 1)[0]
+        stat = os.stat(os.path.join(cache_location, file_name))
+        size, last_used = entries.get(key, (0, 0))
+        entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+    # Entries being written elsewhere count towards the limit
+    total_bytes = temporary_bytes + sum(size for size, _ in entries.values())
+    evicted = 0
+    for key, (size, _) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+        if total_bytes <= max_bytes:
+            break
+        if key == keep:
+            continue
+        for file in _get_cache_files(cache_location, key):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        total_bytes -= size
+        evicted += 1
+        logging.info(f"Evicted {key} from the forecast cache")
+
+    if evicted > 0:
+        forecast_cache_metrics.record(evictions=evicted)
+
+
+def _is_abandoned(temporary_file_name: str) -> bool:
+    """
+    :return: whether the process writing a temporary file has stopped, e.g. after
+    it was killed part way through a write
+    """
+    try:
+        pid = int(
+            temporary_file_name.removesuffix(TEMPORARY_FILE_SUFFIX).split(".")[-1]
+        )
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _format_metrics() -> str:
+    return ", ".join(
+        f"{name}: {value}"
+        for name, value in forecast_cache_metrics.get_metrics().items()
+    )
@@ -1,8 +1,24 @@
 import cdsapi
 from datetime import datetime
 import logging
+from multiprocessing.pool import ThreadPool
 import os
+from threading import BoundedSemaphore, Lock
+import weakref
 import xarray as xr
+from .forecast_artifact_store import (
+    get_artifact_directory,
+    get_artifact_store_location,
+    lock_artifact,
+    publish_artifact,
+    read_artifact,
+)
+from .forecast_cache import (
+    get_cache_key,
+    get_cache_location,
+    read_forecast_data,
+    write_forecast_data,
+)
 from .forecast_data import ForecastData
 from .forecast_date_retriever import align_to_cams_publish_time
 
@@ -10,6 +26,9 @@ CAMS_FORECAST_INTERVAL_HOURS = 3
 CAMS_UPDATE_INTERVAL_HOURS = 12
 CAMS_INTERVALS_PER_5_DAY_FORECAST = 41
 
+_cams_request_slots = None
+_cams_request_slots_lock = Lock()
+
 
 class CamsRequestDetails:
 
@@ -17,9 +36,12 @@ class CamsRequestDetails:
         self,
         base_forecast_datetime: datetime,
         no_of_forecast_times: int = CAMS_INTERVALS_PER_5_DAY_FORECAST,
+        area: list[float] = None,
     ):
         self.base_forecast_datetime = base_forecast_datetime
         self.no_of_forecast_times = no_of_forecast_times
+        # [north, west, south, east], or None for the global field
+        self.area = area
 
 
 def __get_base_request_body(request_details: CamsRequestDetails) -> dict:
@@ -32,13 +54,16 @@ def __get_base_request_body(request_details: CamsRequestDetails) -> dict:
     date_str = request_details.base_forecast_datetime.strftime("%Y-%m-%d")
     time_str = request_details.base_forecast_datetime.strftime("%H:%M")
 
-    return {
+    request_body = {
         "date": f"{date_str}/{date_str}",
         "type": "forecast",
         "format": "grib",
         "time": f"{time_str}",
         "leadtime_hour": leadtime_hour,
     }
+    if request_details.area is not None:
+        request_body["area"] = request_details.area
+    return request_body
 
 
 def get_single_level_request_body(request_details: CamsRequestDetails) -> dict:
@@ -65,26 +90,81 @@ def get_multi_level_request_body(request_details: CamsRequestDetails) -> dict:
     return base_request
 
 
-def fetch_cams_data(request_body, file_name) -> xr.Dataset:
-    c = cdsapi.Client()
-    logging.info(f"Loading data from CAMS to file {file_name}")
-    if not os.path.exists(file_name):
+def _get_cams_request_slots() -> BoundedSemaphore:
+    """
+    Limit on CAMS retrievals in flight across the process, configured with
+    CAMS_MAX_CONCURRENT_REQUESTS (default 4). Created on first use so values from
+    .env files loaded by the scripts are honoured.
+    """
+    global _cams_request_slots
+    with _cams_request_slots_lock:
+        if _cams_request_slots is None:
+            max_requests = int(os.environ.get("CAMS_MAX_CONCURRENT_REQUESTS", 4))
+            _cams_request_slots = BoundedSemaphore(max(max_requests, 1))
+        return _cams_request_slots
+
+
+def retrieve_cams_file(request_body, file_name):
+    if os.path.exists(file_name):
+        logging.info(f"Using existing CAMS file {file_name}")
+        return
+    with _get_cams_request_slots():
+        logging.info(f"Loading data from CAMS to file {file_name}")
+        c = cdsapi.Client()
         c.retrieve(
             "cams-global-atmospheric-composition-forecasts", request_body, file_name
         )
+
+
+def open_cams_file(file_name) -> xr.Dataset:
     return xr.open_dataset(
         file_name, decode_times=False, engine="cfgrib", backend_kwargs={"indexpath": ""}
     )
 
 
+def fetch_cams_data(request_body, file_name) -> xr.Dataset:
+    retrieve_cams_file(request_body, file_name)
+    return open_cams_file(file_name)
+
+
+def _retrieve_cams_files(task_params: list[tuple[dict, str]]):
+    """
+    Retrieve every request concurrently, as CDS queues each one separately.
+    All requests are allowed to finish before any failure is raised.
+    """
+    with ThreadPool(processes=len(task_params)) as pool:
+        pending = [
+            (file_name, pool.apply_async(retrieve_cams_file, (request_body, file_name)))
+            for request_body, file_name in task_params
+        ]
+        failures = []
+        for file_name, result in pending:
+            try:
+                result.get()
+            except Exception as e:
+                logging.error(f"Failed to retrieve CAMS file {file_name}: {e}")
+                failures.append(e)
+
+    if len(failures) > 0:
+        raise failures[0]
+
+
 def fetch_forecast_data(
     base_datetime: datetime = datetime.utcnow(),
     no_of_forecast_times: int = CAMS_INTERVALS_PER_5_DAY_FORECAST,
+    area: list[float] = None,
 ) -> ForecastData:
-
+    """
+    :param base_datetime:
+    :param no_of_forecast_times:
+    :param area: optional [north, west, south, east] area to request instead of
+    the global field
+    """
     base_datetime = align_to_cams_publish_time(base_datetime)
-    request_details = CamsRequestDetails(base_datetime, no_of_forecast_times)
+    request_details = CamsRequestDetails(base_datetime, no_of_forecast_times, area)
     file_ident = f"{no_of_forecast_times}_from_{base_datetime.strftime('%Y-%m-%d_%H')}"
+    if area is not None:
+        file_ident += "_area_" + "_".join(f"{bound:g}" for bound in area)
 
     task_params = [
         (
@@ -96,15 +176,73 @@ def fetch_forecast_data(
             f"multi_level_{file_ident}.grib",
         ),
     ]
+
+    store_location = get_artifact_store_location()
+    if store_location is None:
+        return _fetch_forecast_data(task_params, area)
+
+    request_bodies = [request_body for request_body, _ in task_params]
+    artifact_directory = get_artifact_directory(
+        store_location, base_datetime, request_bodies
+    )
+    with lock_artifact(artifact_directory):
+        forecast_data = read_artifact(artifact_directory, no_of_forecast_times, area)
+        if forecast_data is None and area is None:
+            forecast_data = _fetch_forecast_data(task_params, area)
+            try:
+                publish_artifact(artifact_directory, forecast_data)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unable to publish forecast artifact: {e}")
+    if forecast_data is None:
+        # Area requests are small, so are fetched without holding the lock
+        forecast_data = _fetch_forecast_data(task_params, area)
+    return forecast_data
+
+
+def _fetch_forecast_data(
+    task_params: list[tuple[dict, str]], area: list[float] = None
+) -> ForecastData:
+    cache_location = get_cache_location()
+    if cache_location is not None:
+        cache_key = get_cache_key([request_body for request_body, _ in task_params])
+        cached_forecast_data = read_forecast_data(cache_location, cache_key)
+        if cached_forecast_data is not None:
+            return cached_forecast_data
+
+    keep_files = os.environ.get("STORE_GRIB_FILES", "False") == "True"
     try:
-        results = [fetch_cams_data(*params) for params in task_params]
-        return ForecastData(*results)
+        _retrieve_cams_files(task_params)
+        results = [open_cams_file(file) for _, file in task_params]
+        forecast_data = ForecastData(*results, area=area)
+        read_from_files = True
+        if cache_location is not None:
+            try:
+                forecast_data = write_forecast_data(
+                    cache_location, cache_key, forecast_data
+                )
+                read_from_files = False
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unable to store forecast data in cache: {e}")
+        if not keep_files and read_from_files and forecast_data.is_lazy():
+            # cfgrib opens the files again on every read of lazy data, so they are
+            # removed once the data is released rather than now
+            files = [file for _, file in task_params]
+            weakref.finalize(forecast_data, remove_files, files)
+            keep_files = True
+        return forecast_data
     finally:
-        keep_files = os.environ.get("STORE_GRIB_FILES", "False") == "True"
         if not keep_files:
-            [remove_file(file) for _, file in task_params]
+            remove_files([file for _, file in task_params])
+
+
+def remove_files(files: list[str]):
+    for file in files:
+        remove_file(file)
 
 
 def remove_file(file: str):
     logging.info(f"Removing file {file}")
-    os.remove(file)
+    try:
+        os.remove(file)
+    except FileNotFoundError:
+        logging.info(f"File {file} was never retrieved")
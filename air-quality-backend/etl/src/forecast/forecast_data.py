@@ -1,11 +1,15 @@
-from decimal import Decimal
 import logging
+import os
 from enum import Enum
 
+import numpy as np
+from numpy.typing import ArrayLike
 import xarray as xr
 from shared.src.database.locations import AirQualityLocation
 from shared.src.aqi.pollutant_type import PollutantType
 from shared.src.database.in_situ import InSituMeasurement
+from shared.src.xarray_utils import get_chunk_slices
+from .interpolation_weights import get_interpolation_weights
 
 
 class ForecastDataType(Enum):
@@ -18,12 +22,33 @@ class ForecastDataType(Enum):
     TEMPERATURE = "t"
 
 
+# Converted longitudes are rounded to this many decimal places, so grid values such
+# as 359.6 become -0.4 rather than -0.39999999999997726
+LONGITUDE_DECIMAL_PLACES = 10
+
+
+def convert_east_only_longitudes_to_east_west(longitudes: ArrayLike) -> np.ndarray:
+    """
+    Array equivalent of convert_east_only_longitude_to_east_west. Gives the same
+    result as decimal subtraction for longitudes with up to 10 decimal places
+    :param longitudes:
+    :return: float longitudes in the range -180 - 180
+    """
+    longitudes = np.asarray(longitudes, dtype=float)
+    east_only = (180 < longitudes) & (longitudes <= 360)
+    return np.where(
+        east_only,
+        np.round(longitudes - 360, LONGITUDE_DECIMAL_PLACES),
+        longitudes,
+    )
+
+
 def convert_east_only_longitude_to_east_west(longitude_value: float) -> float:
     """
     Convert longitude value from range of 0 - 360 to -180 - 180
     """
     if 180 < longitude_value <= 360:
-        return float(Decimal(str(longitude_value)) - Decimal("360"))
+        return float(convert_east_only_longitudes_to_east_west(longitude_value))
     return longitude_value
 
 
@@ -60,14 +85,7 @@ def convert_mmr_to_mass_concentration(
 
 def convert_longitude(dataset: xr.Dataset) -> xr.Dataset:
     converted_data = dataset.assign_coords(
-        longitude=list(
-            map(
-                lambda lon: convert_east_only_longitude_to_east_west(
-                    lon.values.flat[0]
-                ),
-                dataset.longitude,
-            )
-        )
+        longitude=convert_east_only_longitudes_to_east_west(dataset.longitude.values)
     )
     converted_data = converted_data.sortby("longitude")
     converted_data["longitude"].attrs["units"] = "degrees_east"
@@ -102,129 +120,304 @@ def convert_to_forecast_data_type(pollutant_type: PollutantType) -> ForecastData
             )
 
 
-class ForecastData:
-    def __init__(self, single_level_data: xr.Dataset, multi_level_data: xr.Dataset):
-        single, multi = convert_mmr_to_mass_concentration(
-            single_level_data, multi_level_data
+def get_area_for_locations(
+    locations: list[AirQualityLocation], margin: float
+) -> list[float]:
+    """
+    Bounding box around the locations, in the [north, west, south, east] order
+    used for the area of CAMS requests
+    :param locations:
+    :param margin: degrees added on every side of the locations
+    """
+    latitudes = [location["latitude"] for location in locations]
+    longitudes = [location["longitude"] for location in locations]
+    return [
+        min(max(latitudes) + margin, 90.0),
+        max(min(longitudes) - margin, -180.0),
+        max(min(latitudes) - margin, -90.0),
+        min(max(longitudes) + margin, 180.0),
+    ]
+
+
+def get_areas_for_locations(
+    locations: list[AirQualityLocation],
+    margin: float,
+    max_areas: int,
+    min_saving: float = 0.005,
+) -> list[list[float]]:
+    """
+    Bounding boxes around groups of nearby locations, so locations spread over the
+    globe can be requested as a few small areas rather than one box covering most
+    of the grid. Starting from a box around each location, the two boxes whose
+    merged box adds the least area are merged, until there are at most max_areas
+    boxes and every merge would add more than min_saving of the grid.
+    :param locations:
+    :param margin: degrees added on every side of the locations
+    :param max_areas: most boxes to return
+    :param min_saving: fraction of the grid a separate box must save
+    :return: [north, west, south, east] areas
+    """
+    areas = np.array(
+        [get_area_for_locations([location], margin) for location in locations]
+    ).reshape(-1, 4)
+    min_growth = min_saving * 180.0 * 360.0
+    while len(areas) > 1:
+        north = np.maximum.outer(areas[:, 0], areas[:, 0])
+        west = np.minimum.outer(areas[:, 1], areas[:, 1])
+        south = np.minimum.outer(areas[:, 2], areas[:, 2])
+        east = np.maximum.outer(areas[:, 3], areas[:, 3])
+        sizes = (areas[:, 0] - areas[:, 2]) * (areas[:, 3] - areas[:, 1])
+        growth = (north - south) * (east - west) - np.add.outer(sizes, sizes)
+        np.fill_diagonal(growth, np.inf)
+        i, j = np.unravel_index(np.argmin(growth), growth.shape)
+        if len(areas) <= max_areas and growth[i, j] > min_growth:
+            break
+        merged = [north[i, j], west[i, j], south[i, j], east[i, j]]
+        areas = np.vstack([np.delete(areas, [i, j], axis=0), merged])
+    return areas.tolist()
+
+
+def crop_to_area(dataset: xr.Dataset, area: list[float]) -> xr.Dataset:
+    """
+    Select the part of the grid within a [north, west, south, east] area, without
+    loading any data. Longitudes must be in the range -180 - 180.
+    """
+    north, west, south, east = area
+    latitudes = dataset["latitude"].values
+    if len(latitudes) > 1 and latitudes[0] > latitudes[-1]:
+        latitude_slice = slice(north, south)
+    else:
+        latitude_slice = slice(south, north)
+    return dataset.sel(latitude=latitude_slice, longitude=slice(west, east))
+
+
+def _chunk_steps(dataset: xr.Dataset, step_chunk_size: int) -> xr.Dataset:
+    if "step" not in dataset.dims:
+        return dataset
+    return dataset.chunk({"step": step_chunk_size})
+
+
+def get_step_chunk_size(datasets: list[xr.Dataset]) -> int | None:
+    """
+    Steps per dask chunk when FORECAST_DATA_LOADING is "lazy", sized so a chunk
+    of every variable fits within FORECAST_MEMORY_LIMIT_MB (default 1024)
+    :param datasets:
+    :return: steps per chunk, or None when data is loaded eagerly (the default)
+    """
+    loading = os.environ.get("FORECAST_DATA_LOADING", "eager")
+    if loading == "eager":
+        return None
+    if loading != "lazy":
+        raise ValueError(f"Unsupported forecast data loading '{loading}'")
+
+    limit_bytes = float(os.environ.get("FORECAST_MEMORY_LIMIT_MB", 1024)) * 1024**2
+    bytes_per_step = sum(
+        variable.nbytes / variable.sizes["step"]
+        for dataset in datasets
+        for variable in dataset.data_vars.values()
+        if "step" in variable.dims
+    )
+    if bytes_per_step == 0:
+        return 1
+    return max(1, int(limit_bytes // bytes_per_step))
+
+
+def pair_measurements_with_values(
+    in_situ_measurements: list[InSituMeasurement],
+    values_by_data_type: dict[ForecastDataType, np.ndarray],
+) -> list[tuple[InSituMeasurement, dict[ForecastDataType:float]]]:
+    """
+    :param in_situ_measurements:
+    :param values_by_data_type: values aligned with in_situ_measurements
+    :return: each measurement with its value for every data type
+    """
+    values_by_data_type = {
+        forecast_data_type: values.tolist()
+        for forecast_data_type, values in values_by_data_type.items()
+    }
+    return [
+        (
+            in_situ_measurement,
+            {
+                forecast_data_type: values[i]
+                for forecast_data_type, values in values_by_data_type.items()
+            },
         )
-        self._single_level_data = convert_longitude(single)
-        self._multi_level_data = convert_longitude(multi)
-        # Eager load datasets for quicker access
-        self._single_level_data.load()
-        self._multi_level_data.load()
+        for i, in_situ_measurement in enumerate(in_situ_measurements)
+    ]
+
+
+class ForecastData:
+    def __init__(
+        self,
+        single_level_data: xr.Dataset,
+        multi_level_data: xr.Dataset,
+        area: list[float] = None,
+        converted: bool = False,
+    ):
+        """
+        :param single_level_data:
+        :param multi_level_data:
+        :param area: optional [north, west, south, east] area to crop the data to
+        before it is loaded
+        :param converted: whether units and longitudes are already converted, as
+        for data read back from the forecast cache
+        """
+        single, multi = single_level_data, multi_level_data
+        if not converted:
+            single = convert_longitude(single)
+            multi = convert_longitude(multi)
+        if area is not None:
+            single = crop_to_area(single, area)
+            multi = crop_to_area(multi, area)
+        step_chunk_size = get_step_chunk_size([single, multi])
+        if step_chunk_size is not None:
+            # Chunked before the unit conversion so it stays lazy until use
+            logging.info(f"Forecast data is lazy, with {step_chunk_size} steps a chunk")
+            single = _chunk_steps(single, step_chunk_size)
+            multi = _chunk_steps(multi, step_chunk_size)
+        if not converted:
+            single, multi = convert_mmr_to_mass_concentration(single, multi)
+        self._single_level_data = single
+        self._multi_level_data = multi
+        self._lazy = step_chunk_size is not None
+        if step_chunk_size is None:
+            # Eager load datasets for quicker access
+            self._single_level_data.load()
+            self._multi_level_data.load()
 
     _cached_pressure = None
     _cached_temperature = None
 
-    def _get_data_set(self, forecast_data_type: ForecastDataType) -> xr.Dataset:
+    def is_lazy(self) -> bool:
+        """Whether variables are read from their source files as they are used"""
+        return self._lazy
+
+    def get_data_set(self, forecast_data_type: ForecastDataType) -> xr.Dataset:
+        """The single or multi level dataset holding a data type"""
         if is_single_level(forecast_data_type):
             return self._single_level_data
         else:
             return self._multi_level_data
 
-    def enrich_in_situ_measurements(
+    def get_values_for_measurements(
         self,
         in_situ_measurements: list[InSituMeasurement],
         required_data: list[ForecastDataType],
-    ) -> list[tuple[InSituMeasurement, dict[ForecastDataType:float]]]:
-        if len(in_situ_measurements) == 0:
-            return []
+    ) -> dict[ForecastDataType, np.ndarray]:
+        """
+        Interpolate forecast data to the location and time of each measurement,
+        using one pointwise interpolation per data type
+        :param in_situ_measurements:
+        :param required_data:
+        :return: values for each data type, aligned with in_situ_measurements
+        """
+        latitudes = xr.DataArray(
+            [m["location"]["coordinates"][1] for m in in_situ_measurements],
+            dims="points",
+        )
+        longitudes = xr.DataArray(
+            [m["location"]["coordinates"][0] for m in in_situ_measurements],
+            dims="points",
+        )
+        valid_times = xr.DataArray(
+            [m["measurement_date"].timestamp() for m in in_situ_measurements],
+            dims="points",
+        )
 
-        latitudes = []
-        longitudes = []
-        valid_times = []
-        for in_situ_measurement in in_situ_measurements:
-            longitude = in_situ_measurement["location"]["coordinates"][0]
-            latitude = in_situ_measurement["location"]["coordinates"][1]
-            valid_time = in_situ_measurement["measurement_date"].timestamp()
-
-            if latitude not in latitudes:
-                latitudes.append(latitude)
-            if longitude not in longitudes:
-                longitudes.append(longitude)
-            if valid_time not in valid_times:
-                valid_times.append(valid_time)
-
-        interpolated_data_by_data_type = {}
+        values_by_data_type = {}
         for required_datum in required_data:
-            dataset = self._get_data_set(required_datum).swap_dims(
+            dataset = self.get_data_set(required_datum).swap_dims(
                 {"step": "valid_time"}
             )
-
             interpolated_data = dataset[required_datum.value].interp(
-                latitude=xr.DataArray(latitudes, dims="latitude"),
-                longitude=xr.DataArray(longitudes, dims="longitude"),
-                valid_time=xr.DataArray(valid_times, dims="valid_time"),
+                latitude=latitudes,
+                longitude=longitudes,
+                valid_time=valid_times,
                 method="linear",
             )
-            (
-                interpolated_data.set_index(valid_time=["valid_time"])
-                .set_index(latitude=["latitude"])
-                .set_index(longitude=["longitude"])
-            )
+            values_by_data_type[required_datum] = interpolated_data.values
+        return values_by_data_type
+
+    def enrich_in_situ_measurements(
+        self,
+        in_situ_measurements: list[InSituMeasurement],
+        required_data: list[ForecastDataType],
+    ) -> list[tuple[InSituMeasurement, dict[ForecastDataType:float]]]:
+        if len(in_situ_measurements) == 0:
+            return []
 
-            interpolated_data_by_data_type[required_datum] = interpolated_data
-
-        forecast_tuples = []
-        for in_situ_measurement in in_situ_measurements:
-            valid_time = in_situ_measurement["measurement_date"].timestamp()
-            longitude = in_situ_measurement["location"]["coordinates"][0]
-            latitude = in_situ_measurement["location"]["coordinates"][1]
-            forecast_data = {}
-
-            for (
-                forecast_data_type,
-                interpolated_data,
-            ) in interpolated_data_by_data_type.items():
-                forecast_value = interpolated_data.sel(
-                    valid_time=valid_time, longitude=longitude, latitude=latitude
-                ).item()
-                forecast_data[forecast_data_type] = forecast_value
-            forecast_tuples.append((in_situ_measurement, forecast_data))
-        return forecast_tuples
+        return pair_measurements_with_values(
+            in_situ_measurements,
+            self.get_values_for_measurements(in_situ_measurements, required_data),
+        )
 
-    def get_pollutant_data_for_locations(
+    def get_pollutant_values_for_locations(
         self, locations: list[AirQualityLocation], pollutant_types: list[PollutantType]
-    ) -> list[tuple[AirQualityLocation, dict[PollutantType : list[float]]]]:
+    ) -> np.ndarray:
         """
         Get forecasted air pollutant values for given locations
         and pollutants using bi-linear interpolation
         :param locations:
         :param pollutant_types:
-        :return: values for pollutant at lat/long
+        :return: values with shape (location, pollutant, step)
         """
-        latitudes = []
-        longitudes = []
-        for location in locations:
-            latitudes.append(location["latitude"])
-            longitudes.append(location["longitude"])
+        if len(locations) == 0:
+            return np.empty((0, len(pollutant_types), self.get_step_values().size))
+
+        latitudes = np.array([location["latitude"] for location in locations])
+        longitudes = np.array([location["longitude"] for location in locations])
 
-        interpolated_data_by_pollutant_type = {}
+        values_by_pollutant_type = []
         for pollutant_type in pollutant_types:
             forecast_data_type = convert_to_forecast_data_type(pollutant_type)
-            dataset = self._get_data_set(forecast_data_type)
-            # Interpolation is called n times, where n = len(pollutant_types),
-            # irrespective of len(locations)
-            interpolated_data = dataset[forecast_data_type.value].interp(
-                latitude=xr.DataArray(latitudes, dims="points"),
-                longitude=xr.DataArray(longitudes, dims="points"),
-                method="linear",
+            dataset = self.get_data_set(forecast_data_type)
+            # Weights depend only on the grid and locations, so are calculated
+            # once and shared by every pollutant and step
+            weights = get_interpolation_weights(
+                dataset["latitude"].values,
+                dataset["longitude"].values,
+                latitudes,
+                longitudes,
+            )
+            data = dataset[forecast_data_type.value].transpose(
+                ..., "latitude", "longitude"
             )
-            interpolated_data_by_pollutant_type[pollutant_type] = interpolated_data
-
-        location_pollutant_tuples = []
-        for i, location in enumerate(locations):
-            location_pollutant_data = {}
-            for (
-                pollutant_type,
-                interpolated_data,
-            ) in interpolated_data_by_pollutant_type.items():
-                pollutant_forecast_values = interpolated_data.isel(points=i)
-                location_pollutant_data[pollutant_type] = (
-                    pollutant_forecast_values.values.tolist()
+            if "step" in data.dims:
+                # Lazy data is computed one chunk of steps at a time
+                values = np.concatenate(
+                    [
+                        weights.apply(data.isel(step=step_slice).values)
+                        for step_slice in get_chunk_slices(data, "step")
+                    ],
+                    axis=1 + data.dims.index("step"),
                 )
-            location_pollutant_tuples.append((location, location_pollutant_data))
-        return location_pollutant_tuples
+            else:
+                values = weights.apply(data.values)
+            values_by_pollutant_type.append(values.reshape(len(locations), -1))
+        return np.stack(values_by_pollutant_type, axis=1)
+
+    def get_pollutant_data_for_locations(
+        self, locations: list[AirQualityLocation], pollutant_types: list[PollutantType]
+    ) -> list[tuple[AirQualityLocation, dict[PollutantType : list[float]]]]:
+        """
+        Get forecasted air pollutant values for given locations
+        and pollutants using bi-linear interpolation
+        :param locations:
+        :param pollutant_types:
+        :return: values for pollutant at lat/long
+        """
+        values = self.get_pollutant_values_for_locations(locations, pollutant_types)
+        return [
+            (
+                location,
+                {
+                    pollutant_type: values[i, j].tolist()
+                    for j, pollutant_type in enumerate(pollutant_types)
+                },
+            )
+            for i, location in enumerate(locations)
+        ]
 
     def get_step_values(self):
         return self._single_level_data["step"].values
@@ -234,3 +427,66 @@ class ForecastData:
 
     def get_time_value(self) -> int:
         return int(self._single_level_data["time"].values)
+
+
+class RegionalForecastData:
+    """
+    Forecast data requested as a separate area around each group of locations,
+    used to enrich in situ measurements taken in any of the areas
+    """
+
+    def __init__(self, forecast_data_by_area: list[tuple[list[float], ForecastData]]):
+        """
+        :param forecast_data_by_area: [north, west, south, east] areas, each with
+        the forecast data requested for it
+        """
+        self.forecast_data_by_area = forecast_data_by_area
+
+    def get_area_indices(
+        self, in_situ_measurements: list[InSituMeasurement]
+    ) -> np.ndarray:
+        """
+        :return: index of the area each measurement is in, or the nearest area for
+        a measurement outside them all
+        """
+        areas = np.array([area for area, _ in self.forecast_data_by_area])
+        latitudes = np.array(
+            [m["location"]["coordinates"][1] for m in in_situ_measurements]
+        )
+        longitudes = np.array(
+            [m["location"]["coordinates"][0] for m in in_situ_measurements]
+        )
+        latitude_distances = np.maximum(
+            np.maximum(areas[:, 2] - latitudes[:, None], 0),
+            latitudes[:, None] - areas[:, 0],
+        )
+        longitude_distances = np.maximum(
+            np.maximum(areas[:, 1] - longitudes[:, None], 0),
+            longitudes[:, None] - areas[:, 3],
+        )
+        return np.argmin(latitude_distances**2 + longitude_distances**2, axis=1)
+
+    def enrich_in_situ_measurements(
+        self,
+        in_situ_measurements: list[InSituMeasurement],
+        required_data: list[ForecastDataType],
+    ) -> list[tuple[InSituMeasurement, dict[ForecastDataType:float]]]:
+        if len(in_situ_measurements) == 0:
+            return []
+
+        area_indices = self.get_area_indices(in_situ_measurements)
+        values_by_data_type = {
+            required_datum: np.empty(len(in_situ_measurements))
+            for required_datum in required_data
+        }
+        for area_index, (_, forecast_data) in enumerate(self.forecast_data_by_area):
+            positions = np.nonzero(area_indices == area_index)[0]
+            if len(positions) == 0:
+                continue
+            area_values = forecast_data.get_values_for_measurements(
+                [in_situ_measurements[position] for position in positions],
+                required_data,
+            )
+            for required_datum, values in area_values.items():
+                values_by_data_type[required_datum][positions] = values
+        return pair_measurements_with_values(in_situ_measurements, values_by_data_type)
@@ -1,17 +1,34 @@
+from collections import deque
 from datetime import datetime
 import logging
+from multiprocessing.pool import ThreadPool
 
 from etl.src.forecast.forecast_adapter import transform, create_data_textures
+from etl.src.forecast.forecast_artifact_store import get_artifact_store_location
 from etl.src.forecast.forecast_dao import fetch_forecast_data
+from etl.src.forecast.forecast_data import ForecastData
+from etl.src.forecast.meteorological_series import store_meteorological_series
 from shared.src.database.forecasts import insert_data, insert_textures
 from shared.src.database.locations import AirQualityLocation
 
 
-def process_forecast(cities: list[AirQualityLocation], base_date: datetime):
-    base_date_str = base_date.strftime("%Y-%m-%d %H:%M:%S")
+def _format_base_date(base_date: datetime) -> str:
+    return base_date.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def extract_forecast(base_date: datetime) -> ForecastData:
+    base_date_str = _format_base_date(base_date)
 
     logging.info(f"Extracting pollutant forecast data for base date {base_date_str}")
-    extracted_forecast_data = fetch_forecast_data(base_date)
+    return fetch_forecast_data(base_date)
+
+
+def load_forecast(
+    cities: list[AirQualityLocation],
+    base_date: datetime,
+    extracted_forecast_data: ForecastData,
+):
+    base_date_str = _format_base_date(base_date)
 
     logging.info(f"Transforming forecast data for base date {base_date_str}")
     transformed_forecast_data = transform(extracted_forecast_data, cities)
@@ -24,3 +41,62 @@ def process_forecast(cities: list[AirQualityLocation], base_date: datetime):
 
     logging.info(f"Persisting forecast data textures for base date {base_date_str}")
     insert_textures(textures)
+
+    store_location = get_artifact_store_location()
+    if store_location is not None:
+        logging.info(f"Storing meteorological series for base date {base_date_str}")
+        try:
+            store_meteorological_series(store_location, extracted_forecast_data, cities)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unable to store meteorological series: {e}")
+
+
+def process_forecast(cities: list[AirQualityLocation], base_date: datetime):
+    extracted_forecast_data = extract_forecast(base_date)
+    load_forecast(cities, base_date, extracted_forecast_data)
+
+
+def process_forecasts(
+    cities: list[AirQualityLocation], base_dates: list[datetime], workers: int
+):
+    """
+    Process several forecast base dates, extracting upcoming base dates while
+    the current one is transformed and persisted. Base dates are loaded in order.
+    :param cities: cities to transform the forecast data for
+    :param base_dates: forecast base dates to process
+    :param workers: maximum number of base dates extracted or held in memory
+    at once, including the base date being transformed and persisted
+    """
+    if workers < 1:
+        raise ValueError(f"Forecast workers must be at least 1, got {workers}")
+
+    total = len(base_dates)
+    with ThreadPool(workers) as pool:
+        remaining_dates = iter(base_dates)
+        pending = deque()
+
+        def extract_next():
+            base_date = next(remaining_dates, None)
+            if base_date is not None:
+                pending.append(
+                    (base_date, pool.apply_async(extract_forecast, (base_date,)))
+                )
+
+        for _ in range(workers):
+            extract_next()
+
+        completed = 0
+        while pending:
+            base_date, extraction = pending.popleft()
+            extracted_forecast_data = extraction.get()
+            load_forecast(cities, base_date, extracted_forecast_data)
+            # The finished extraction also holds the forecast data, so both are
+            # released before the next base date is extracted
+            del extracted_forecast_data, extraction
+            extract_next()
+
+            completed += 1
+            logging.info(
+                f"Processed forecast for base date {_format_base_date(base_date)} "
+                f"({completed}/{total})"
+            )
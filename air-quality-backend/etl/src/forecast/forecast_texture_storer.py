@@ -81,7 +81,7 @@ def _create_output_directory(forecast_date: str) -> str:
     return output_directory
 
 
-def _write_texture_to_disk(
+def write_texture_to_disk(
     rgb_data_array: np.ndarray,
     output_directory: str,
     forecast_date: str,
@@ -119,17 +119,19 @@ def _write_texture_to_disk(
     return output_file
 
 
-def save_data_textures(
+def prepare_data_textures(
     rgb_data_array: np.ndarray,
     num_lon: int,
     time_vector: xr.DataArray,
     variable_name: str,
     forecast_date: str,
-    min_value: float,
-    max_value: float,
-    units: str,
-) -> List[str]:
+) -> Tuple[List[tuple], Dict[int, Dict[str, str]]]:
+    """
+    Split a data texture into chunks ready to be written to disk.
 
+    :return: The write_texture_to_disk arguments for each chunk, and a dictionary
+    with start and end time stamps for each chunk
+    """
     chunks_per_texture = 16
     file_format = "webp"
 
@@ -144,10 +146,8 @@ def save_data_textures(
 
     output_directory = _create_output_directory(forecast_date)
 
-    documents = []
-
-    for num_chunk, chunk in enumerate(chunk_list):
-        output_file = _write_texture_to_disk(
+    write_arguments = [
+        (
             chunk,
             output_directory,
             forecast_date,
@@ -156,6 +156,25 @@ def save_data_textures(
             len(chunk_list),
             file_format,
         )
+        for num_chunk, chunk in enumerate(chunk_list)
+    ]
+    return write_arguments, chunk_dict
+
+
+def create_texture_documents(
+    output_files: List[str],
+    chunk_dict: Dict[int, Dict[str, str]],
+    variable_name: str,
+    forecast_date: str,
+    min_value: float,
+    max_value: float,
+    units: str,
+) -> List[dict]:
+    """
+    Create the database documents describing each written data texture chunk.
+    """
+    documents = []
+    for num_chunk, output_file in enumerate(output_files):
         document = {
             "forecast_base_time": datetime.strptime(forecast_date, "%Y-%m-%d_%H"),
             "variable": variable_name,
@@ -166,13 +185,38 @@ def save_data_textures(
             "texture_uri": output_file,
             "time_start": datetime.fromisoformat(chunk_dict[num_chunk]["time_start"]),
             "time_end": datetime.fromisoformat(chunk_dict[num_chunk]["time_end"]),
-            "chunk": f"{num_chunk+1} of {len(chunk_list)}",
+            "chunk": f"{num_chunk+1} of {len(output_files)}",
         }
         documents.append(document)
 
     return documents
 
 
+def save_data_textures(
+    rgb_data_array: np.ndarray,
+    num_lon: int,
+    time_vector: xr.DataArray,
+    variable_name: str,
+    forecast_date: str,
+    min_value: float,
+    max_value: float,
+    units: str,
+) -> List[str]:
+    write_arguments, chunk_dict = prepare_data_textures(
+        rgb_data_array, num_lon, time_vector, variable_name, forecast_date
+    )
+    output_files = [write_texture_to_disk(*arguments) for arguments in write_arguments]
+    return create_texture_documents(
+        output_files,
+        chunk_dict,
+        variable_name,
+        forecast_date,
+        min_value,
+        max_value,
+        units,
+    )
+
+
 def delete_data_textures_before(archive_date: datetime):
     date_folder_format = "%Y-%m-%d_%H"
 
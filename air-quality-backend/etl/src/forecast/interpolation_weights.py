@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+# Bumped whenever the weight calculation changes, invalidating persisted tables
+WEIGHTS_VERSION = "1"
+
+_cached_weights = {}
+
+
+class InterpolationWeights:
+    """
+    Bi-linear interpolation from a latitude/longitude grid to a fixed set of
+    points, as the flat grid index and weight of the four cells around each point
+    """
+
+    def __init__(self, indices: np.ndarray, weights: np.ndarray):
+        self.indices = indices
+        self.weights = weights
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """
+        Interpolate every grid in values with a single gather
+        :param values: array with latitude and longitude as its last two dimensions
+        :return: interpolated values with points as the first dimension, followed
+        by the remaining leading dimensions of values
+        """
+        flat_values = values.reshape(*values.shape[:-2], -1)
+        interpolated = (flat_values[..., self.indices] * self.weights).sum(axis=-1)
+        return np.moveaxis(interpolated, -1, 0)
+
+
+def get_axis_weights(
+    grid: np.ndarray, points: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the grid cells either side of each point, choosing intervals the same
+    way as scipy.interpolate.interpn. Points outside the grid get NaN fractions.
+    :return: lower indices, upper indices, fraction of the way to the upper index
+    """
+    order = np.argsort(grid, kind="stable")
+    sorted_grid = grid[order]
+    upper = np.clip(
+        np.searchsorted(sorted_grid, points, side="right"), 1, len(grid) - 1
+    )
+    lower = upper - 1
+    fraction = (points - sorted_grid[lower]) / (sorted_grid[upper] - sorted_grid[lower])
+    outside = ~((sorted_grid[0] <= points) & (points <= sorted_grid[-1]))
+    return order[lower], order[upper], np.where(outside, np.nan, fraction)
+
+
+def calculate_interpolation_weights(
+    grid_latitudes: np.ndarray,
+    grid_longitudes: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> InterpolationWeights:
+    """
+    Calculate the bi-linear interpolation weights for points on a grid
+    :param grid_latitudes: latitude coordinate of the grid
+    :param grid_longitudes: longitude coordinate of the grid
+    :param latitudes: latitude of each point
+    :param longitudes: longitude of each point
+    """
+    lat_lower, lat_upper, lat_fraction = get_axis_weights(grid_latitudes, latitudes)
+    lon_lower, lon_upper, lon_fraction = get_axis_weights(grid_longitudes, longitudes)
+    longitude_count = len(grid_longitudes)
+    indices = np.stack(
+        [
+            lat_lower * longitude_count + lon_lower,
+            lat_lower * longitude_count + lon_upper,
+            lat_upper * longitude_count + lon_lower,
+            lat_upper * longitude_count + lon_upper,
+        ],
+        axis=-1,
+    )
+    weights = np.stack(
+        [
+            (1 - lat_fraction) * (1 - lon_fraction),
+            (1 - lat_fraction) * lon_fraction,
+            lat_fraction * (1 - lon_fraction),
+            lat_fraction * lon_fraction,
+        ],
+        axis=-1,
+    )
+    return InterpolationWeights(indices, weights)
+
+
+def get_interpolation_weights_key(
+    grid_latitudes: np.ndarray,
+    grid_longitudes: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> str:
+    """
+    :return: hash of the grid and the points, changing if either changes
+    """
+    key = hashlib.sha256(WEIGHTS_VERSION.encode())
+    for array in [grid_latitudes, grid_longitudes, latitudes, longitudes]:
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        key.update(str(array.shape).encode())
+        key.update(array.tobytes())
+    return key.hexdigest()
+
+
+def _load_weights(file_name: str, key: str) -> InterpolationWeights | None:
+    try:
+        with np.load(file_name) as stored:
+            if str(stored["key"]) != key:
+                logging.warning(f"Ignoring interpolation weights in {file_name}")
+                return None
+            return InterpolationWeights(stored["indices"], stored["weights"])
+    except FileNotFoundError:
+        return None
+
+
+def _save_weights(file_name: str, key: str, weights: InterpolationWeights):
+    # Written to a temporary file first so readers never see a partial table
+    temporary_file_name = f"{file_name}.{os.getpid()}.tmp.npz"
+    np.savez(
+        temporary_file_name,
+        key=key,
+        indices=weights.indices,
+        weights=weights.weights,
+    )
+    os.replace(temporary_file_name, file_name)
+
+
+def get_interpolation_weights(
+    grid_latitudes: np.ndarray,
+    grid_longitudes: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> InterpolationWeights:
+    """
+    Get the interpolation weights for points on a grid, calculating them only
+    when the grid or points have not been seen before. Weights are kept for the
+    life of the process, and persisted as .npz files in the directory set by
+    INTERPOLATION_WEIGHTS_CACHE when it is set.
+    """
+    key = get_interpolation_weights_key(
+        grid_latitudes, grid_longitudes, latitudes, longitudes
+    )
+    if key in _cached_weights:
+        return _cached_weights[key]
+
+    cache_location = os.environ.get("INTERPOLATION_WEIGHTS_CACHE")
+    file_name = None
+    weights = None
+    if cache_location is not None:
+        file_name = os.path.join(cache_location, f"interpolation_weights_{key}.npz")
+        weights = _load_weights(file_name, key)
+
+    if weights is None:
+        logging.info(f"Calculating interpolation weights for {len(latitudes)} points")
+        weights = calculate_interpolation_weights(
+            np.asarray(grid_latitudes, dtype=float),
+            np.asarray(grid_longitudes, dtype=float),
+            np.asarray(latitudes, dtype=float),
+            np.asarray(longitudes, dtype=float),
+        )
+        if file_name is not None:
+            os.makedirs(cache_location, exist_ok=True)
+            _save_weights(file_name, key, weights)
+
+    _cached_weights[key] = weights
+    return weights
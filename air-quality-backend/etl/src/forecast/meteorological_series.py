@@ -0,0 +1,281 @@
+import logging
+import os
+from datetime import datetime
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+
+from shared.src.database.in_situ import InSituMeasurement
+from shared.src.database.locations import AirQualityLocation
+from shared.src.xarray_utils import get_chunk_slices
+from .forecast_artifact_store import ARTIFACT_DATE_FORMAT
+from .forecast_data import ForecastData, ForecastDataType, pair_measurements_with_values
+from .interpolation_weights import calculate_interpolation_weights, get_axis_weights
+
+# Bumped whenever the stored layout changes, so old series are ignored
+SERIES_VERSION = "1"
+SERIES_FILE_NAME = "meteorological_series.npz"
+SERIES_DATA_TYPES = [ForecastDataType.TEMPERATURE, ForecastDataType.SURFACE_PRESSURE]
+
+
+class MeteorologicalSeries:
+    """
+    Time series of temperature and surface pressure for the grid cells around a
+    set of locations, which is enough to enrich in situ measurements taken near
+    them without opening the full forecast
+    """
+
+    def __init__(
+        self,
+        grid_latitudes: np.ndarray,
+        grid_longitudes: np.ndarray,
+        cells: np.ndarray,
+        valid_times: np.ndarray,
+        values: dict[ForecastDataType, np.ndarray],
+        fallback: Callable[[], ForecastData] = None,
+    ):
+        """
+        :param grid_latitudes: latitude coordinate of the forecast grid
+        :param grid_longitudes: longitude coordinate of the forecast grid
+        :param cells: sorted flat grid indices of the stored cells
+        :param valid_times: valid time of each step, in seconds since the epoch
+        :param values: values with shape (cell, step) for each data type
+        :param fallback: loads the full forecast data, used for measurements the
+        series does not cover
+        """
+        self.grid_latitudes = grid_latitudes
+        self.grid_longitudes = grid_longitudes
+        self.cells = cells
+        self.valid_times = valid_times
+        self.values = values
+        self.fallback = fallback
+        self._fallback_data = None
+        self._fallback_lock = Lock()
+
+    def get_values_for_measurements(
+        self,
+        in_situ_measurements: list[InSituMeasurement],
+        required_data: list[ForecastDataType],
+    ) -> dict[ForecastDataType, np.ndarray] | None:
+        """
+        Interpolate the series to the location and time of each measurement, the
+        same way as ForecastData.get_values_for_measurements
+        :param in_situ_measurements:
+        :param required_data:
+        :return: values for each data type, aligned with in_situ_measurements, or
+        None if the series does not cover every measurement
+        """
+        if len(self.cells) == 0 or any(
+            data_type not in self.values for data_type in required_data
+        ):
+            return None
+
+        times = np.array(
+            [m["measurement_date"].timestamp() for m in in_situ_measurements]
+        )
+        if times.min() < self.valid_times[0] or times.max() > self.valid_times[-1]:
+            return None
+
+        weights = calculate_interpolation_weights(
+            self.grid_latitudes,
+            self.grid_longitudes,
+            np.array([m["location"]["coordinates"][1] for m in in_situ_measurements]),
+            np.array([m["location"]["coordinates"][0] for m in in_situ_measurements]),
+        )
+        positions = np.searchsorted(self.cells, weights.indices)
+        positions = np.minimum(positions, len(self.cells) - 1)
+        if not np.array_equal(self.cells[positions], weights.indices):
+            return None
+
+        lower, upper, fraction = get_axis_weights(self.valid_times, times)
+        points = np.arange(len(in_situ_measurements))
+        values_by_data_type = {}
+        for required_datum in required_data:
+            # Bi-linear in space then linear in time, which is tri-linear
+            spatial_values = (
+                self.values[required_datum][positions] * weights.weights[..., None]
+            ).sum(axis=1)
+            values_by_data_type[required_datum] = (
+                spatial_values[points, lower] * (1 - fraction)
+                + spatial_values[points, upper] * fraction
+            )
+        return values_by_data_type
+
+    def enrich_in_situ_measurements(
+        self,
+        in_situ_measurements: list[InSituMeasurement],
+        required_data: list[ForecastDataType],
+    ) -> list[tuple[InSituMeasurement, dict[ForecastDataType:float]]]:
+        if len(in_situ_measurements) == 0:
+            return []
+
+        values_by_data_type = self.get_values_for_measurements(
+            in_situ_measurements, required_data
+        )
+        if values_by_data_type is None:
+            logging.info("Meteorological series does not cover the measurements")
+            return self._get_fallback_data().enrich_in_situ_measurements(
+                in_situ_measurements, required_data
+            )
+        return pair_measurements_with_values(in_situ_measurements, values_by_data_type)
+
+    def _get_fallback_data(self) -> ForecastData:
+        if self.fallback is None:
+            raise ValueError("Meteorological series has no fallback forecast data")
+        with self._fallback_lock:
+            if self._fallback_data is None:
+                self._fallback_data = self.fallback()
+            return self._fallback_data
+
+
+def get_cells_for_locations(
+    grid_latitudes: np.ndarray,
+    grid_longitudes: np.ndarray,
+    locations: list[AirQualityLocation],
+    margin: float,
+) -> np.ndarray:
+    """
+    :param grid_latitudes:
+    :param grid_longitudes:
+    :param locations:
+    :param margin: degrees around each location to include
+    :return: sorted flat indices of the grid cells within margin of any location
+    """
+    cells = []
+    for location in locations:
+        latitude_indices = np.nonzero(
+            np.abs(grid_latitudes - location["latitude"]) <= margin
+        )[0]
+        longitude_indices = np.nonzero(
+            np.abs(grid_longitudes - location["longitude"]) <= margin
+        )[0]
+        cells.append(
+            (
+                latitude_indices[:, None] * len(grid_longitudes) + longitude_indices
+            ).ravel()
+        )
+    return np.unique(np.concatenate(cells)) if len(cells) > 0 else np.array([], int)
+
+
+def get_epoch_seconds(times: np.ndarray) -> np.ndarray:
+    """
+    :param times: times as seconds since the epoch, as read from the GRIB files,
+    or decoded to datetime64
+    :return: the times as seconds since the epoch
+    """
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times - np.datetime64(0, "s")) / np.timedelta64(1, "s")
+    return np.asarray(times, dtype=float)
+
+
+def create_meteorological_series(
+    forecast_data: ForecastData, locations: list[AirQualityLocation], margin: float
+) -> MeteorologicalSeries:
+    """
+    Extract the temperature and surface pressure series around the locations
+    :param forecast_data:
+    :param locations:
+    :param margin: degrees around each location to include
+    """
+    datasets = [
+        forecast_data.get_data_set(data_type) for data_type in SERIES_DATA_TYPES
+    ]
+    grid_latitudes = datasets[0]["latitude"].values
+    grid_longitudes = datasets[0]["longitude"].values
+    for dataset in datasets[1:]:
+        if not (
+            np.array_equal(dataset["latitude"].values, grid_latitudes)
+            and np.array_equal(dataset["longitude"].values, grid_longitudes)
+        ):
+            raise ValueError("Meteorological series data types must share a grid")
+
+    cells = get_cells_for_locations(grid_latitudes, grid_longitudes, locations, margin)
+    values = {}
+    for data_type, dataset in zip(SERIES_DATA_TYPES, datasets):
+        data = dataset[data_type.value].transpose("step", "latitude", "longitude")
+        # Lazy data is read one chunk of steps at a time
+        step_values = []
+        for step_slice in get_chunk_slices(data, "step"):
+            chunk = data.isel(step=step_slice).values
+            step_values.append(chunk.reshape(len(chunk), -1)[:, cells])
+        values[data_type] = np.concatenate(step_values).T
+    return MeteorologicalSeries(
+        grid_latitudes,
+        grid_longitudes,
+        cells,
+        get_epoch_seconds(datasets[0]["valid_time"].values),
+        values,
+    )
+
+
+def get_series_file(store_location: str, base_datetime: datetime) -> str:
+    """
+    File of the series for a forecast base time, kept alongside its artifacts so
+    they are deleted together
+    """
+    return os.path.join(
+        store_location, base_datetime.strftime(ARTIFACT_DATE_FORMAT), SERIES_FILE_NAME
+    )
+
+
+def write_meteorological_series(file_name: str, series: MeteorologicalSeries):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    # Written to a temporary file first so readers never see a partial series
+    temporary_file_name = f"{file_name}.{os.getpid()}.tmp.npz"
+    np.savez(
+        temporary_file_name,
+        version=SERIES_VERSION,
+        grid_latitudes=series.grid_latitudes,
+        grid_longitudes=series.grid_longitudes,
+        cells=series.cells,
+        valid_times=series.valid_times,
+        **{data_type.value: values for data_type, values in series.values.items()},
+    )
+    os.replace(temporary_file_name, file_name)
+    logging.info(f"Stored meteorological series for {len(series.cells)} cells")
+
+
+def read_meteorological_series(
+    file_name: str, fallback: Callable[[], ForecastData] = None
+) -> MeteorologicalSeries | None:
+    """
+    :param file_name:
+    :param fallback: loads the full forecast data, used for measurements the
+    series does not cover
+    :return: the series, or None if there is no series for this version
+    """
+    try:
+        with np.load(file_name) as stored:
+            if str(stored["version"]) != SERIES_VERSION:
+                logging.warning(f"Ignoring meteorological series in {file_name}")
+                return None
+            return MeteorologicalSeries(
+                stored["grid_latitudes"],
+                stored["grid_longitudes"],
+                stored["cells"],
+                stored["valid_times"],
+                {
+                    data_type: stored[data_type.value]
+                    for data_type in SERIES_DATA_TYPES
+                    if data_type.value in stored
+                },
+                fallback,
+            )
+    except FileNotFoundError:
+        return None
+
+
+def store_meteorological_series(
+    store_location: str,
+    forecast_data: ForecastData,
+    locations: list[AirQualityLocation],
+):
+    """
+    Store the series around the locations for the in situ ETL, covering
+    IN_SITU_FORECAST_AREA_MARGIN degrees (default 1) around each location
+    """
+    margin = float(os.environ.get("IN_SITU_FORECAST_AREA_MARGIN", 1.0))
+    base_datetime = datetime.utcfromtimestamp(forecast_data.get_time_value())
+    series = create_meteorological_series(forecast_data, locations, margin)
+    write_meteorological_series(get_series_file(store_location, base_datetime), series)
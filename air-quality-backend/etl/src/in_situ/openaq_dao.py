@@ -2,36 +2,112 @@ import json
 import logging
 import os
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
-from threading import Lock
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Iterator
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from shared.src.database.in_situ_sensors import (
+    get_sensor_catalog,
+    upsert_sensor_catalog,
+)
+from .openaq_response_cache import (
+    get_response_cache_location,
+    read_cached_results,
+    results_between,
+    write_results,
+)
+
 LOCATIONS_PATH = "v3/locations"
 MEASUREMENTS_PATH = "v3/sensors/{sensor_id}/measurements/hourly"
+LOCATIONS_RADIUS_METRES = 25000
 SUPPORTED_PARAMETERS = ["o3", "no2", "pm10", "so2", "pm25"]
 
 
 class RateLimiter:
-    def __init__(self):
+    """
+    Token bucket shared by every OpenAQ request. Tokens refill at
+    OPEN_AQ_REQUESTS_PER_MINUTE (default 60), and the rate limit headers of each
+    response correct the bucket, so concurrent requests slow down before the quota
+    is used up rather than after.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
         self.lock = Lock()
         self.api_calls = 0  # Add counter for API calls
+        self.requests_per_minute = requests_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = None
+        self.updated_at = None
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if self.requests_per_minute is None:
+            # Read on first use so values from .env files loaded by the scripts
+            # are honoured
+            self.requests_per_minute = float(
+                os.environ.get("OPEN_AQ_REQUESTS_PER_MINUTE", 60)
+            )
+        if self.tokens is None:
+            self.tokens = self.requests_per_minute
+        else:
+            elapsed = now - self.updated_at
+            self.tokens = min(
+                self.requests_per_minute,
+                self.tokens + elapsed * self.requests_per_minute / 60,
+            )
+        self.updated_at = now
+
+    def acquire(self):
+        """Wait until a request can be made within the rate limit"""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait_time = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait_time = (1 - self.tokens) * 60 / self.requests_per_minute
+            self.sleep(wait_time)
+
+    def block_for(self, wait_time: float):
+        """Hold back every request for wait_time seconds"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + wait_time)
 
     def wait_if_needed(self, response: requests.Response):
-        """Check rate limits from response headers and wait if needed"""
+        """Correct the bucket from the rate limit headers of a response"""
+        remaining = response.headers.get("x-ratelimit-remaining")
         with self.lock:
             self.api_calls += 1  # Increment counter
-            remaining = int(response.headers.get("x-ratelimit-remaining", 1))
-            if remaining == 0:
+            if remaining is None:
+                return
+            self._refill(self.clock())
+            self.tokens = min(self.tokens, int(remaining))
+            if int(remaining) == 0:
                 reset_time = int(response.headers.get("x-ratelimit-reset", 0))
                 if reset_time > 0:
                     logging.info(
                         f"OpenAQ API rate limit reached. Waiting {reset_time} seconds."
                     )
-                    time.sleep(reset_time)
+                    self.blocked_until = max(
+                        self.blocked_until, self.clock() + reset_time
+                    )
 
     def get_api_calls(self):
         """Get total number of API calls made"""
@@ -42,26 +118,47 @@ class RateLimiter:
 rate_limiter = RateLimiter()
 
 
-def _create_session() -> requests.Session:
-    retry_strategy = Retry(total=2, status_forcelist=[408], raise_on_status=False)
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session = requests.Session()
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+def _get_max_concurrent_requests() -> int:
+    """
+    Limit on OpenAQ requests in flight, configured with
+    OPEN_AQ_MAX_CONCURRENT_REQUESTS (default 8)
+    """
+    return max(int(os.environ.get("OPEN_AQ_MAX_CONCURRENT_REQUESTS", 8)), 1)
 
 
-def _retrieve_open_aq_results(
-    city, date_from: datetime, date_to: datetime, cache_location: str, session
-):
-    results = []
-    if cache_location is not None:
-        results = _read_city_from_cache(city, date_from, date_to, cache_location)
+class OpenAQSession(requests.Session):
+    """
+    Session shared by every thread fetching from OpenAQ, which allows at most
+    max_concurrent_requests requests in flight, including page prefetches, so
+    no more connections are in use than its connection pool holds
+    """
 
-    if len(results) == 0:
-        results = _call_openaq_api_v3(city, date_from, date_to, session)
+    def __init__(self, max_concurrent_requests: int):
+        super().__init__()
+        self._request_slots = BoundedSemaphore(max_concurrent_requests)
+        # Shared by every sensor, rather than a thread per sensor
+        self.prefetcher = ThreadPoolExecutor(
+            max_workers=max_concurrent_requests, thread_name_prefix="openaq-prefetch"
+        )
 
-    return results
+    def request(self, *args, **kwargs) -> requests.Response:
+        with self._request_slots:
+            return super().request(*args, **kwargs)
+
+    def close(self):
+        self.prefetcher.shutdown()
+        super().close()
+
+
+def _create_session(pool_size: int = 10) -> OpenAQSession:
+    retry_strategy = Retry(total=2, status_forcelist=[408], raise_on_status=False)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session = OpenAQSession(pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 def _read_city_from_cache(
@@ -88,6 +185,7 @@ def _make_request(
 
     while retry_count < max_retries:
         try:
+            rate_limiter.acquire()
             response = session.get(url, headers=headers)
 
             # Handle 429 Too Many Requests
@@ -103,7 +201,8 @@ def _make_request(
                     f"Rate limit exceeded (429). Waiting {wait_time} seconds. "
                     f"Retry {retry_count}/{max_retries}"
                 )
-                time.sleep(wait_time)
+                # Every request waits, not just this one
+                rate_limiter.block_for(wait_time)
                 continue
 
             rate_limiter.wait_if_needed(response)
@@ -125,7 +224,7 @@ def _make_request(
                         f"Rate limit exceeded (429) in error. Waiting {wait_time} seconds. "
                         f"Retry {retry_count}/{max_retries}"
                     )
-                    time.sleep(wait_time)
+                    rate_limiter.block_for(wait_time)
                     continue
             raise
 
@@ -135,12 +234,22 @@ def _make_request(
     )
 
 
-def _get_locations_with_sensors(city, session, date_from: datetime) -> list:
-    """Get all sensor IDs for a given city location"""
+def _get_sensor_cache_ttl_hours() -> float | None:
+    """
+    Hours a discovered sensor catalog is reused for, set with
+    OPEN_AQ_SENSOR_CACHE_TTL_HOURS. Locations are discovered on every call when
+    it is not set.
+    """
+    ttl_hours = os.environ.get("OPEN_AQ_SENSOR_CACHE_TTL_HOURS")
+    return float(ttl_hours) if ttl_hours is not None else None
+
+
+def _discover_locations(city, session) -> list:
+    """List the OpenAQ locations, with their sensors, around a city"""
     query_params = {
         "limit": 1000,
         "page": 1,
-        "radius": 25000,
+        "radius": LOCATIONS_RADIUS_METRES,
         "coordinates": f"{city['latitude']},{city['longitude']}",
     }
 
@@ -149,12 +258,56 @@ def _get_locations_with_sensors(city, session, date_from: datetime) -> list:
     )
 
     headers = {"X-API-Key": os.environ.get("OPEN_AQ_API_KEY")}
+    response = _make_request(session, url, headers)
+    return response.json().get("results", [])
+
+
+def _get_locations(city, session) -> tuple[list, datetime]:
+    """
+    Get the locations around a city, from the sensor catalog when it was
+    discovered within OPEN_AQ_SENSOR_CACHE_TTL_HOURS
+    :return: the locations, and the UTC time they were discovered
+    """
+    ttl_hours = _get_sensor_cache_ttl_hours()
+    now = datetime.utcnow()
+    if ttl_hours is not None:
+        catalog = get_sensor_catalog(
+            city["latitude"],
+            city["longitude"],
+            LOCATIONS_RADIUS_METRES,
+            now - timedelta(hours=ttl_hours),
+        )
+        if catalog is not None:
+            logging.debug(f"Using cached sensor catalog for {city['name']}")
+            return catalog["locations"], catalog["discovered_time"]
+
+    locations = _discover_locations(city, session)
+    if ttl_hours is not None:
+        upsert_sensor_catalog(
+            {
+                "latitude": city["latitude"],
+                "longitude": city["longitude"],
+                "radius": LOCATIONS_RADIUS_METRES,
+                "locations": locations,
+                "discovered_time": now,
+            }
+        )
+    return locations, now
+
+
+def _get_locations_with_sensors(city, session, date_from: datetime) -> list:
+    """Get all sensor IDs for a given city location"""
     sensor_ids = []
     active_locations = set()  # Track unique active locations
 
     try:
-        response = _make_request(session, url, headers)
-        locations = response.json().get("results", [])
+        locations, discovered_time = _get_locations(city, session)
+        # Cached locations may have reported since they were discovered, so for
+        # later dates only those silent for the TTL before discovery are skipped
+        stale_before = date_from
+        if date_from > discovered_time:
+            ttl_hours = _get_sensor_cache_ttl_hours() or 0
+            stale_before = discovered_time - timedelta(hours=ttl_hours)
 
         for location in locations:
             # Check if location has recent data
@@ -176,7 +329,7 @@ def _get_locations_with_sensors(city, session, date_from: datetime) -> list:
 
             try:
                 last_data_time = datetime.strptime(utc_time, "%Y-%m-%dT%H:%M:%SZ")
-                if last_data_time < date_from:
+                if last_data_time < stale_before:
                     logging.debug(
                         f"Skipping location {location.get('name')} in {city['name']} - "
                         f"Last data point ({last_data_time.isoformat()}) "
@@ -226,113 +379,219 @@ def _get_locations_with_sensors(city, session, date_from: datetime) -> list:
         return []
 
 
-def _get_measurements_for_sensor(
-    sensor_info, date_from, date_to, session, city
-) -> list:
-    """Get measurements for a specific sensor ID"""
-    # Ensure dates are in UTC and format them correctly
-    query_params = {
-        "datetime_from": date_from.strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "datetime_to": date_to.strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "limit": 1000,
-        "page": 1,
-    }
+def _get_page_limit() -> int:
+    """Measurements requested per page, set with OPEN_AQ_PAGE_LIMIT (default 1000)"""
+    return int(os.environ.get("OPEN_AQ_PAGE_LIMIT", 1000))
 
-    url = "{}/{}?{}".format(
-        os.environ.get("OPEN_AQ_API_URL"),
-        MEASUREMENTS_PATH.format(sensor_id=sensor_info["id"]),
-        urlencode(query_params),
-    )
 
+def _get_measurement_pages(sensor_info, date_from, date_to, session) -> Iterator[dict]:
+    """
+    Yield each page of hourly measurements for a sensor, parsed once. Paging
+    stops once meta.found measurements have been returned, or after a short page
+    when found is not an exact count (e.g. ">1000"). While a page is processed
+    the next one, if there is one, is already being requested by the session's
+    prefetcher.
+    """
+    limit = _get_page_limit()
     headers = {"X-API-Key": os.environ.get("OPEN_AQ_API_KEY")}
 
+    def fetch_page(page: int) -> dict:
+        # Ensure dates are in UTC and format them correctly
+        query_params = {
+            "datetime_from": date_from.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "datetime_to": date_to.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "limit": limit,
+            "page": page,
+        }
+        url = "{}/{}?{}".format(
+            os.environ.get("OPEN_AQ_API_URL"),
+            MEASUREMENTS_PATH.format(sensor_id=sensor_info["id"]),
+            urlencode(query_params),
+        )
+        return _make_request(session, url, headers).json()
+
+    page = 1
+    fetched = 0
+    payload = fetch_page(page)
+    while True:
+        results = payload.get("results", [])
+        fetched += len(results)
+        found = payload.get("meta", {}).get("found")
+        has_more = len(results) >= limit and (
+            not isinstance(found, int) or fetched < found
+        )
+        if not has_more:
+            yield payload
+            return
+        next_payload = session.prefetcher.submit(fetch_page, page + 1)
+        try:
+            yield payload
+        finally:
+            # A prefetch never outlives the sensor task, even if it stops early
+            next_payload.exception()
+        payload = next_payload.result()
+        page += 1
+
+
+def _transform_measurements(sensor_info, measurements: list) -> list:
+    """Transform v3 hourly measurements to the v2 API format"""
+    transformed_measurements = []
+    for m in measurements:
+        period = m.get("period", {})
+        datetime_from = period.get("datetimeFrom", {})
+        datetime_to = period.get("datetimeTo", {})
+        parameter = m.get("parameter", {})
+        summary = m.get("summary", {})
+
+        # Skip measurements without average value
+        if "avg" not in summary:
+            continue
+
+        logging.debug(
+            f"Processing measurement from {datetime_from.get('utc')} to {datetime_to.get('utc')}"
+        )
+
+        transformed_measurements.append(
+            {
+                "parameter": sensor_info["parameter"],
+                "value": summary.get("avg"),
+                "unit": parameter.get("units"),
+                "location": sensor_info["location_name"],
+                "date": {
+                    "utc": datetime_to.get("utc"),  # Use end time of the period
+                    "local": datetime_to.get("local"),  # Use end time of the period
+                },
+                "coordinates": sensor_info["coordinates"],
+                "entity": "OpenAQ",
+                "sensorType": (
+                    "reference grade"
+                    if sensor_info["is_monitor"]
+                    else "not reference grade"
+                ),
+            }
+        )
+    return transformed_measurements
+
+
+def _write_cached_results(
+    cache_location: str, sensor_info, results: list, date_from, date_to
+):
     try:
-        response = _make_request(session, url, headers)
-        measurements_found = response.json().get("meta", {}).get("found", 0)
-        logging.info(
-            f"Found {measurements_found} {sensor_info['parameter']} measurements for sensor {sensor_info['id']} in city {city['name']} at location {sensor_info['location_name']}"
+        write_results(cache_location, sensor_info["id"], results, date_from, date_to)
+    except OSError as e:
+        logging.warning(
+            f"Failed to cache measurements for sensor {sensor_info['id']}: {str(e)}"
         )
-        response.raise_for_status()
-        measurements = response.json().get("results", [])
-
-        # Transform to v2 API format
-        transformed_measurements = []
-        for m in measurements:
-            period = m.get("period", {})
-            datetime_from = period.get("datetimeFrom", {})
-            datetime_to = period.get("datetimeTo", {})
-            parameter = m.get("parameter", {})
-            summary = m.get("summary", {})
-
-            # Skip measurements without average value
-            if "avg" not in summary:
-                continue
 
-            logging.debug(
-                f"Processing measurement from {datetime_from.get('utc')} to {datetime_to.get('utc')}"
-            )
 
-            transformed_measurements.append(
-                {
-                    "parameter": sensor_info["parameter"],
-                    "value": summary.get("avg"),
-                    "unit": parameter.get("units"),
-                    "location": sensor_info["location_name"],
-                    "date": {
-                        "utc": datetime_to.get("utc"),  # Use end time of the period
-                        "local": datetime_to.get("local"),  # Use end time of the period
-                    },
-                    "coordinates": sensor_info["coordinates"],
-                    "entity": "OpenAQ",
-                    "sensorType": (
-                        "reference grade"
-                        if sensor_info["is_monitor"]
-                        else "not reference grade"
-                    ),
-                }
-            )
+def _get_measurements_for_sensor(
+    sensor_info, date_from, date_to, session, city
+) -> list:
+    """
+    Get measurements for a specific sensor ID, transforming each page as it
+    arrives so only the transformed measurements are held. Measurements from
+    pages already received are kept if a later page fails. Hours in the
+    response cache are not requested again, and settled hours requested are
+    written to it.
+    """
+    cache_location = get_response_cache_location()
+    periods = [(date_from, date_to)]
+    transformed_measurements = []
+    if cache_location is not None:
+        cached_results, periods = read_cached_results(
+            cache_location, sensor_info["id"], date_from, date_to
+        )
+        transformed_measurements = _transform_measurements(sensor_info, cached_results)
 
+    try:
+        for period_from, period_to in periods:
+            period_results = []
+            for page_number, payload in enumerate(
+                _get_measurement_pages(sensor_info, period_from, period_to, session)
+            ):
+                if page_number == 0:
+                    measurements_found = payload.get("meta", {}).get("found", 0)
+                    logging.info(
+                        f"Found {measurements_found} {sensor_info['parameter']} measurements for sensor {sensor_info['id']} in city {city['name']} at location {sensor_info['location_name']}"
+                    )
+                results = payload.get("results", [])
+                if (period_from, period_to) != (date_from, date_to):
+                    # Leave hours next to this period to the cache
+                    results = results_between(
+                        results,
+                        period_from if period_from > date_from else None,
+                        period_to if period_to < date_to else None,
+                    )
+                transformed_measurements.extend(
+                    _transform_measurements(sensor_info, results)
+                )
+                if cache_location is not None:
+                    period_results.extend(results)
+            if cache_location is not None:
+                _write_cached_results(
+                    cache_location, sensor_info, period_results, period_from, period_to
+                )
         return transformed_measurements
     except requests.exceptions.RequestException as e:
         logging.error(
             f"Failed to get measurements for sensor {sensor_info['id']}: {str(e)}"
         )
-        return []
-
-
-def _call_openaq_api_v3(city, date_from: datetime, date_to: datetime, session) -> list:
-    """Get measurements using v3 API endpoints"""
-    all_results = []
+        return transformed_measurements
 
-    # Step 1: Get all relevant sensor IDs for the city
-    sensor_ids = _get_locations_with_sensors(city, session, date_from)
 
-    if not sensor_ids:
-        return []
+def _call_openaq_api_v3(
+    cities, date_from: datetime, date_to: datetime, session, pool: ThreadPool
+) -> dict[str, list]:
+    """
+    Get measurements for several cities using v3 API endpoints, finding the
+    sensors of every city and then fetching every sensor concurrently
+    """
+    # Step 1: Get all relevant sensor IDs for each city
+    sensor_ids_by_city = pool.starmap(
+        _get_locations_with_sensors,
+        [(city, session, date_from) for city in cities],
+    )
 
     # Step 2: Get measurements for each sensor
-    for sensor_info in sensor_ids:
-        measurements = _get_measurements_for_sensor(
-            sensor_info, date_from, date_to, session, city
-        )
-        all_results.extend(measurements)
+    sensor_tasks = [
+        (sensor_info, date_from, date_to, session, city)
+        for city, sensor_ids in zip(cities, sensor_ids_by_city)
+        for sensor_info in sensor_ids
+    ]
+    measurements_by_sensor = pool.starmap(_get_measurements_for_sensor, sensor_tasks)
 
-    return all_results
+    results_by_city = {city["name"]: [] for city in cities}
+    for task, measurements in zip(sensor_tasks, measurements_by_sensor):
+        results_by_city[task[4]["name"]].extend(measurements)
+    return results_by_city
 
 
 def fetch_in_situ_measurements(cities, date_from: datetime, date_to: datetime):
-    in_situ_data_by_city = {}
-    session = _create_session()
     cache_location = (
         os.environ["OPEN_AQ_CACHE"] if "OPEN_AQ_CACHE" in os.environ else None
     )
 
+    results_by_city = {}
+    if cache_location is not None:
+        for city in cities:
+            results = _read_city_from_cache(city, date_from, date_to, cache_location)
+            if len(results) > 0:
+                results_by_city[city["name"]] = results
+
+    uncached_cities = [city for city in cities if city["name"] not in results_by_city]
+    if len(uncached_cities) > 0:
+        max_concurrent_requests = _get_max_concurrent_requests()
+        with _create_session(max_concurrent_requests) as session, ThreadPool(
+            processes=max_concurrent_requests
+        ) as pool:
+            results_by_city.update(
+                _call_openaq_api_v3(uncached_cities, date_from, date_to, session, pool)
+            )
+
+    in_situ_data_by_city = {}
     for city in cities:
-        results = _retrieve_open_aq_results(
-            city, date_from, date_to, cache_location, session
-        )
         in_situ_data_by_city[city["name"]] = {
-            "measurements": results,
+            "measurements": results_by_city[city["name"]],
             "city": {
                 "name": city["name"],
                 "type": city["type"],  # Ensure type is passed through
@@ -1,9 +1,10 @@
 import os
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
 
 import pandas as pd
 
-from shared.src.database.in_situ import get_in_situ_dates_between
+from shared.src.database.in_situ import InSituMeasurement, get_in_situ_dates_between
 
 
 def dates_without_measurements(
@@ -61,3 +62,52 @@ def retrieve_dates_requiring_in_situ_data() -> [datetime]:
     dates_requiring_in_situ_data.append(cur_date)
 
     return dates_requiring_in_situ_data
+
+
+def merge_in_situ_windows(
+    dates: list[datetime], period_hours: int, max_period_hours: int
+) -> list[tuple[datetime, int]]:
+    """
+    Merge the period_hours windows ending at each date into as few windows as
+    possible, so contiguous or overlapping windows are fetched together
+    :param dates: end of each window
+    :param period_hours: length of each window
+    :param max_period_hours: longest merged window, e.g. so the forecast data
+    fetched for the window stays within the length of a CAMS forecast
+    :return: the end and length in hours of each merged window
+    """
+    windows = []
+    for date in sorted(set(dates)):
+        start_date = date - timedelta(hours=period_hours)
+        if len(windows) > 0:
+            window_end, window_hours = windows[-1]
+            merged_hours = int((date - window_end).total_seconds() // 3600)
+            if start_date <= window_end and window_hours + merged_hours <= max(
+                max_period_hours, period_hours
+            ):
+                windows[-1] = (date, window_hours + merged_hours)
+                continue
+        windows.append((date, period_hours))
+    return windows
+
+
+def split_measurements_by_date(
+    measurements: list[InSituMeasurement], dates: list[datetime]
+) -> list[list[InSituMeasurement]]:
+    """
+    Split measurements fetched for a merged window back into the windows ending
+    at each date. Measurements after the last date are kept with the last date.
+    :param measurements:
+    :param dates: end of each window, in ascending order
+    :return: the measurements for each date
+    """
+    split = [[] for _ in dates]
+    for measurement in measurements:
+        measurement_date = measurement["measurement_date"]
+        if measurement_date.tzinfo is not None:
+            measurement_date = measurement_date.astimezone(timezone.utc).replace(
+                tzinfo=None
+            )
+        index = bisect_left(dates, measurement_date)
+        split[min(index, len(dates) - 1)].append(measurement)
+    return split
@@ -1,15 +1,27 @@
 import logging
 import math
 from multiprocessing.pool import ThreadPool
+import os
 import time
 
 from datetime import datetime, timedelta
 
 from shared.src.database.in_situ import InSituMeasurement
+from ..forecast.forecast_artifact_store import get_artifact_store_location
 from ..forecast.forecast_dao import (
     fetch_forecast_data,
     CAMS_FORECAST_INTERVAL_HOURS,
 )
+from ..forecast.forecast_data import (
+    ForecastData,
+    RegionalForecastData,
+    get_areas_for_locations,
+)
+from ..forecast.forecast_date_retriever import align_to_cams_publish_time
+from ..forecast.meteorological_series import (
+    get_series_file,
+    read_meteorological_series,
+)
 from .openaq_dao import fetch_in_situ_measurements, rate_limiter
 from .openaq_adapter import (
     transform_city,
@@ -29,7 +41,7 @@ def retrieve_openaq_in_situ_data(
         get_in_situ_data, (cities, start_date, end_date)
     )
     async_forecast_data = pool.apply_async(
-        get_forecast_data, (start_date, period_hours)
+        get_forecast_data, (start_date, period_hours, cities)
     )
 
     in_situ_measurements_by_city = async_in_situ_data.get()
@@ -71,10 +83,72 @@ def get_in_situ_data(cities, start_date, end_date):
     return in_situ_measurements_by_city
 
 
-def get_forecast_data(start_date, period_hours):
+def get_forecast_areas(cities) -> list[list[float]] | None:
+    """
+    Areas of forecast data needed to enrich measurements around the cities. Set
+    IN_SITU_FORECAST_AREA to "locations" to only request boxes around groups of
+    nearby cities, with IN_SITU_FORECAST_AREA_MARGIN degrees (default 1) on every
+    side. Cities spread over the globe are split into at most
+    IN_SITU_FORECAST_MAX_AREAS (default 16) boxes, each its own CAMS request,
+    while a regional subset such as those selected with OPEN_AQ_CITIES is
+    usually one box. The default, "global", requests the whole grid.
+    """
+    area_mode = os.environ.get("IN_SITU_FORECAST_AREA", "global")
+    if area_mode == "global":
+        return None
+    if area_mode != "locations":
+        raise ValueError(f"Unsupported in situ forecast area '{area_mode}'")
+    margin = float(os.environ.get("IN_SITU_FORECAST_AREA_MARGIN", 1.0))
+    max_areas = int(os.environ.get("IN_SITU_FORECAST_MAX_AREAS", 16))
+    return get_areas_for_locations(cities, margin, max_areas)
+
+
+def fetch_forecast_data_for_areas(
+    start_date, no_of_forecasts, areas: list[list[float]] | None
+) -> ForecastData | RegionalForecastData:
+    """
+    :param start_date:
+    :param no_of_forecasts:
+    :param areas: [north, west, south, east] areas to request, or None for the
+    whole grid
+    """
+    if areas is None:
+        return fetch_forecast_data(start_date, no_of_forecasts)
+    if len(areas) == 1:
+        logging.info(f"Requesting CAMs forecast data for area {areas[0]}")
+        return fetch_forecast_data(start_date, no_of_forecasts, areas[0])
+
+    forecast_data_by_area = []
+    for area in areas:
+        logging.info(f"Requesting CAMs forecast data for area {area}")
+        forecast_data_by_area.append(
+            (area, fetch_forecast_data(start_date, no_of_forecasts, area))
+        )
+    return RegionalForecastData(forecast_data_by_area)
+
+
+def get_forecast_data(start_date, period_hours, cities):
     logging.info("Extracting CAMs forecast data")
     no_of_forecasts = math.ceil((period_hours + 24) / CAMS_FORECAST_INTERVAL_HOURS)
-    extracted_forecast_data = fetch_forecast_data(start_date, no_of_forecasts)
+    areas = get_forecast_areas(cities)
+
+    store_location = get_artifact_store_location()
+    if store_location is not None:
+        # Temperature and surface pressure stored by the forecast ETL are enough
+        # to enrich measurements, with the full forecast only fetched if needed
+        series = read_meteorological_series(
+            get_series_file(store_location, align_to_cams_publish_time(start_date)),
+            fallback=lambda: fetch_forecast_data_for_areas(
+                start_date, no_of_forecasts, areas
+            ),
+        )
+        if series is not None:
+            logging.info("Using stored meteorological series for CAMs forecast data")
+            return series
+
+    extracted_forecast_data = fetch_forecast_data_for_areas(
+        start_date, no_of_forecasts, areas
+    )
 
     logging.info("Extracting CAMs forecast data complete")
     return extracted_forecast_data
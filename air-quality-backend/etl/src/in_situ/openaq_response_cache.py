@@ -0,0 +1,326 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from threading import Lock, get_ident
+
+# Bumped whenever the stored layout changes, so old entries are ignored
+CACHE_VERSION = "1"
+BUCKET_DATE_FORMAT = "%Y%m%d%H"
+BUCKET_LENGTH = timedelta(hours=1)
+# OpenAQ keeps receiving measurements for a while after the hour they are for,
+# so an hour is only cached once it is this old
+SETTLE_TIME = timedelta(hours=24)
+
+_index_lock = Lock()
+
+
+def get_response_cache_location() -> str | None:
+    """
+    Directory of the raw OpenAQ response cache, set with OPEN_AQ_RESPONSE_CACHE.
+    Disabled when it is not set. Any number of processes may read and write the
+    cache, while evict_responses holds it exclusively.
+    """
+    return os.environ.get("OPEN_AQ_RESPONSE_CACHE")
+
+
+def _get_index_file(cache_location: str) -> str:
+    # One line per hour written, so eviction does not need to open every hour
+    return os.path.join(cache_location, CACHE_VERSION, "index.jsonl")
+
+
+@contextmanager
+def _lock_cache(cache_location: str, operation: int):
+    """
+    Hold a file lock on the cache, shared by writers and exclusive for eviction,
+    so eviction never removes contents an hour being written is about to use
+    """
+    lock_file_name = os.path.join(cache_location, CACHE_VERSION, "lock")
+    os.makedirs(os.path.dirname(lock_file_name), exist_ok=True)
+    with open(lock_file_name, "w") as lock_file:
+        fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _get_object_file(cache_location: str, content_hash: str) -> str:
+    return os.path.join(
+        cache_location,
+        CACHE_VERSION,
+        "objects",
+        content_hash[:2],
+        f"{content_hash}.json.gz",
+    )
+
+
+def _get_bucket_file(cache_location: str, sensor_id: int, bucket: datetime) -> str:
+    return os.path.join(
+        cache_location,
+        CACHE_VERSION,
+        "sensors",
+        str(sensor_id),
+        bucket.strftime(BUCKET_DATE_FORMAT),
+    )
+
+
+def _write_atomically(file_name: str, content: bytes):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    # Written to a temporary file first so readers never see a partial entry
+    temporary_file_name = f"{file_name}.{os.getpid()}.{get_ident()}.tmp"
+    with open(temporary_file_name, "wb") as file:
+        file.write(content)
+    os.replace(temporary_file_name, file_name)
+
+
+def get_bucket(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def get_result_bucket(result: dict) -> datetime | None:
+    """
+    :param result: a raw v3 hourly measurement
+    :return: the bucket of the hour the measurement period starts in, or None if
+    the period has no start
+    """
+    utc = result.get("period", {}).get("datetimeFrom", {}).get("utc")
+    if utc is None:
+        return None
+    return get_bucket(datetime.strptime(utc, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def get_buckets(date_from: datetime, date_to: datetime) -> list[datetime]:
+    """
+    :return: every bucket overlapping the period from date_from to date_to
+    """
+    buckets = []
+    bucket = get_bucket(date_from)
+    while bucket < date_to:
+        buckets.append(bucket)
+        bucket += BUCKET_LENGTH
+    return buckets
+
+
+def results_between(
+    results: list[dict], start: datetime | None, end: datetime | None
+) -> list[dict]:
+    """
+    :param results: raw v3 hourly measurements
+    :param start: earliest period start kept, or None to keep any
+    :param end: period start kept results are before, or None to keep any
+    """
+    kept = []
+    for result in results:
+        utc = result.get("period", {}).get("datetimeFrom", {}).get("utc")
+        if utc is not None:
+            period_start = datetime.strptime(utc, "%Y-%m-%dT%H:%M:%SZ")
+            if (start is not None and period_start < start) or (
+                end is not None and period_start >= end
+            ):
+                continue
+        kept.append(result)
+    return kept
+
+
+def read_bucket(cache_location: str, sensor_id: int, bucket: datetime) -> list | None:
+    """
+    :return: the raw v3 results cached for a sensor and hour, or None if the hour
+    is not cached
+    """
+    try:
+        with open(_get_bucket_file(cache_location, sensor_id, bucket)) as file:
+            content_hash = file.read().strip()
+        with gzip.open(_get_object_file(cache_location, content_hash)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logging.warning(f"Ignoring cached OpenAQ responses for {sensor_id}: {e}")
+        return None
+
+
+def write_bucket(cache_location: str, sensor_id: int, bucket: datetime, results: list):
+    """
+    Store the raw v3 results of a sensor for an hour. Contents are stored once
+    under their hash, so the many hours with identical contents, such as hours
+    without measurements, share one file. Must be called while holding the cache
+    lock, as write_results does.
+    """
+    content = json.dumps(results, sort_keys=True).encode()
+    content_hash = hashlib.sha256(content).hexdigest()
+    compressed = gzip.compress(content, mtime=0)
+    # Indexed first, so contents left by a failed write are still evicted
+    index_entry = [
+        sensor_id,
+        bucket.strftime(BUCKET_DATE_FORMAT),
+        content_hash,
+        len(compressed),
+        time.time(),
+    ]
+    index_file_name = _get_index_file(cache_location)
+    with _index_lock:
+        os.makedirs(os.path.dirname(index_file_name), exist_ok=True)
+        with open(index_file_name, "a") as index_file:
+            index_file.write(json.dumps(index_entry) + "\n")
+
+    object_file = _get_object_file(cache_location, content_hash)
+    if not os.path.exists(object_file):
+        _write_atomically(object_file, compressed)
+    _write_atomically(
+        _get_bucket_file(cache_location, sensor_id, bucket), content_hash.encode()
+    )
+
+
+def read_cached_results(
+    cache_location: str, sensor_id: int, date_from: datetime, date_to: datetime
+) -> tuple[list[dict], list[tuple[datetime, datetime]]]:
+    """
+    :return: the cached raw v3 results of a sensor from date_from to date_to, and
+    the periods that are not cached and still need to be requested
+    """
+    cached_results = []
+    uncached_periods = []
+    for bucket in get_buckets(date_from, date_to):
+        results = read_bucket(cache_location, sensor_id, bucket)
+        if results is not None:
+            cached_results.extend(results)
+            continue
+        period = (max(bucket, date_from), min(bucket + BUCKET_LENGTH, date_to))
+        if len(uncached_periods) > 0 and uncached_periods[-1][1] == period[0]:
+            uncached_periods[-1] = (uncached_periods[-1][0], period[1])
+        else:
+            uncached_periods.append(period)
+    return results_between(cached_results, date_from, date_to), uncached_periods
+
+
+def write_results(
+    cache_location: str,
+    sensor_id: int,
+    results: list[dict],
+    date_from: datetime,
+    date_to: datetime,
+):
+    """
+    Cache the raw v3 results requested for a sensor from date_from to date_to,
+    for every settled hour the request fully covered
+    """
+    results_by_bucket = {}
+    for result in results:
+        results_by_bucket.setdefault(get_result_bucket(result), []).append(result)
+
+    settled_before = datetime.utcnow() - SETTLE_TIME
+    buckets = [
+        bucket
+        for bucket in get_buckets(date_from, date_to)
+        if bucket >= date_from
+        and bucket + BUCKET_LENGTH <= min(date_to, settled_before)
+    ]
+    if len(buckets) == 0:
+        return
+    with _lock_cache(cache_location, fcntl.LOCK_SH):
+        for bucket in buckets:
+            write_bucket(
+                cache_location, sensor_id, bucket, results_by_bucket.get(bucket, [])
+            )
+
+
+def evict_responses(cache_location: str, max_age_hours: float, max_bytes: int):
+    """
+    Delete hours cached more than max_age_hours ago, then the oldest hours until
+    the stored contents take up at most max_bytes. Hours are found from the
+    index, which is then rewritten with only the hours kept.
+    """
+    index_file_name = _get_index_file(cache_location)
+    if not os.path.exists(index_file_name):
+        return
+
+    with _lock_cache(cache_location, fcntl.LOCK_EX):
+        # Later entries for an hour replace earlier ones, whose contents are
+        # still stored until no kept hour uses them
+        entries = {}
+        stored_hashes = set()
+        with open(index_file_name) as index_file:
+            for line in index_file:
+                try:
+                    sensor_id, bucket, content_hash, size, written_time = json.loads(
+                        line
+                    )
+                except ValueError:
+                    continue
+                entries[(sensor_id, bucket)] = (written_time, content_hash, size)
+                stored_hashes.add(content_hash)
+
+        oldest_kept = time.time() - max_age_hours * 3600
+        expired = [key for key, entry in entries.items() if entry[0] < oldest_kept]
+        kept = sorted(
+            (entry, key) for key, entry in entries.items() if entry[0] >= oldest_kept
+        )
+        references = {}
+        sizes = {}
+        for (_, content_hash, size), _ in kept:
+            references[content_hash] = references.get(content_hash, 0) + 1
+            sizes[content_hash] = size
+
+        total_bytes = sum(sizes.values())
+        over_size = 0
+        while total_bytes > max_bytes and over_size < len(kept):
+            (_, content_hash, _), key = kept[over_size]
+            expired.append(key)
+            over_size += 1
+            references[content_hash] -= 1
+            if references[content_hash] == 0:
+                del references[content_hash]
+                total_bytes -= sizes[content_hash]
+
+        for sensor_id, bucket in expired:
+            _remove_file(
+                _get_bucket_file(
+                    cache_location,
+                    sensor_id,
+                    datetime.strptime(bucket, BUCKET_DATE_FORMAT),
+                )
+            )
+        for content_hash in stored_hashes - references.keys():
+            _remove_file(_get_object_file(cache_location, content_hash))
+
+        _write_atomically(
+            index_file_name,
+            "".join(
+                json.dumps([*key, content_hash, size, written_time]) + "\n"
+                for (written_time, content_hash, size), key in kept[over_size:]
+            ).encode(),
+        )
+    logging.info(
+        f"OpenAQ response cache holds {total_bytes} bytes after evicting "
+        f"{len(expired)} hours"
+    )
+
+
+def _remove_file(file_name: str):
+    try:
+        os.remove(file_name)
+    except FileNotFoundError:
+        pass
+
+
+def evict_cached_responses():
+    """
+    Keep the response cache, if there is one, within
+    OPEN_AQ_RESPONSE_CACHE_MAX_AGE_HOURS (default 168) and
+    OPEN_AQ_RESPONSE_CACHE_MAX_MB (default 512). Run once per ETL run.
+    """
+    cache_location = get_response_cache_location()
+    if cache_location is None:
+        return
+    max_age_hours = float(os.environ.get("OPEN_AQ_RESPONSE_CACHE_MAX_AGE_HOURS", 168))
+    max_mb = float(os.environ.get("OPEN_AQ_RESPONSE_CACHE_MAX_MB", 512))
+    try:
+        evict_responses(cache_location, max_age_hours, int(max_mb * 1024 * 1024))
+    except OSError as e:
+        logging.warning(f"Failed to evict OpenAQ response cache: {str(e)}")
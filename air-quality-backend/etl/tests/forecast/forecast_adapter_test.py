@@ -1,4 +1,7 @@
 from datetime import datetime, timezone
+from decimal import Decimal
+import os
+from unittest import mock
 
 import pytest
 from cerberus import Validator
@@ -6,6 +9,7 @@ import numpy as np
 from unittest.mock import patch
 import xarray as xr
 
+from shared.src.aqi.calculator import get_pollutant_index_level
 from shared.src.database.locations import AirQualityLocationType
 from etl.src.forecast.forecast_adapter import (
     ForecastData,
@@ -15,6 +19,7 @@ from etl.src.forecast.forecast_adapter import (
     _calc_aqi_2D,
     create_data_textures,
     PollutantType,
+    _create_texture_pool,
 )
 from shared.tests.util.mock_forecast_data import (
     single_level_data_set,
@@ -64,6 +69,12 @@ def test__transform__returns_correct_values(field, expected):
             assert data[field] == expected
 
 
+def test__transform__no_locations_returns_no_documents():
+    input_data = ForecastData(single_level_data_set, multi_level_data_set)
+
+    assert transform(input_data, []) == []
+
+
 def test__transform__returns_correctly_formatted_data():
     input_data = ForecastData(single_level_data_set, multi_level_data_set)
     expected_aqi_schema = {"type": "integer", "min": 1, "max": 6}
@@ -105,6 +116,78 @@ def test__transform__returns_correctly_formatted_data():
         assert validator(data) is True, f"{validator.errors}"
 
 
+def _transform_per_location(forecast_data, locations) -> list:
+    # Reference for transform: one location and one step at a time, scaling
+    # each value with Decimal as the forecast documents were first built
+    documents = []
+    valid_times = forecast_data.get_valid_time_values()
+    for location, data_by_pollutant in forecast_data.get_pollutant_data_for_locations(
+        locations, list(PollutantType)
+    ):
+        values_by_pollutant = {
+            pollutant_type: [float(Decimal(str(x)) * Decimal(10**9)) for x in data]
+            for pollutant_type, data in data_by_pollutant.items()
+        }
+        for i, step in enumerate(forecast_data.get_step_values()):
+            pollutant_data = {
+                pollutant_type.value: {
+                    "aqi_level": get_pollutant_index_level(values[i], pollutant_type),
+                    "value": values[i],
+                }
+                for pollutant_type, values in values_by_pollutant.items()
+            }
+            documents.append(
+                {
+                    "name": location["name"],
+                    "forecast_valid_time": datetime.fromtimestamp(
+                        valid_times[i], timezone.utc
+                    ),
+                    "forecast_range": int(step),
+                    "overall_aqi_level": max(
+                        data["aqi_level"] for data in pollutant_data.values()
+                    ),
+                    **pollutant_data,
+                }
+            )
+    return documents
+
+
+def test__transform__matches_per_location_calculation():
+    rng = np.random.default_rng(seed=1)
+    input_data = ForecastData(single_level_data_set, multi_level_data_set)
+    for dataset in [input_data._single_level_data, input_data._multi_level_data]:
+        for name in ["pm2p5", "pm10", "no2", "go3", "so2"]:
+            if name in dataset:
+                dataset[name] = dataset[name].copy(
+                    data=rng.uniform(0, 1.5e-6, dataset[name].shape)
+                )
+    locations = [
+        {
+            "name": f"City {i}",
+            "type": AirQualityLocationType.CITY,
+            "latitude": float(rng.uniform(-10, 10)),
+            "longitude": float(rng.uniform(0, 10)),
+        }
+        for i in range(20)
+    ]
+
+    results = transform(input_data, locations)
+    expected = _transform_per_location(input_data, locations)
+
+    assert len(results) == len(expected)
+    for result, expected_document in zip(results, expected):
+        for field in ["name", "forecast_valid_time", "forecast_range"]:
+            assert result[field] == expected_document[field]
+        assert result["overall_aqi_level"] == expected_document["overall_aqi_level"]
+        for pollutant_type in PollutantType:
+            result_data = result[pollutant_type.value]
+            expected_data = expected_document[pollutant_type.value]
+            assert result_data["aqi_level"] == expected_data["aqi_level"]
+            assert result_data["value"] == pytest.approx(
+                expected_data["value"], rel=1e-15
+            )
+
+
 @pytest.mark.parametrize(
     "arr, norm_min, norm_max, expected",
     [
@@ -191,6 +274,75 @@ def test__convert_data():
     assert rgb_data_array_aqi.shape == (11, 121, 1)
 
 
+def test__convert_data__time_steps_laid_out_side_by_side():
+    # Scale so values span the 0 - 1000 texture range rather than all clipping
+    input_data = gridded_data_single_level.assign(
+        pm10=gridded_data_single_level["pm10"] * 1e-6
+    )
+    rgb_data_array, _, _, _, num_lon, _ = _convert_data(input_data, "pm10")
+
+    for time_step in range(input_data.sizes["t"]):
+        expected = input_data["pm10"].isel(t=time_step).values * 1e9 / 1000.0 * 255
+        # Textures are encoded in float32, allow for truncation landing either side
+        np.testing.assert_allclose(
+            rgb_data_array[:, time_step * num_lon : (time_step + 1) * num_lon, 0],
+            np.floor(expected),
+            atol=1,
+        )
+
+
+def test__convert_data__wind_components_in_separate_channels():
+    rgb_data_array, _, _, _, num_lon, _ = _convert_data(
+        gridded_data_single_level, "winds_10m"
+    )
+
+    last_step = gridded_data_single_level.sizes["t"] - 1
+    for channel, component in enumerate(["u10", "v10"]):
+        expected = (
+            (gridded_data_single_level[component].isel(t=last_step).values + 50)
+            / 100
+            * 255
+        )
+        np.testing.assert_allclose(
+            rgb_data_array[:, last_step * num_lon :, channel],
+            np.floor(expected),
+            atol=1,
+        )
+    assert not rgb_data_array[:, :, 2].any()
+
+
+@pytest.mark.parametrize("variable", ["pm10", "winds_10m", "aqi"])
+def test__convert_data__chunked_data_matches_in_memory_data(variable):
+    input_data = xr.merge([gridded_data_single_level, gridded_data_multi_level])
+    input_data = input_data.assign(pm10=input_data["pm10"] * 1e-6)
+
+    expected, *_ = _convert_data(input_data, variable)
+    result, *_ = _convert_data(input_data.chunk({"t": 4}), variable)
+
+    np.testing.assert_array_equal(result, expected)
+
+
+def test__transform__lazy_forecast_data_matches_eager_forecast_data():
+    eager_data = ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+    with mock.patch.dict(
+        os.environ,
+        {"FORECAST_DATA_LOADING": "lazy", "FORECAST_MEMORY_LIMIT_MB": "0.0001"},
+    ):
+        lazy_data = ForecastData(
+            single_level_data_set.copy(deep=True),
+            multi_level_data_set.copy(deep=True),
+        )
+
+    assert lazy_data._single_level_data["pm10"].chunks is not None
+    # assert_equal treats NaN values as equal
+    np.testing.assert_equal(
+        transform(lazy_data, default_test_cities),
+        transform(eager_data, default_test_cities),
+    )
+
+
 @patch(
     "etl.src.forecast.forecast_adapter._process_variable",
     return_value=[
@@ -244,3 +396,89 @@ def test_create_data_textures(mock_process_variable):
         ), f"Document missing required keys: {doc.keys()}"
         print(doc)
         assert doc["texture_uri"] == "test_uri"
+
+
+def _create_cams_like_dataset(variables: dict) -> xr.Dataset:
+    rng = np.random.default_rng(seed=1)
+    steps = [0, 3, 6, 9, 12]
+    shape = (len(steps), 19, 36)
+    return xr.Dataset(
+        {
+            name: (
+                ("step", "latitude", "longitude"),
+                rng.random(shape, dtype=np.float32) * scale,
+                {"units": units},
+            )
+            for name, (scale, units) in variables.items()
+        },
+        coords={
+            "step": steps,
+            "time": default_time,
+            "valid_time": (
+                "step",
+                [default_time + step * 3600 for step in steps],
+                {"standard_name": "time"},
+            ),
+            "latitude": (
+                "latitude",
+                np.linspace(90, -90, 19),
+                {"units": "degrees_north"},
+            ),
+            "longitude": np.arange(0, 360, 10.0),
+        },
+    )
+
+
+def _create_textures_in_directory(output_directory):
+    forecast_data = ForecastData(
+        _create_cams_like_dataset(
+            {
+                "pm10": (1e-7, "kg m**-3"),
+                "pm2p5": (1e-7, "kg m**-3"),
+                "sp": (1e5, "Pa"),
+                "u10": (20, "m s**-1"),
+                "v10": (20, "m s**-1"),
+            }
+        ),
+        _create_cams_like_dataset(
+            {
+                "no2": (1e-7, "kg m**-3"),
+                "go3": (1e-7, "kg m**-3"),
+                "so2": (1e-7, "kg m**-3"),
+                "t": (300, "K"),
+            }
+        ),
+    )
+    with patch(
+        "etl.src.forecast.forecast_texture_storer._create_output_directory",
+        return_value=str(output_directory),
+    ):
+        return create_data_textures(forecast_data)
+
+
+@pytest.mark.parametrize("pool_type", ["thread", "process"])
+def test_create_data_textures__pool_matches_serial_output(tmp_path, pool_type):
+    serial_directory = tmp_path / "serial"
+    parallel_directory = tmp_path / pool_type
+    serial_directory.mkdir()
+    parallel_directory.mkdir()
+
+    serial_metadata = _create_textures_in_directory(serial_directory)
+    with mock.patch.dict(
+        os.environ, {"TEXTURE_WORKERS": "3", "TEXTURE_POOL_TYPE": pool_type}
+    ):
+        parallel_metadata = _create_textures_in_directory(parallel_directory)
+
+    assert len(parallel_metadata) == len(serial_metadata) == len(PollutantType) + 2
+    for serial_doc, parallel_doc in zip(serial_metadata, parallel_metadata):
+        serial_file = serial_doc.pop("texture_uri")
+        parallel_file = parallel_doc.pop("texture_uri")
+        assert parallel_doc == serial_doc
+        assert os.path.basename(parallel_file) == os.path.basename(serial_file)
+        with open(serial_file, "rb") as expected, open(parallel_file, "rb") as actual:
+            assert actual.read() == expected.read()
+
+
+def test_create_texture_pool__unknown_pool_type_raises_error():
+    with pytest.raises(ValueError):
+        _create_texture_pool(2, "cluster")
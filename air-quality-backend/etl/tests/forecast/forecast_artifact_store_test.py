@@ -0,0 +1,218 @@
+import os
+from datetime import datetime, timedelta, timezone
+from threading import Thread
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from etl.src.forecast.forecast_artifact_store import (
+    delete_artifacts_before,
+    get_artifact_directory,
+    lock_artifact,
+    publish_artifact,
+    read_artifact,
+)
+from etl.src.forecast.forecast_adapter import transform
+from etl.src.forecast.forecast_dao import fetch_forecast_data
+from etl.src.forecast.forecast_data import ForecastData, ForecastDataType
+from shared.tests.util.mock_forecast_data import (
+    default_test_cities,
+    default_time,
+    single_level_data_set,
+    multi_level_data_set,
+    with_cfgrib_time_attributes,
+)
+from shared.tests.util.mock_measurement import create_mock_measurement_document
+
+base_datetime = datetime(2024, 5, 20, 0)
+
+
+def _create_forecast_data() -> ForecastData:
+    return ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+
+
+def test__get_artifact_directory__ignores_lead_times_and_area(tmp_path):
+    request = {
+        "variable": ["ozone"],
+        "model_level": "137",
+        "leadtime_hour": ["0", "3"],
+    }
+
+    directory = get_artifact_directory(tmp_path, base_datetime, [request])
+
+    assert os.path.dirname(directory) == os.path.join(tmp_path, "2024-05-20_00")
+    assert directory == get_artifact_directory(
+        tmp_path,
+        base_datetime,
+        [{**request, "leadtime_hour": ["0"], "area": [10, -10, -10, 10]}],
+    )
+    assert directory != get_artifact_directory(
+        tmp_path, base_datetime, [{**request, "variable": ["nitrogen_dioxide"]}]
+    )
+    assert directory != get_artifact_directory(
+        tmp_path, datetime(2024, 5, 20, 12), [request]
+    )
+
+
+def test__lock_artifact__waits_for_other_holder(tmp_path):
+    directory = os.path.join(tmp_path, "2024-05-20_00", "key")
+    events = []
+
+    def hold_lock(name: str):
+        with lock_artifact(directory):
+            events.append(f"{name} acquired")
+            events.append(f"{name} released")
+
+    with lock_artifact(directory):
+        thread = Thread(target=hold_lock, args=["other"])
+        thread.start()
+        thread.join(timeout=0.2)
+        events.append("first released")
+    thread.join()
+
+    assert events == ["first released", "other acquired", "other released"]
+
+
+def test__read_artifact__missing_artifact_returns_none(tmp_path):
+    assert read_artifact(os.path.join(tmp_path, "missing"), 2) is None
+
+
+def test__publish_artifact__read_back_first_steps(tmp_path):
+    pytest.importorskip("netCDF4")
+    forecast_data = _create_forecast_data()
+    directory = os.path.join(tmp_path, "2024-05-20_00", "key")
+
+    publish_artifact(directory, forecast_data)
+    publish_artifact(directory, forecast_data)
+    result = read_artifact(directory, 1)
+
+    assert sorted(os.listdir(os.path.dirname(directory))) == ["key"]
+    assert read_artifact(directory, 100) is None
+    expected_dataset = forecast_data._single_level_data
+    result_dataset = result._single_level_data
+    assert result_dataset.sizes["step"] == 1
+    for variable in expected_dataset.data_vars:
+        np.testing.assert_array_equal(
+            result_dataset[variable].values,
+            expected_dataset[variable].isel(step=slice(0, 1)).values,
+        )
+
+
+def test__publish_artifact__times_read_back_as_grib_values(tmp_path):
+    pytest.importorskip("netCDF4")
+    forecast_data = ForecastData(
+        with_cfgrib_time_attributes(single_level_data_set),
+        with_cfgrib_time_attributes(multi_level_data_set),
+    )
+    directory = os.path.join(tmp_path, "2024-05-20_00", "key")
+    measurements = [
+        create_mock_measurement_document(
+            {
+                "location": {"type": "point", "coordinates": (5, -5)},
+                "measurement_date": datetime.fromtimestamp(default_time, timezone.utc)
+                + timedelta(hours=12),
+            }
+        )
+    ]
+    required = [ForecastDataType.TEMPERATURE, ForecastDataType.SURFACE_PRESSURE]
+
+    publish_artifact(directory, forecast_data)
+    result = read_artifact(directory, 2)
+
+    assert result.get_time_value() == default_time
+    assert result.get_step_values().tolist() == [0, 24]
+    np.testing.assert_equal(
+        transform(result, default_test_cities),
+        transform(forecast_data, default_test_cities),
+    )
+    assert result.enrich_in_situ_measurements(
+        measurements, required
+    ) == forecast_data.enrich_in_situ_measurements(measurements, required)
+
+
+def test__delete_artifacts_before__deletes_older_base_times(tmp_path):
+    for folder in ["2024-05-19_12", "2024-05-20_00", "2024-05-20_12", "other"]:
+        os.makedirs(os.path.join(tmp_path, folder, "key"))
+
+    delete_artifacts_before(tmp_path, datetime(2024, 5, 20, 6))
+
+    assert sorted(os.listdir(tmp_path)) == ["2024-05-20_12", "other"]
+
+
+def test__delete_artifacts_before__missing_store_is_ignored(tmp_path):
+    delete_artifacts_before(os.path.join(tmp_path, "missing"), base_datetime)
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__published_artifact_not_retrieved(tmp_path, mocker):
+    artifact = _create_forecast_data()
+    mock_read = mocker.patch(
+        "etl.src.forecast.forecast_dao.read_artifact", return_value=artifact
+    )
+    mock_fetch = mocker.patch("etl.src.forecast.forecast_dao._fetch_forecast_data")
+
+    with mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": str(tmp_path)}):
+        result = fetch_forecast_data(base_datetime, 2, [10, -10, -10, 10])
+
+    assert result is artifact
+    assert mock_read.call_args.args[1:] == (2, [10, -10, -10, 10])
+    mock_fetch.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__publishes_retrieved_global_data(tmp_path, mocker):
+    forecast_data = _create_forecast_data()
+    mocker.patch("etl.src.forecast.forecast_dao.read_artifact", return_value=None)
+    mocker.patch(
+        "etl.src.forecast.forecast_dao._fetch_forecast_data",
+        return_value=forecast_data,
+    )
+    mock_publish = mocker.patch("etl.src.forecast.forecast_dao.publish_artifact")
+
+    with mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": str(tmp_path)}):
+        result = fetch_forecast_data(base_datetime, 2)
+
+    assert result is forecast_data
+    mock_publish.assert_called_once()
+    assert mock_publish.call_args.args[1] is forecast_data
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__area_data_not_published(tmp_path, mocker):
+    forecast_data = _create_forecast_data()
+    mocker.patch("etl.src.forecast.forecast_dao.read_artifact", return_value=None)
+    mock_fetch = mocker.patch(
+        "etl.src.forecast.forecast_dao._fetch_forecast_data",
+        return_value=forecast_data,
+    )
+    mock_publish = mocker.patch("etl.src.forecast.forecast_dao.publish_artifact")
+
+    with mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": str(tmp_path)}):
+        result = fetch_forecast_data(base_datetime, 2, [10, -10, -10, 10])
+
+    assert result is forecast_data
+    mock_fetch.assert_called_once()
+    assert mock_fetch.call_args.args[1] == [10, -10, -10, 10]
+    mock_publish.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__publish_failure_still_returns_data(tmp_path, mocker):
+    forecast_data = _create_forecast_data()
+    mocker.patch("etl.src.forecast.forecast_dao.read_artifact", return_value=None)
+    mocker.patch(
+        "etl.src.forecast.forecast_dao._fetch_forecast_data",
+        return_value=forecast_data,
+    )
+    mocker.patch(
+        "etl.src.forecast.forecast_dao.publish_artifact",
+        side_effect=OSError("No space left on device"),
+    )
+
+    with mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": str(tmp_path)}):
+        result = fetch_forecast_data(base_datetime, 2)
+
+    assert result is forecast_data
@@ -0,0 +1,212 @@
+import os
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from etl.src.forecast import forecast_cache
+from etl.src.forecast.forecast_cache import (
+    ForecastCacheMetrics,
+    evict_least_recently_used,
+    get_cache_key,
+    read_forecast_data,
+    write_forecast_data,
+)
+from etl.src.forecast.forecast_adapter import transform
+from etl.src.forecast.forecast_dao import fetch_forecast_data
+from etl.src.forecast.forecast_data import ForecastData
+from shared.tests.util.mock_forecast_data import (
+    default_test_cities,
+    default_time,
+    single_level_data_set,
+    multi_level_data_set,
+    with_cfgrib_time_attributes,
+)
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch) -> ForecastCacheMetrics:
+    metrics = ForecastCacheMetrics()
+    monkeypatch.setattr(forecast_cache, "forecast_cache_metrics", metrics)
+    return metrics
+
+
+def _create_entry(cache_location, key: str, size: int, last_used: int):
+    for name in forecast_cache.DATASET_NAMES:
+        file = os.path.join(cache_location, f"{key}_{name}.nc")
+        with open(file, "wb") as f:
+            f.write(b"0" * size)
+        os.utime(file, (last_used, last_used))
+
+
+def _create_forecast_data() -> ForecastData:
+    return ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+
+
+def test__get_cache_key__identifies_requests():
+    request = {"date": "2024-06-04/2024-06-04", "variable": ["ozone"]}
+
+    key = get_cache_key([request])
+
+    assert key == get_cache_key([dict(reversed(request.items()))])
+    assert key != get_cache_key([{**request, "area": [10, -10, -10, 10]}])
+
+
+def test__evict_least_recently_used__evicts_oldest_entries(tmp_path, metrics):
+    _create_entry(tmp_path, "newest", 100, 3000)
+    _create_entry(tmp_path, "oldest", 100, 1000)
+    _create_entry(tmp_path, "middle", 100, 2000)
+
+    evict_least_recently_used(tmp_path, 400)
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "middle_multi_level.nc",
+        "middle_single_level.nc",
+        "newest_multi_level.nc",
+        "newest_single_level.nc",
+    ]
+    assert metrics.get_metrics()["evictions"] == 1
+
+
+def test__evict_least_recently_used__does_not_evict_kept_entry(tmp_path):
+    _create_entry(tmp_path, "kept", 100, 1000)
+    _create_entry(tmp_path, "other", 100, 2000)
+    with open(os.path.join(tmp_path, "unrelated.txt"), "w") as f:
+        f.write("0" * 1000)
+
+    evict_least_recently_used(tmp_path, 200, keep="kept")
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "kept_multi_level.nc",
+        "kept_single_level.nc",
+        "unrelated.txt",
+    ]
+
+
+def test__evict_least_recently_used__removes_abandoned_temporary_files(tmp_path):
+    _create_entry(tmp_path, "entry", 100, 1000)
+    abandoned = os.path.join(tmp_path, "other_single_level.nc.999999999.tmp")
+    in_progress = os.path.join(tmp_path, f"new_single_level.nc.{os.getpid()}.tmp")
+    for file in [abandoned, in_progress]:
+        with open(file, "wb") as f:
+            f.write(b"0" * 100)
+
+    evict_least_recently_used(tmp_path, 250)
+
+    # The write in progress counts towards the limit, so the entry is evicted
+    assert os.listdir(tmp_path) == [os.path.basename(in_progress)]
+
+
+def test__read_forecast_data__missing_entry_is_a_miss(tmp_path, metrics):
+    _create_entry(tmp_path, "partial", 100, 1000)
+    os.remove(os.path.join(tmp_path, "partial_multi_level.nc"))
+
+    assert read_forecast_data(tmp_path, "partial") is None
+    assert metrics.get_metrics() == {"hits": 0, "misses": 1, "evictions": 0}
+
+
+def test__write_forecast_data__read_back_with_converted_data(tmp_path, metrics):
+    pytest.importorskip("netCDF4")
+    forecast_data = _create_forecast_data()
+
+    written = write_forecast_data(tmp_path, "key", forecast_data)
+    result = read_forecast_data(tmp_path, "key")
+
+    assert metrics.get_metrics() == {"hits": 1, "misses": 0, "evictions": 0}
+    assert written._single_level_data["pm10"].encoding["source"].endswith(".nc")
+    for name in ["_single_level_data", "_multi_level_data"]:
+        expected_dataset = getattr(forecast_data, name)
+        result_dataset = getattr(result, name)
+        for variable in expected_dataset.data_vars:
+            np.testing.assert_array_equal(
+                result_dataset[variable].values, expected_dataset[variable].values
+            )
+        assert (
+            result_dataset["longitude"].values.tolist()
+            == expected_dataset["longitude"].values.tolist()
+        )
+
+
+def test__write_forecast_data__times_read_back_as_grib_values(tmp_path):
+    pytest.importorskip("netCDF4")
+    forecast_data = ForecastData(
+        with_cfgrib_time_attributes(single_level_data_set),
+        with_cfgrib_time_attributes(multi_level_data_set),
+    )
+
+    written = write_forecast_data(tmp_path, "key", forecast_data)
+    result = read_forecast_data(tmp_path, "key")
+
+    for cached_forecast_data in [written, result]:
+        assert cached_forecast_data.get_time_value() == default_time
+        assert cached_forecast_data.get_step_values().tolist() == [0, 24]
+        np.testing.assert_equal(
+            transform(cached_forecast_data, default_test_cities),
+            transform(forecast_data, default_test_cities),
+        )
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__cached_forecast_data_not_retrieved(
+    tmp_path, mocker, metrics
+):
+    cached_forecast_data = _create_forecast_data()
+    mock_read = mocker.patch(
+        "etl.src.forecast.forecast_dao.read_forecast_data",
+        return_value=cached_forecast_data,
+    )
+    mock_client = mocker.patch("cdsapi.Client")
+
+    with mock.patch.dict(os.environ, {"FORECAST_CACHE": str(tmp_path)}):
+        result = fetch_forecast_data(datetime(2024, 5, 20, 0), 2)
+
+    assert result is cached_forecast_data
+    mock_read.assert_called_once()
+    mock_client.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test__fetch_forecast_data__stores_retrieved_data_in_cache(
+    tmp_path, mocker, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("cdsapi.Client")
+    mocker.patch("os.remove")
+    mocker.patch(
+        "xarray.open_dataset",
+        side_effect=[single_level_data_set.copy(), multi_level_data_set.copy()],
+    )
+    mock_write = mocker.patch("etl.src.forecast.forecast_dao.write_forecast_data")
+    cache_location = str(tmp_path / "cache")
+
+    with mock.patch.dict(os.environ, {"FORECAST_CACHE": cache_location}):
+        result = fetch_forecast_data(datetime(2024, 5, 20, 0), 2)
+
+    mock_write.assert_called_once()
+    assert mock_write.call_args.args[0] == cache_location
+    assert isinstance(mock_write.call_args.args[2], ForecastData)
+    assert result is mock_write.return_value
+
+
+@mock.patch.dict(
+    os.environ, {"STORE_GRIB_FILES": "False", "FORECAST_DATA_LOADING": "lazy"}
+)
+def test__fetch_forecast_data__lazy_data_returned_from_cache_removes_files(
+    tmp_path, mocker, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("cdsapi.Client")
+    mock_remove = mocker.patch("os.remove")
+    mocker.patch(
+        "xarray.open_dataset",
+        side_effect=[single_level_data_set.copy(), multi_level_data_set.copy()],
+    )
+    mocker.patch("etl.src.forecast.forecast_dao.write_forecast_data")
+
+    with mock.patch.dict(os.environ, {"FORECAST_CACHE": str(tmp_path / "cache")}):
+        fetch_forecast_data(datetime(2024, 5, 20, 0), 2)
+
+    assert mock_remove.call_count == 2
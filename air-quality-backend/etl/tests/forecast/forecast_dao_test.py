@@ -1,10 +1,16 @@
+import gc
 import os
+import threading
 from unittest import mock
+import numpy as np
 import pytest
+import xarray as xr
 
 from datetime import datetime
 from unittest.mock import call, patch
 
+from etl.src.forecast import forecast_dao
+from etl.src.forecast.forecast_data import ForecastData
 from etl.src.forecast.forecast_dao import (
     CamsRequestDetails,
     fetch_forecast_data,
@@ -223,3 +229,189 @@ def test_fetch_forecast_data_does_remove_grib_files_by_default(
             call("multi_level_41_from_2024-05-20_00.grib"),
         ]
     )
+
+
+class StubCdsClient:
+    """Local stand in for cdsapi.Client, writing an empty file per retrieval"""
+
+    def __init__(self, on_retrieve=None):
+        self.on_retrieve = on_retrieve
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.retrieved = []
+
+    def __call__(self):
+        return self
+
+    def retrieve(self, name, request, target):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.on_retrieve is not None:
+                self.on_retrieve(request, target)
+            with open(target, "w"):
+                pass
+            with self.lock:
+                self.retrieved.append(target)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def stub_cds_client(mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(forecast_dao, "_cams_request_slots", None)
+
+    def create_client(on_retrieve=None):
+        client = StubCdsClient(on_retrieve)
+        mocker.patch("cdsapi.Client", new=client)
+        return client
+
+    return create_client
+
+
+def _open_dataset_by_file_name(file_name, **kwargs):
+    if file_name.startswith("single_level"):
+        return single_level_data_set
+    return multi_level_data_set
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test_fetch_forecast_data__requests_retrieved_concurrently(
+    stub_cds_client, mock_open_dataset
+):
+    both_requests_started = threading.Barrier(2, timeout=5)
+    client = stub_cds_client(lambda request, target: both_requests_started.wait())
+    mock_open_dataset.side_effect = _open_dataset_by_file_name
+
+    forecast_data = fetch_forecast_data(datetime(2024, 5, 20, 0))
+
+    assert client.max_in_flight == 2
+    assert forecast_data._single_level_data == single_level_data_set
+    assert forecast_data._multi_level_data == multi_level_data_set
+    assert not os.path.exists("single_level_41_from_2024-05-20_00.grib")
+    assert not os.path.exists("multi_level_41_from_2024-05-20_00.grib")
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "True"})
+def test_fetch_forecast_data__failed_request_does_not_stop_other_request(
+    stub_cds_client, mock_open_dataset
+):
+    def fail_multi_level(request, target):
+        if "model_level" in request:
+            raise RuntimeError("CDS request failed")
+
+    client = stub_cds_client(fail_multi_level)
+
+    with pytest.raises(RuntimeError, match="CDS request failed"):
+        fetch_forecast_data(datetime(2024, 5, 20, 0))
+
+    assert client.retrieved == ["single_level_41_from_2024-05-20_00.grib"]
+    assert os.path.exists("single_level_41_from_2024-05-20_00.grib")
+    mock_open_dataset.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "False"})
+def test_fetch_forecast_data__failed_request_removes_retrieved_files(
+    stub_cds_client, mock_open_dataset
+):
+    def fail_single_level(request, target):
+        if "model_level" not in request:
+            raise RuntimeError("CDS request failed")
+
+    stub_cds_client(fail_single_level)
+
+    with pytest.raises(RuntimeError, match="CDS request failed"):
+        fetch_forecast_data(datetime(2024, 5, 20, 0))
+
+    assert not os.path.exists("multi_level_41_from_2024-05-20_00.grib")
+
+
+@mock.patch.dict(
+    os.environ, {"STORE_GRIB_FILES": "False", "CAMS_MAX_CONCURRENT_REQUESTS": "1"}
+)
+def test_fetch_forecast_data__concurrent_requests_limited_when_configured(
+    stub_cds_client, mock_open_dataset
+):
+    client = stub_cds_client()
+    mock_open_dataset.side_effect = _open_dataset_by_file_name
+
+    threads = [
+        threading.Thread(target=fetch_forecast_data, args=(datetime(2024, 5, day, 0),))
+        for day in [18, 19, 20]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(client.retrieved) == 6
+    assert client.max_in_flight == 1
+
+
+@mock.patch.dict(os.environ, {"STORE_GRIB_FILES": "True"})
+def test_fetch_forecast_data__area_requested_and_applied(
+    stub_cds_client, mock_open_dataset
+):
+    area = [5, -5, -10, 5]
+    requests = []
+    client = stub_cds_client(lambda request, target: requests.append(request))
+    mock_open_dataset.side_effect = _open_dataset_by_file_name
+
+    forecast_data = fetch_forecast_data(datetime(2024, 5, 20, 0), 2, area)
+
+    assert [request["area"] for request in requests] == [area, area]
+    assert sorted(client.retrieved) == [
+        "multi_level_2_from_2024-05-20_00_area_5_-5_-10_5.grib",
+        "single_level_2_from_2024-05-20_00_area_5_-5_-10_5.grib",
+    ]
+    for dataset in [forecast_data._single_level_data, forecast_data._multi_level_data]:
+        assert dataset["latitude"].values.tolist() == [-10, 0]
+        assert dataset["longitude"].values.tolist() == [0]
+
+
+@mock.patch.dict(
+    os.environ, {"STORE_GRIB_FILES": "False", "FORECAST_DATA_LOADING": "lazy"}
+)
+def test_fetch_forecast_data__lazy_data_files_removed_once_released(
+    tmp_path, monkeypatch, mocker
+):
+    monkeypatch.chdir(tmp_path)
+    files = [
+        "single_level_2_from_2024-05-20_00.grib",
+        "multi_level_2_from_2024-05-20_00.grib",
+    ]
+    # Already retrieved, so no CDS request is made
+    single_level_data_set.to_netcdf(files[0], engine="scipy")
+    multi_level_data_set.to_netcdf(files[1], engine="scipy")
+    mocker.patch.object(
+        forecast_dao,
+        "open_cams_file",
+        side_effect=lambda file: xr.open_dataset(
+            file, engine="scipy", decode_times=False
+        ),
+    )
+    expected = ForecastData(single_level_data_set, multi_level_data_set)
+
+    # A file cache of one forces each read to open the file again by path, as
+    # cfgrib does
+    with xr.set_options(file_cache_maxsize=1):
+        forecast_data = fetch_forecast_data(datetime(2024, 5, 20, 0), 2)
+        assert forecast_data.is_lazy()
+        single_level_step = forecast_data._single_level_data["pm10"].isel(step=1)
+        multi_level_step = forecast_data._multi_level_data["no2"].isel(step=1)
+        np.testing.assert_allclose(
+            single_level_step.values,
+            expected._single_level_data["pm10"].isel(step=1).values,
+        )
+        np.testing.assert_allclose(
+            multi_level_step.values,
+            expected._multi_level_data["no2"].isel(step=1).values,
+        )
+
+    del forecast_data, single_level_step, multi_level_step
+    gc.collect()
+    assert not any(os.path.exists(file) for file in files)
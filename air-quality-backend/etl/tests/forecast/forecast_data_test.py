@@ -1,5 +1,9 @@
 import datetime
+from decimal import Decimal
+import os
+from unittest import mock
 
+import numpy as np
 import pytest
 import xarray
 
@@ -7,10 +11,16 @@ from shared.src.aqi.pollutant_type import PollutantType
 from shared.src.database.locations import AirQualityLocation, AirQualityLocationType
 from etl.src.forecast.forecast_data import (
     convert_east_only_longitude_to_east_west,
+    convert_east_only_longitudes_to_east_west,
+    convert_longitude,
+    get_area_for_locations,
+    get_areas_for_locations,
+    get_step_chunk_size,
     is_single_level,
     convert_to_forecast_data_type,
     ForecastData,
     ForecastDataType,
+    RegionalForecastData,
 )
 from shared.src.database.in_situ import InSituMeasurement
 from shared.tests.util.mock_forecast_data import (
@@ -41,6 +51,47 @@ def test__convert_east_only_longitude_to_east_west__converts_correctly(
     assert convert_east_only_longitude_to_east_west(longitude) == expected
 
 
+def _convert_longitude_with_decimal(longitude_value: float) -> float:
+    # Reference for the longitude conversion, as first written with Decimal
+    if 180 < longitude_value <= 360:
+        return float(Decimal(str(longitude_value)) - Decimal("360"))
+    return longitude_value
+
+
+@pytest.mark.parametrize(
+    "longitudes",
+    [
+        np.arange(0, 3600, 4) / 10,  # CAMS global 0.4 degree grid
+        np.arange(0, 1440) * 0.25,
+        np.arange(0, 2880) * 0.125,
+        np.arange(-1800, 1800) / 10,
+        np.round(np.random.default_rng(seed=1).uniform(-180, 360, 1000), 4),
+    ],
+    ids=["0.4", "0.25", "0.125", "east_west", "random"],
+)
+def test__convert_east_only_longitudes_to_east_west__matches_decimal_conversion(
+    longitudes: np.ndarray,
+):
+    expected = [_convert_longitude_with_decimal(lon) for lon in longitudes.tolist()]
+
+    result = convert_east_only_longitudes_to_east_west(longitudes)
+
+    assert result.tolist() == expected
+
+
+def test__convert_longitude__converts_and_sorts_longitudes():
+    dataset = xarray.Dataset(
+        data_vars=dict(value=("longitude", [1.0, 2.0, 3.0, 4.0])),
+        coords=dict(longitude=[0.0, 179.6, 180.4, 359.6]),
+    )
+
+    result = convert_longitude(dataset)
+
+    assert result["longitude"].values.tolist() == [-179.6, -0.4, 0.0, 179.6]
+    assert result["value"].values.tolist() == [3.0, 4.0, 1.0, 2.0]
+    assert result["longitude"].attrs["units"] == "degrees_east"
+
+
 @pytest.mark.parametrize(
     "forecast_data_type, expected",
     [
@@ -146,6 +197,41 @@ def test__get_pollutant_data_for_locations__interpolates_correctly(
     assert result == expected_results
 
 
+def test__get_pollutant_values_for_locations__returns_location_pollutant_step():
+    forecast_data = ForecastData(single_level_data_set, multi_level_data_set)
+    locations = [
+        {"name": "A", "type": "city", "latitude": -5.0, "longitude": 5.0},
+        {"name": "B", "type": "city", "latitude": 5.0, "longitude": 2.5},
+        {"name": "C", "type": "city", "latitude": 0.0, "longitude": 0.0},
+    ]
+    pollutant_types = list(PollutantType)
+
+    result = forecast_data.get_pollutant_values_for_locations(
+        locations, pollutant_types
+    )
+
+    steps = forecast_data.get_step_values().size
+    assert result.shape == (len(locations), len(pollutant_types), steps)
+    for i, location in enumerate(locations):
+        for j, pollutant_type in enumerate(pollutant_types):
+            name = convert_to_forecast_data_type(pollutant_type).value
+            dataset = forecast_data.get_data_set(ForecastDataType(name))
+            expected = dataset[name].interp(
+                latitude=location["latitude"], longitude=location["longitude"]
+            )
+            np.testing.assert_array_equal(result[i, j], expected.values)
+
+
+def test__get_pollutant_values_for_locations__no_locations_returns_empty():
+    forecast_data = ForecastData(single_level_data_set, multi_level_data_set)
+    pollutant_types = list(PollutantType)
+
+    result = forecast_data.get_pollutant_values_for_locations([], pollutant_types)
+
+    steps = forecast_data.get_step_values().size
+    assert result.shape == (0, len(pollutant_types), steps)
+
+
 def test__enrich_in_situ_measurements__interpolates_correctly():
     single_level = single_level_data_set
     multi_level = multi_level_data_set
@@ -257,3 +343,197 @@ def test__enrich_in_situ_measurements__duplicate_latitude_functions_correctly():
     assert result[1][0] == in_situ_measurements[1]
     assert result[1][1][ForecastDataType.TEMPERATURE] == 20
     assert result[1][1][ForecastDataType.SURFACE_PRESSURE] == pytest.approx(0.2)
+
+
+def test__get_values_for_measurements__matches_interpolation_at_each_point():
+    forecast_data = ForecastData(single_level_data_set, multi_level_data_set)
+    rng = np.random.default_rng(seed=1)
+    initial_date = datetime.datetime.fromtimestamp(default_time)
+    in_situ_measurements: list[InSituMeasurement] = [
+        create_mock_measurement_document(
+            {
+                "location": {
+                    "type": "point",
+                    "coordinates": (
+                        float(rng.uniform(0, 10)),
+                        float(rng.uniform(-10, 10)),
+                    ),
+                },
+                "measurement_date": initial_date
+                + datetime.timedelta(hours=int(rng.integers(0, 25))),
+            }
+        )
+        for _ in range(50)
+    ]
+    required = [ForecastDataType.TEMPERATURE, ForecastDataType.SURFACE_PRESSURE]
+
+    result = forecast_data.get_values_for_measurements(in_situ_measurements, required)
+
+    for forecast_data_type in required:
+        assert result[forecast_data_type].shape == (len(in_situ_measurements),)
+        dataset = forecast_data.get_data_set(forecast_data_type).swap_dims(
+            {"step": "valid_time"}
+        )
+        expected = [
+            dataset[forecast_data_type.value]
+            .interp(
+                longitude=measurement["location"]["coordinates"][0],
+                latitude=measurement["location"]["coordinates"][1],
+                valid_time=measurement["measurement_date"].timestamp(),
+            )
+            .item()
+            for measurement in in_situ_measurements
+        ]
+        np.testing.assert_allclose(result[forecast_data_type], expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize(
+    "coordinates, margin, expected",
+    [
+        ([(53.3, -6.3)], 1.0, [54.3, -7.3, 52.3, -5.3]),
+        ([(53.3, -6.3), (-33.9, 151.2)], 0.0, [53.3, -6.3, -33.9, 151.2]),
+        ([(89.5, -179.5), (-89.5, 179.5)], 1.0, [90.0, -180.0, -90.0, 180.0]),
+    ],
+)
+def test__get_area_for_locations__returns_bounding_box_with_margin(
+    coordinates, margin, expected
+):
+    locations = [
+        {"name": "A", "type": "city", "latitude": lat, "longitude": lon}
+        for lat, lon in coordinates
+    ]
+
+    assert get_area_for_locations(locations, margin) == pytest.approx(expected)
+
+
+def _locations(coordinates: list[tuple[float, float]]) -> list[AirQualityLocation]:
+    return [
+        {"name": f"{lat}, {lon}", "type": "city", "latitude": lat, "longitude": lon}
+        for lat, lon in coordinates
+    ]
+
+
+def test__get_areas_for_locations__nearby_locations_share_an_area():
+    locations = _locations([(0.0, 0.0), (1.0, 1.0), (50.0, 100.0)])
+
+    areas = get_areas_for_locations(locations, 1.0, 4)
+
+    assert sorted(areas) == [[2.0, -1.0, -1.0, 2.0], [51.0, 99.0, 49.0, 101.0]]
+
+
+def test__get_areas_for_locations__limited_to_max_areas():
+    locations = _locations([(0.0, 0.0), (50.0, 100.0), (-40.0, -60.0)])
+
+    assert len(get_areas_for_locations(locations, 1.0, 3)) == 3
+    areas = get_areas_for_locations(locations, 1.0, 2)
+
+    assert len(areas) == 2
+    for location in locations:
+        assert any(
+            south <= location["latitude"] <= north
+            and west <= location["longitude"] <= east
+            for north, west, south, east in areas
+        )
+
+
+def test__regional_forecast_data__enrich_matches_forecast_data_per_area():
+    areas = [[10.0, -10.0, -10.0, 0.0], [10.0, 0.0, -10.0, 10.0]]
+    regional_forecast_data = RegionalForecastData(
+        [
+            (area, ForecastData(single_level_data_set, multi_level_data_set, area))
+            for area in areas
+        ]
+    )
+    measurement_date = datetime.datetime.fromtimestamp(
+        default_time, datetime.timezone.utc
+    ) + datetime.timedelta(hours=12)
+    in_situ_measurements = [
+        create_mock_measurement_document(
+            {
+                "location": {"type": "point", "coordinates": coordinates},
+                "measurement_date": measurement_date,
+            }
+        )
+        for coordinates in [(5, 5), (-5, -5), (2.5, -7.5), (-12, 0)]
+    ]
+    required = [ForecastDataType.TEMPERATURE, ForecastDataType.SURFACE_PRESSURE]
+
+    result = regional_forecast_data.enrich_in_situ_measurements(
+        in_situ_measurements, required
+    )
+
+    assert regional_forecast_data.get_area_indices(in_situ_measurements).tolist() == [
+        1,
+        0,
+        1,
+        0,
+    ]
+    expected = ForecastData(
+        single_level_data_set, multi_level_data_set
+    ).enrich_in_situ_measurements(in_situ_measurements, required)
+    np.testing.assert_equal(result, expected)
+
+
+def test__forecast_data__area_crops_grid_without_changing_values():
+    locations = [
+        {"name": "A", "type": "city", "latitude": -5.0, "longitude": 5.0},
+        {"name": "B", "type": "city", "latitude": -2.5, "longitude": 7.5},
+    ]
+    global_data = ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+
+    cropped_data = ForecastData(
+        single_level_data_set.copy(deep=True),
+        multi_level_data_set.copy(deep=True),
+        area=get_area_for_locations(locations, 5.0),
+    )
+
+    for dataset in [cropped_data._single_level_data, cropped_data._multi_level_data]:
+        assert dataset["latitude"].values.tolist() == [-10, 0]
+        assert dataset["longitude"].values.tolist() == [0, 10]
+    np.testing.assert_array_equal(
+        cropped_data.get_pollutant_values_for_locations(locations, list(PollutantType)),
+        global_data.get_pollutant_values_for_locations(locations, list(PollutantType)),
+    )
+
+
+@pytest.mark.parametrize(
+    "environment, expected",
+    [
+        ({}, None),
+        ({"FORECAST_DATA_LOADING": "eager"}, None),
+        ({"FORECAST_DATA_LOADING": "lazy", "FORECAST_MEMORY_LIMIT_MB": "0.001"}, 2),
+        (
+            {"FORECAST_DATA_LOADING": "lazy", "FORECAST_MEMORY_LIMIT_MB": "0.0001"},
+            1,
+        ),
+    ],
+)
+def test__get_step_chunk_size__sized_by_memory_limit(environment, expected):
+    datasets = [single_level_data_set, multi_level_data_set]
+    with mock.patch.dict(os.environ, environment, clear=True):
+        assert get_step_chunk_size(datasets) == expected
+
+
+def test__get_step_chunk_size__invalid_loading_raises_error():
+    with mock.patch.dict(os.environ, {"FORECAST_DATA_LOADING": "sometimes"}):
+        with pytest.raises(ValueError):
+            get_step_chunk_size([single_level_data_set])
+
+
+def test__forecast_data__lazy_loading_defers_unit_conversion():
+    with mock.patch.dict(os.environ, {"FORECAST_DATA_LOADING": "lazy"}):
+        forecast_data = ForecastData(
+            single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+        )
+    eager_data = ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+
+    for name in ["pm10", "pm2p5"]:
+        lazy_values = forecast_data._single_level_data[name]
+        assert lazy_values.chunks is not None
+        np.testing.assert_array_equal(
+            lazy_values.values, eager_data._single_level_data[name].values
+        )
@@ -1,7 +1,16 @@
+import gc
+import os
+import threading
+import time
+import weakref
 from datetime import datetime
-from unittest.mock import patch
+from multiprocessing.pool import ThreadPool
+from unittest import mock
+from unittest.mock import call, patch
 
-from etl.src.forecast.forecast_orchestrator import process_forecast
+import pytest
+
+from etl.src.forecast.forecast_orchestrator import process_forecast, process_forecasts
 from etl.src.forecast.forecast_data import ForecastData
 from shared.tests.util.mock_forecast_data import (
     single_level_data_set,
@@ -46,3 +55,217 @@ def test__process_forecast__correct_mocks_used(
     mock_insert_forecast.assert_called_with(transformed_forecast_data)
     mock_create_textures.assert_called_with(forecast_data)
     mock_insert_textures.assert_called_with(textures)
+
+
+base_dates = [
+    datetime(2024, 6, 1, 0, 0, 0, 0),
+    datetime(2024, 6, 1, 12, 0, 0, 0),
+    datetime(2024, 6, 2, 0, 0, 0, 0),
+    datetime(2024, 6, 2, 12, 0, 0, 0),
+    datetime(2024, 6, 3, 0, 0, 0, 0),
+]
+
+
+class ForecastHoldingTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.held = 0
+        self.max_held = 0
+
+    def fetch(self, base_date):
+        with self.lock:
+            self.held += 1
+            self.max_held = max(self.max_held, self.held)
+        return base_date
+
+    def release(self, *args):
+        with self.lock:
+            self.held -= 1
+
+
+@patch("etl.src.forecast.forecast_orchestrator.fetch_forecast_data")
+@patch("etl.src.forecast.forecast_orchestrator.transform")
+@patch("etl.src.forecast.forecast_orchestrator.insert_data")
+@patch("etl.src.forecast.forecast_orchestrator.create_data_textures")
+@patch("etl.src.forecast.forecast_orchestrator.insert_textures")
+def test__process_forecasts__base_dates_loaded_in_order(
+    mock_insert_textures,
+    mock_create_textures,
+    mock_insert_forecast,
+    mock_transform_forecast,
+    mock_fetch_forecast,
+):
+    cities = [create_test_city("Test", 90, 90)]
+    mock_fetch_forecast.side_effect = lambda base_date: base_date
+
+    process_forecasts(cities, base_dates, 3)
+
+    assert mock_transform_forecast.call_args_list == [
+        call(base_date, cities) for base_date in base_dates
+    ]
+    assert mock_create_textures.call_args_list == [
+        call(base_date) for base_date in base_dates
+    ]
+    assert mock_insert_forecast.call_count == len(base_dates)
+    assert mock_insert_textures.call_count == len(base_dates)
+
+
+@patch("etl.src.forecast.forecast_orchestrator.fetch_forecast_data")
+@patch("etl.src.forecast.forecast_orchestrator.transform")
+@patch("etl.src.forecast.forecast_orchestrator.insert_data")
+@patch("etl.src.forecast.forecast_orchestrator.create_data_textures")
+@patch("etl.src.forecast.forecast_orchestrator.insert_textures")
+def test__process_forecasts__next_base_date_extracted_while_loading(
+    mock_insert_textures,
+    mock_create_textures,
+    mock_insert_forecast,
+    mock_transform_forecast,
+    mock_fetch_forecast,
+):
+    next_date_extracted = threading.Event()
+
+    def fetch(base_date):
+        if base_date == base_dates[1]:
+            next_date_extracted.set()
+        return base_date
+
+    def transform(forecast_data, cities):
+        if forecast_data == base_dates[0]:
+            assert next_date_extracted.wait(timeout=5)
+        return []
+
+    mock_fetch_forecast.side_effect = fetch
+    mock_transform_forecast.side_effect = transform
+
+    process_forecasts([], base_dates[:2], 2)
+
+    assert mock_insert_textures.call_count == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+@patch("etl.src.forecast.forecast_orchestrator.fetch_forecast_data")
+@patch("etl.src.forecast.forecast_orchestrator.transform")
+@patch("etl.src.forecast.forecast_orchestrator.insert_data")
+@patch("etl.src.forecast.forecast_orchestrator.create_data_textures")
+@patch("etl.src.forecast.forecast_orchestrator.insert_textures")
+def test__process_forecasts__forecast_data_held_bounded_by_workers(
+    mock_insert_textures,
+    mock_create_textures,
+    mock_insert_forecast,
+    mock_transform_forecast,
+    mock_fetch_forecast,
+    workers,
+):
+    tracker = ForecastHoldingTracker()
+    mock_fetch_forecast.side_effect = tracker.fetch
+    mock_insert_textures.side_effect = tracker.release
+
+    process_forecasts([], base_dates, workers)
+
+    assert tracker.held == 0
+    assert tracker.max_held <= workers
+
+
+class ExtractedForecast:
+    pass
+
+
+def _all_released(references: list[weakref.ref], timeout: float = 5) -> bool:
+    # Pool threads drop their own references shortly after handing results over
+    deadline = time.monotonic() + timeout
+    while True:
+        gc.collect()
+        if all(reference() is None for reference in references):
+            return True
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+
+
+def test__process_forecasts__loaded_forecast_data_released_before_next_extraction(
+    monkeypatch,
+):
+    # Plain functions, as mocks would keep the forecast data in their call args
+    extracted = []
+    released_before_extraction = []
+
+    def fetch(base_date):
+        forecast_data = ExtractedForecast()
+        extracted.append(weakref.ref(forecast_data))
+        return forecast_data
+
+    class CheckingThreadPool(ThreadPool):
+        def apply_async(self, *args, **kwargs):
+            released_before_extraction.append(_all_released(extracted))
+            return super().apply_async(*args, **kwargs)
+
+    orchestrator = "etl.src.forecast.forecast_orchestrator"
+    monkeypatch.setattr(f"{orchestrator}.ThreadPool", CheckingThreadPool)
+    monkeypatch.setattr(f"{orchestrator}.fetch_forecast_data", fetch)
+    monkeypatch.setattr(f"{orchestrator}.transform", lambda *args: [])
+    monkeypatch.setattr(f"{orchestrator}.insert_data", lambda *args: None)
+    monkeypatch.setattr(f"{orchestrator}.create_data_textures", lambda *args: [])
+    monkeypatch.setattr(f"{orchestrator}.insert_textures", lambda *args: None)
+    monkeypatch.delenv("FORECAST_ARTIFACT_STORE", raising=False)
+
+    process_forecasts([], base_dates, 1)
+
+    assert released_before_extraction == [True] * len(base_dates)
+
+
+@patch("etl.src.forecast.forecast_orchestrator.fetch_forecast_data")
+@patch("etl.src.forecast.forecast_orchestrator.transform")
+@patch("etl.src.forecast.forecast_orchestrator.insert_data")
+@patch("etl.src.forecast.forecast_orchestrator.create_data_textures")
+@patch("etl.src.forecast.forecast_orchestrator.insert_textures")
+def test__process_forecasts__extraction_failure_stops_processing(
+    mock_insert_textures,
+    mock_create_textures,
+    mock_insert_forecast,
+    mock_transform_forecast,
+    mock_fetch_forecast,
+):
+    def fetch(base_date):
+        if base_date == base_dates[1]:
+            raise RuntimeError("CDS request failed")
+        return base_date
+
+    mock_fetch_forecast.side_effect = fetch
+
+    with pytest.raises(RuntimeError, match="CDS request failed"):
+        process_forecasts([], base_dates, 2)
+
+    mock_create_textures.assert_called_once_with(base_dates[0])
+
+
+def test__process_forecasts__invalid_workers_raises_error():
+    with pytest.raises(ValueError, match="at least 1"):
+        process_forecasts([], base_dates, 0)
+
+
+@patch("etl.src.forecast.forecast_orchestrator.fetch_forecast_data")
+@patch("etl.src.forecast.forecast_orchestrator.transform")
+@patch("etl.src.forecast.forecast_orchestrator.insert_data")
+@patch("etl.src.forecast.forecast_orchestrator.create_data_textures")
+@patch("etl.src.forecast.forecast_orchestrator.insert_textures")
+@patch("etl.src.forecast.forecast_orchestrator.store_meteorological_series")
+def test__process_forecast__stores_meteorological_series_in_artifact_store(
+    mock_store_series,
+    mock_insert_textures,
+    mock_create_textures,
+    mock_insert_forecast,
+    mock_transform_forecast,
+    mock_fetch_forecast,
+):
+    cities = [create_test_city("Test", 90, 90)]
+    base_date = datetime(2024, 6, 1, 12, 0, 0, 0)
+
+    process_forecast(cities, base_date)
+    mock_store_series.assert_not_called()
+
+    with mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": "/artifacts"}):
+        process_forecast(cities, base_date)
+
+    mock_store_series.assert_called_once_with(
+        "/artifacts", mock_fetch_forecast.return_value, cities
+    )
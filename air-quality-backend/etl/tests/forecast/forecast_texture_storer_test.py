@@ -8,7 +8,7 @@ from unittest.mock import patch
 from etl.src.forecast.forecast_texture_storer import (
     _chunk_data_array,
     _create_output_directory,
-    _write_texture_to_disk,
+    write_texture_to_disk,
     save_data_textures,
     delete_data_textures_before,
 )
@@ -91,7 +91,7 @@ def test__write_texture_to_disk(mock_save):
     total_chunks = 3
     file_format = "png"
 
-    output_file = _write_texture_to_disk(
+    output_file = write_texture_to_disk(
         rgb_data_array,
         output_directory,
         forecast_date,
@@ -110,7 +110,7 @@ def test__write_texture_to_disk(mock_save):
 
 @patch("etl.src.forecast.forecast_texture_storer._chunk_data_array")
 @patch("etl.src.forecast.forecast_texture_storer._create_output_directory")
-@patch("etl.src.forecast.forecast_texture_storer._write_texture_to_disk")
+@patch("etl.src.forecast.forecast_texture_storer.write_texture_to_disk")
 def test__save_data_textures(
     mock_write_texture_to_disk, mock_create_output_directory, mock_chunk_data_array
 ):
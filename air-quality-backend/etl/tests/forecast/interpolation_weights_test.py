@@ -0,0 +1,147 @@
+import os
+from unittest import mock
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from etl.src.forecast import interpolation_weights
+from etl.src.forecast.interpolation_weights import (
+    calculate_interpolation_weights,
+    get_interpolation_weights,
+    get_interpolation_weights_key,
+)
+
+# CAMS latitudes run from north to south
+grid_latitudes = np.arange(10.0, -10.5, -2.5)
+grid_longitudes = np.arange(-20.0, 20.5, 5.0)
+
+
+@pytest.fixture(autouse=True)
+def clear_cached_weights():
+    with patch.dict(interpolation_weights._cached_weights, clear=True):
+        yield
+
+
+def _create_grid(steps: int = 3, seed: int = 1) -> xr.DataArray:
+    rng = np.random.default_rng(seed=seed)
+    values = rng.uniform(0, 100, (steps, len(grid_latitudes), len(grid_longitudes)))
+    values[1, 4, 4] = np.nan
+    return xr.DataArray(
+        values,
+        dims=["step", "latitude", "longitude"],
+        coords=dict(
+            step=range(steps), latitude=grid_latitudes, longitude=grid_longitudes
+        ),
+    )
+
+
+def _points() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed=2)
+    latitudes = np.concatenate(
+        # Random points, grid nodes, grid edges and points outside the grid
+        [rng.uniform(-10, 10, 50), [0.0, 10.0, -10.0, 2.5, 5.0, 11.0, 1.0]]
+    )
+    longitudes = np.concatenate(
+        [rng.uniform(-20, 20, 50), [0.0, 20.0, -20.0, 5.0, 21.0, 1.0, 0.0]]
+    )
+    return latitudes, longitudes
+
+
+def test__calculate_interpolation_weights__matches_xarray_interpolation():
+    grid = _create_grid()
+    latitudes, longitudes = _points()
+
+    weights = calculate_interpolation_weights(
+        grid_latitudes, grid_longitudes, latitudes, longitudes
+    )
+    result = weights.apply(grid.values)
+
+    expected = grid.interp(
+        latitude=xr.DataArray(latitudes, dims="points"),
+        longitude=xr.DataArray(longitudes, dims="points"),
+        method="linear",
+    ).transpose("points", ...)
+    assert result.shape == (len(latitudes), 3)
+    np.testing.assert_allclose(result, expected.values, rtol=1e-12, equal_nan=True)
+
+
+def test__get_interpolation_weights_key__changes_with_grid_and_points():
+    latitudes, longitudes = _points()
+    key = get_interpolation_weights_key(
+        grid_latitudes, grid_longitudes, latitudes, longitudes
+    )
+
+    assert key == get_interpolation_weights_key(
+        grid_latitudes.copy(), grid_longitudes.copy(), latitudes, longitudes
+    )
+    assert key != get_interpolation_weights_key(
+        grid_latitudes, grid_longitudes + 0.1, latitudes, longitudes
+    )
+    assert key != get_interpolation_weights_key(
+        grid_latitudes, grid_longitudes, latitudes[:-1], longitudes[:-1]
+    )
+
+
+def test__get_interpolation_weights__calculates_once_per_key():
+    latitudes, longitudes = _points()
+    with patch(
+        "etl.src.forecast.interpolation_weights.calculate_interpolation_weights",
+        wraps=calculate_interpolation_weights,
+    ) as mock_calculate:
+        first = get_interpolation_weights(
+            grid_latitudes, grid_longitudes, latitudes, longitudes
+        )
+        second = get_interpolation_weights(
+            grid_latitudes, grid_longitudes, latitudes, longitudes
+        )
+        get_interpolation_weights(
+            grid_latitudes, grid_longitudes, latitudes[:5], longitudes[:5]
+        )
+
+    assert first is second
+    assert mock_calculate.call_count == 2
+
+
+def test__get_interpolation_weights__persists_weights_to_cache(tmp_path):
+    latitudes, longitudes = _points()
+    with mock.patch.dict(os.environ, {"INTERPOLATION_WEIGHTS_CACHE": str(tmp_path)}):
+        calculated = get_interpolation_weights(
+            grid_latitudes, grid_longitudes, latitudes, longitudes
+        )
+        interpolation_weights._cached_weights.clear()
+        with patch(
+            "etl.src.forecast.interpolation_weights.calculate_interpolation_weights"
+        ) as mock_calculate:
+            loaded = get_interpolation_weights(
+                grid_latitudes, grid_longitudes, latitudes, longitudes
+            )
+
+    mock_calculate.assert_not_called()
+    assert len(os.listdir(tmp_path)) == 1
+    np.testing.assert_array_equal(loaded.indices, calculated.indices)
+    np.testing.assert_array_equal(loaded.weights, calculated.weights)
+
+
+def test__get_interpolation_weights__ignores_cache_file_with_other_key(tmp_path):
+    latitudes, longitudes = _points()
+    key = get_interpolation_weights_key(
+        grid_latitudes, grid_longitudes, latitudes, longitudes
+    )
+    np.savez(
+        os.path.join(tmp_path, f"interpolation_weights_{key}.npz"),
+        key="other",
+        indices=np.zeros((len(latitudes), 4), dtype=int),
+        weights=np.zeros((len(latitudes), 4)),
+    )
+
+    with mock.patch.dict(os.environ, {"INTERPOLATION_WEIGHTS_CACHE": str(tmp_path)}):
+        weights = get_interpolation_weights(
+            grid_latitudes, grid_longitudes, latitudes, longitudes
+        )
+
+    expected = calculate_interpolation_weights(
+        grid_latitudes, grid_longitudes, latitudes, longitudes
+    )
+    np.testing.assert_array_equal(weights.weights, expected.weights)
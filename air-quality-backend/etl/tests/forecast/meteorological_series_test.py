@@ -0,0 +1,218 @@
+import datetime
+import os
+from unittest import mock
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+import xarray
+
+from etl.src.forecast.forecast_artifact_store import publish_artifact, read_artifact
+from etl.src.forecast.forecast_data import ForecastData, ForecastDataType
+from etl.src.forecast.meteorological_series import (
+    SERIES_DATA_TYPES,
+    create_meteorological_series,
+    get_cells_for_locations,
+    get_series_file,
+    read_meteorological_series,
+    store_meteorological_series,
+    write_meteorological_series,
+)
+from shared.tests.util.mock_forecast_data import (
+    default_test_cities,
+    default_time,
+    default_valid_time,
+    single_level_data_set,
+    multi_level_data_set,
+    with_cfgrib_time_attributes,
+)
+from shared.tests.util.mock_measurement import create_mock_measurement_document
+
+grid_latitudes = np.array([-10.0, 0.0, 10.0])
+grid_longitudes = np.array([-10.0, 0.0, 10.0])
+
+
+def _create_forecast_data() -> ForecastData:
+    return ForecastData(
+        single_level_data_set.copy(deep=True), multi_level_data_set.copy(deep=True)
+    )
+
+
+def _create_measurements(count: int = 50, seed: int = 1) -> list:
+    rng = np.random.default_rng(seed=seed)
+    initial_date = datetime.datetime.fromtimestamp(default_time)
+    return [
+        create_mock_measurement_document(
+            {
+                "location": {
+                    "type": "point",
+                    "coordinates": (
+                        float(rng.uniform(-10, 10)),
+                        float(rng.uniform(-10, 10)),
+                    ),
+                },
+                "measurement_date": initial_date
+                + datetime.timedelta(hours=int(rng.integers(0, 25))),
+            }
+        )
+        for _ in range(count)
+    ]
+
+
+def test__get_cells_for_locations__cells_within_margin():
+    locations = [
+        {"name": "A", "type": "city", "latitude": 0.0, "longitude": 0.0},
+        {"name": "B", "type": "city", "latitude": 10.0, "longitude": 10.0},
+    ]
+
+    cells = get_cells_for_locations(grid_latitudes, grid_longitudes, locations, 1.0)
+
+    assert cells.tolist() == [4, 8]
+
+
+def test__get_cells_for_locations__no_locations():
+    assert len(get_cells_for_locations(grid_latitudes, grid_longitudes, [], 1.0)) == 0
+
+
+def test__get_values_for_measurements__matches_forecast_data():
+    forecast_data = _create_forecast_data()
+    series = create_meteorological_series(forecast_data, default_test_cities, 20.0)
+    measurements = _create_measurements()
+
+    result = series.get_values_for_measurements(measurements, SERIES_DATA_TYPES)
+
+    expected = forecast_data.get_values_for_measurements(
+        measurements, SERIES_DATA_TYPES
+    )
+    for data_type in SERIES_DATA_TYPES:
+        np.testing.assert_allclose(result[data_type], expected[data_type], rtol=1e-12)
+
+
+@pytest.mark.parametrize(
+    "coordinates, hours",
+    [
+        # Surrounding grid cells are not in the series
+        ((5.0, 5.0), 0),
+        # After the last valid time of the series
+        ((-10.0, -10.0), 25),
+    ],
+)
+def test__get_values_for_measurements__uncovered_measurement_returns_none(
+    coordinates, hours
+):
+    locations = [{"name": "A", "type": "city", "latitude": -10, "longitude": -10}]
+    series = create_meteorological_series(_create_forecast_data(), locations, 1.0)
+    measurement = create_mock_measurement_document(
+        {
+            "location": {"type": "point", "coordinates": coordinates},
+            "measurement_date": datetime.datetime.fromtimestamp(default_time)
+            + datetime.timedelta(hours=hours),
+        }
+    )
+
+    assert series.get_values_for_measurements([measurement], SERIES_DATA_TYPES) is None
+
+
+def test__enrich_in_situ_measurements__falls_back_to_forecast_data_once():
+    forecast_data = _create_forecast_data()
+    locations = [{"name": "A", "type": "city", "latitude": -10, "longitude": -10}]
+    series = create_meteorological_series(forecast_data, locations, 1.0)
+    series.fallback = MagicMock(return_value=forecast_data)
+    measurements = _create_measurements(2)
+
+    result = series.enrich_in_situ_measurements(measurements, SERIES_DATA_TYPES)
+    series.enrich_in_situ_measurements(measurements, SERIES_DATA_TYPES)
+
+    series.fallback.assert_called_once()
+    assert result == forecast_data.enrich_in_situ_measurements(
+        measurements, SERIES_DATA_TYPES
+    )
+
+
+def test__enrich_in_situ_measurements__covered_measurements_do_not_fall_back():
+    series = create_meteorological_series(
+        _create_forecast_data(), default_test_cities, 20.0
+    )
+    series.fallback = MagicMock()
+    measurements = _create_measurements(2)
+
+    result = series.enrich_in_situ_measurements(measurements, SERIES_DATA_TYPES)
+
+    series.fallback.assert_not_called()
+    assert [measurement for measurement, _ in result] == measurements
+    assert set(result[0][1].keys()) == set(SERIES_DATA_TYPES)
+
+
+def test__create_meteorological_series__decoded_valid_times_stored_as_seconds():
+    forecast_data = ForecastData(
+        xarray.decode_cf(with_cfgrib_time_attributes(single_level_data_set)),
+        xarray.decode_cf(with_cfgrib_time_attributes(multi_level_data_set)),
+    )
+    assert np.issubdtype(forecast_data.get_valid_time_values().dtype, np.datetime64)
+
+    series = create_meteorological_series(forecast_data, default_test_cities, 20.0)
+
+    assert series.valid_times.tolist() == default_valid_time
+
+
+def test__create_meteorological_series__from_artifact_matches_forecast_data(
+    tmp_path,
+):
+    pytest.importorskip("netCDF4")
+    forecast_data = ForecastData(
+        with_cfgrib_time_attributes(single_level_data_set),
+        with_cfgrib_time_attributes(multi_level_data_set),
+    )
+    directory = os.path.join(tmp_path, "2024-05-20_00", "key")
+    publish_artifact(directory, forecast_data)
+    measurements = _create_measurements()
+
+    series = create_meteorological_series(
+        read_artifact(directory, 2), default_test_cities, 20.0
+    )
+    result = series.get_values_for_measurements(measurements, SERIES_DATA_TYPES)
+
+    assert series.valid_times.tolist() == default_valid_time
+    expected = forecast_data.get_values_for_measurements(
+        measurements, SERIES_DATA_TYPES
+    )
+    for data_type in SERIES_DATA_TYPES:
+        np.testing.assert_allclose(result[data_type], expected[data_type])
+
+
+def test__write_meteorological_series__read_back(tmp_path):
+    series = create_meteorological_series(
+        _create_forecast_data(), default_test_cities, 1.0
+    )
+    file_name = os.path.join(tmp_path, "2024-04-22_00", "series.npz")
+
+    write_meteorological_series(file_name, series)
+    result = read_meteorological_series(file_name)
+
+    assert os.listdir(os.path.dirname(file_name)) == ["series.npz"]
+    np.testing.assert_array_equal(result.cells, series.cells)
+    np.testing.assert_array_equal(result.valid_times, series.valid_times)
+    for data_type in SERIES_DATA_TYPES:
+        np.testing.assert_array_equal(
+            result.values[data_type], series.values[data_type]
+        )
+
+
+def test__read_meteorological_series__missing_or_other_version_returns_none(tmp_path):
+    file_name = os.path.join(tmp_path, "series.npz")
+    assert read_meteorological_series(file_name) is None
+
+    np.savez(file_name, version="other")
+    assert read_meteorological_series(file_name) is None
+
+
+def test__store_meteorological_series__stored_for_forecast_base_time(tmp_path):
+    forecast_data = _create_forecast_data()
+
+    with mock.patch.dict(os.environ, {"IN_SITU_FORECAST_AREA_MARGIN": "0"}):
+        store_meteorological_series(tmp_path, forecast_data, default_test_cities)
+
+    base_datetime = datetime.datetime.utcfromtimestamp(default_time)
+    result = read_meteorological_series(get_series_file(tmp_path, base_datetime))
+    assert len(result.cells) == len(default_test_cities)
+    assert ForecastDataType.TEMPERATURE in result.values
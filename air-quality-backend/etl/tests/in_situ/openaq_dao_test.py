@@ -1,204 +1,590 @@
+import json
 import os
 import re
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+from threading import Lock
 from unittest import mock
-from unittest.mock import patch, Mock, mock_open
+from unittest.mock import patch, mock_open
 
+import mongomock
 import pytest
+import requests
 from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
 
+from etl.src.in_situ import openaq_dao, openaq_response_cache
 from etl.src.in_situ.openaq_dao import (
+    RateLimiter,
     fetch_in_situ_measurements,
-    measurements_path,
 )
 
 date_from = datetime(2023, 12, 25, 7, 30)
-date_to = datetime(2023, 12, 25, 7, 30)
+date_to = datetime(2023, 12, 26, 7, 30)
+
+london = {"name": "London", "type": "city", "latitude": 51.5, "longitude": -0.1}
+dublin = {"name": "Dublin", "type": "city", "latitude": 53.3, "longitude": -6.3}
+
+sensors_path = re.compile(r"^/v3/sensors/(\d+)/measurements/hourly$")
+
+
+class FakeOpenAQ:
+    """
+    Local stand in for the OpenAQ v3 API, with one location per city and
+    measurements for each of its sensors
+    """
+
+    def __init__(
+        self,
+        sensors_per_city: int = 2,
+        delay: float = 0,
+        measurements_per_sensor: int = 1,
+        found=None,
+    ):
+        """
+        :param found: meta.found reported for each sensor, defaults to the exact
+        number of measurements
+        """
+        self.sensors_per_city = sensors_per_city
+        self.delay = delay
+        self.measurements_per_sensor = measurements_per_sensor
+        self.found = found
+        self.pages = []
+        self.lock = Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    def _location(self, city_index: int, name: str) -> dict:
+        sensors = [
+            {
+                "id": city_index * 100 + sensor_index,
+                "parameter": {"name": ["pm25", "no2", "o3"][sensor_index % 3]},
+            }
+            for sensor_index in range(self.sensors_per_city)
+        ]
+        # Unsupported parameters are not fetched
+        sensors.append({"id": city_index * 100 + 99, "parameter": {"name": "bc"}})
+        return {
+            "name": f"{name} Centre",
+            "isMonitor": True,
+            "coordinates": {"latitude": 10.0 + city_index, "longitude": 20.0},
+            "datetimeLast": {"utc": "2024-01-01T00:00:00Z"},
+            "sensors": sensors,
+        }
+
+    def _measurements(self, sensor_id: int, limit: int, page: int) -> dict:
+        with self.lock:
+            self.pages.append((sensor_id, page))
+        first = (page - 1) * limit
+        last = min(first + limit, self.measurements_per_sensor)
+        found = self.measurements_per_sensor if self.found is None else self.found
+        return {
+            "meta": {"found": found, "limit": limit, "page": page},
+            "results": [
+                {
+                    "period": {
+                        "datetimeFrom": {
+                            "utc": (
+                                datetime(2023, 12, 25, 8) + timedelta(hours=index)
+                            ).strftime("%Y-%m-%dT%H:%M:%SZ")
+                        },
+                        "datetimeTo": {
+                            "utc": (
+                                datetime(2023, 12, 25, 9) + timedelta(hours=index)
+                            ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "local": "2023-12-25T09:00:00+00:00",
+                        },
+                    },
+                    "parameter": {"units": "µg/m³"},
+                    "summary": {"avg": float(sensor_id)},
+                }
+                for index in range(first, last)
+            ],
+        }
+
+    def handle(self, request: Request) -> Response:
+        with self.lock:
+            self.requests.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if request.path == "/v3/locations":
+                latitude = float(request.args["coordinates"].split(",")[0])
+                city_index = 0 if latitude == london["latitude"] else 1
+                name = "London" if city_index == 0 else "Dublin"
+                body = {"results": [self._location(city_index, name)]}
+            else:
+                sensor_id = int(sensors_path.match(request.path).group(1))
+                body = self._measurements(
+                    sensor_id, int(request.args["limit"]), int(request.args["page"])
+                )
+            return Response(
+                json.dumps(body),
+                content_type="application/json",
+                headers={"x-ratelimit-remaining": "1000"},
+            )
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_openaq(httpserver: HTTPServer):
+    fake = FakeOpenAQ()
+    httpserver.expect_request(re.compile("^/v3/")).respond_with_handler(fake.handle)
+    with mock.patch.dict(
+        os.environ,
+        {"OPEN_AQ_API_URL": httpserver.url_for("").rstrip("/")},
+    ):
+        yield fake
+
+
+@pytest.fixture
+def sensor_catalog():
+    collection = mongomock.MongoClient().db.in_situ_sensors
+    with patch(
+        "shared.src.database.in_situ_sensors.get_collection", return_value=collection
+    ):
+        yield collection
+
+
+@pytest.fixture(autouse=True)
+def unlimited_rate(monkeypatch):
+    monkeypatch.setattr(openaq_dao, "rate_limiter", RateLimiter(1_000_000))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
 
 
 def test__fetch_in_situ_measurements__no_cities_returns_empty():
-    cities = []
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+    assert fetch_in_situ_measurements([], date_from, date_to) == {}
+
+
+def test__fetch_in_situ_measurements__measurements_for_each_city(fake_openaq):
+    result = fetch_in_situ_measurements([london, dublin], date_from, date_to)
+
+    assert result["London"]["city"] == {"name": "London", "type": "city"}
+    assert result["Dublin"]["city"] == {"name": "Dublin", "type": "city"}
+    assert [m["value"] for m in result["London"]["measurements"]] == [0.0, 1.0]
+    assert [m["value"] for m in result["Dublin"]["measurements"]] == [100.0, 101.0]
+    assert result["London"]["measurements"][0] == {
+        "parameter": "pm25",
+        "value": 0.0,
+        "unit": "µg/m³",
+        "location": "London Centre",
+        "date": {
+            "utc": "2023-12-25T09:00:00Z",
+            "local": "2023-12-25T09:00:00+00:00",
+        },
+        "coordinates": {"latitude": 10.0, "longitude": 20.0},
+        "entity": "OpenAQ",
+        "sensorType": "reference grade",
+    }
+    assert sorted(fake_openaq.requests) == sorted(
+        [
+            "/v3/locations",
+            "/v3/locations",
+            "/v3/sensors/0/measurements/hourly",
+            "/v3/sensors/1/measurements/hourly",
+            "/v3/sensors/100/measurements/hourly",
+            "/v3/sensors/101/measurements/hourly",
+        ]
+    )
 
-    assert result == {}
 
+def test__fetch_in_situ_measurements__fetches_sensors_concurrently(
+    httpserver: HTTPServer,
+):
+    httpserver.stop()
+    threaded_server = HTTPServer(threaded=True)
+    threaded_server.start()
+    fake = FakeOpenAQ(sensors_per_city=12, delay=0.05)
+    threaded_server.expect_request(re.compile("^/v3/")).respond_with_handler(
+        fake.handle
+    )
+    try:
+        with mock.patch.dict(
+            os.environ,
+            {
+                "OPEN_AQ_API_URL": threaded_server.url_for("").rstrip("/"),
+                "OPEN_AQ_MAX_CONCURRENT_REQUESTS": "4",
+            },
+        ):
+            result = fetch_in_situ_measurements([london, dublin], date_from, date_to)
+    finally:
+        threaded_server.clear()
+        threaded_server.stop()
+        httpserver.start()
+
+    assert len(result["London"]["measurements"]) == 12
+    assert len(result["Dublin"]["measurements"]) == 12
+    assert 1 < fake.max_in_flight <= 4
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "10"})
+def test__fetch_in_situ_measurements__prefetches_count_towards_concurrency_limit(
+    httpserver: HTTPServer, caplog
+):
+    httpserver.stop()
+    threaded_server = HTTPServer(threaded=True)
+    threaded_server.start()
+    fake = FakeOpenAQ(sensors_per_city=6, delay=0.02, measurements_per_sensor=50)
+    threaded_server.expect_request(re.compile("^/v3/")).respond_with_handler(
+        fake.handle
+    )
+    executor = mock.Mock(wraps=openaq_dao.ThreadPoolExecutor)
+    try:
+        with mock.patch.dict(
+            os.environ,
+            {
+                "OPEN_AQ_API_URL": threaded_server.url_for("").rstrip("/"),
+                "OPEN_AQ_MAX_CONCURRENT_REQUESTS": "3",
+            },
+        ), mock.patch.object(openaq_dao, "ThreadPoolExecutor", executor):
+            result = fetch_in_situ_measurements([london, dublin], date_from, date_to)
+    finally:
+        threaded_server.clear()
+        threaded_server.stop()
+        httpserver.start()
+
+    assert len(result["London"]["measurements"]) == 300
+    assert len(result["Dublin"]["measurements"]) == 300
+    assert 1 < fake.max_in_flight <= 3
+    # One prefetcher shared by every sensor
+    executor.assert_called_once()
+    assert "Connection pool is full" not in caplog.text
+
+
+def test__openaq_session__bounds_requests_in_flight(monkeypatch):
+    tracker = FakeOpenAQ(delay=0.02)
+
+    def request(session, *args, **kwargs):
+        with tracker.lock:
+            tracker.in_flight += 1
+            tracker.max_in_flight = max(tracker.max_in_flight, tracker.in_flight)
+        time.sleep(tracker.delay)
+        with tracker.lock:
+            tracker.in_flight -= 1
+
+    monkeypatch.setattr(requests.Session, "request", request)
+
+    with openaq_dao.OpenAQSession(2) as session, ThreadPool(6) as pool:
+        pool.map(lambda _: session.get("http://openaq"), range(12))
+
+    assert tracker.max_in_flight == 2
+
+
+sensor_info = {
+    "id": 0,
+    "parameter": "pm25",
+    "location_name": "London Centre",
+    "coordinates": {"latitude": 10.0, "longitude": 20.0},
+    "is_monitor": True,
+}
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "1000"})
+def test__fetch_in_situ_measurements__follows_measurement_pages(fake_openaq):
+    fake_openaq.measurements_per_sensor = 2500
+
+    result = fetch_in_situ_measurements([london], date_from, date_to)
+
+    measurements = result["London"]["measurements"]
+    assert len(measurements) == 5000
+    assert len({(m["parameter"], m["date"]["utc"]) for m in measurements}) == 5000
+    assert sorted(fake_openaq.pages) == [(0, 1), (0, 2), (0, 3), (1, 1), (1, 2), (1, 3)]
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "10"})
+def test__get_measurement_pages__stops_at_found_measurements(fake_openaq):
+    fake_openaq.measurements_per_sensor = 20
+
+    pages = list(
+        openaq_dao._get_measurement_pages(
+            sensor_info, date_from, date_to, openaq_dao._create_session(1)
+        )
+    )
 
-@patch("etl.src.in_situ.openaq_dao.urlencode")
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-def test__fetch_in_situ_measurements__correct_url_params_encoded(
-    requests_patch, urlencode_patch
+    assert [len(page["results"]) for page in pages] == [10, 10]
+    assert fake_openaq.pages == [(0, 1), (0, 2)]
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "10"})
+def test__get_measurement_pages__inexact_found_continues_until_short_page(
+    fake_openaq,
 ):
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": []}
-    requests_patch.return_value = response_mock
+    fake_openaq.measurements_per_sensor = 25
+    fake_openaq.found = ">10"
+
+    pages = list(
+        openaq_dao._get_measurement_pages(
+            sensor_info, date_from, date_to, openaq_dao._create_session(1)
+        )
+    )
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    fetch_in_situ_measurements(cities, date_from, date_to)
+    assert [len(page["results"]) for page in pages] == [10, 10, 5]
 
-    urlencode_patch.assert_called_with(
-        {
-            "limit": 3000,
-            "page": "1",
-            "offset": "0",
-            "sort": "desc",
-            "order_by": "datetime",
-            "radius": "25000",
-            "date_to": date_to.strftime("%Y-%m-%dT%H:%M:%S%z"),
-            "date_from": date_from.strftime("%Y-%m-%dT%H:%M:%S%z"),
-            "coordinates": "11,22",
-            "parameter": ["o3", "no2", "pm10", "so2", "pm25"],
-        },
-        doseq=True,
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "10"})
+def test__get_measurement_pages__prefetches_one_page_ahead(fake_openaq):
+    fake_openaq.measurements_per_sensor = 50
+    pages = openaq_dao._get_measurement_pages(
+        sensor_info, date_from, date_to, openaq_dao._create_session(1)
     )
 
+    next(pages)
+    pages.close()
 
-@patch("etl.src.in_situ.openaq_dao.urlencode")
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-@mock.patch.dict(
-    os.environ,
-    {"OPEN_AQ_API_URL": "test_url", "OPEN_AQ_API_KEY": "test_api_key"},
-)
-def test__fetch_in_situ_measurements__correct_url_called(
-    requests_patch, urlencode_patch
+    assert fake_openaq.pages == [(0, 1), (0, 2)]
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_PAGE_LIMIT": "10"})
+def test__get_measurements_for_sensor__failed_page_keeps_earlier_pages(
+    httpserver: HTTPServer,
 ):
-    urlencode_patch.return_value = "test_url_params"
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": []}
-    requests_patch.return_value = response_mock
+    fake = FakeOpenAQ(measurements_per_sensor=30)
+    path = "/v3/sensors/0/measurements/hourly"
+    httpserver.expect_ordered_request(path).respond_with_handler(fake.handle)
+    httpserver.expect_ordered_request(path).respond_with_data("", status=500)
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    fetch_in_situ_measurements(cities, date_from, date_to)
+    with mock.patch.dict(
+        os.environ, {"OPEN_AQ_API_URL": httpserver.url_for("").rstrip("/")}
+    ):
+        result = openaq_dao._get_measurements_for_sensor(
+            sensor_info, date_from, date_to, openaq_dao._create_session(1), london
+        )
 
-    requests_patch.assert_called_with(
-        f"test_url/{measurements_path}?test_url_params",
-        headers={"X-API-Key": "test_api_key"},
+    assert len(result) == 10
+
+
+def test__fetch_in_situ_measurements__response_cache_replays_requests(
+    fake_openaq, tmp_path
+):
+    fake_openaq.measurements_per_sensor = 3
+    hour_from = datetime(2023, 12, 25, 7)
+    hour_to = datetime(2023, 12, 26, 7)
+
+    with mock.patch.dict(os.environ, {"OPEN_AQ_RESPONSE_CACHE": str(tmp_path)}):
+        first = fetch_in_situ_measurements([london], hour_from, hour_to)
+        fake_openaq.pages.clear()
+        second = fetch_in_situ_measurements([london], hour_from, hour_to)
+
+    assert fake_openaq.pages == []
+    assert sorted(
+        second["London"]["measurements"], key=lambda m: m["date"]["utc"]
+    ) == sorted(first["London"]["measurements"], key=lambda m: m["date"]["utc"])
+    assert len(second["London"]["measurements"]) == 6
+
+
+def test__get_measurements_for_sensor__requests_hours_around_cached_hour(
+    fake_openaq, tmp_path
+):
+    fake_openaq.measurements_per_sensor = 3
+    cached_result = {
+        "period": {
+            "datetimeFrom": {"utc": "2023-12-25T09:00:00Z"},
+            "datetimeTo": {"utc": "2023-12-25T10:00:00Z"},
+        },
+        "parameter": {"units": "µg/m³"},
+        "summary": {"avg": 42.0},
+    }
+    openaq_response_cache.write_bucket(
+        str(tmp_path), 0, datetime(2023, 12, 25, 9), [cached_result]
     )
 
+    with mock.patch.dict(os.environ, {"OPEN_AQ_RESPONSE_CACHE": str(tmp_path)}):
+        result = openaq_dao._get_measurements_for_sensor(
+            sensor_info,
+            datetime(2023, 12, 25, 8),
+            datetime(2023, 12, 25, 11),
+            openaq_dao._create_session(1),
+            london,
+        )
+
+    assert sorted((m["date"]["utc"], m["value"]) for m in result) == [
+        ("2023-12-25T09:00:00Z", 0.0),
+        ("2023-12-25T10:00:00Z", 42.0),
+        ("2023-12-25T11:00:00Z", 0.0),
+    ]
+    assert fake_openaq.pages == [(0, 1), (0, 1)]
 
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-def test__fetch_in_situ_measurements__single_city_without_measurements(requests_patch):
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": []}
-    requests_patch.return_value = response_mock
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+@mock.patch.dict(os.environ, {"OPEN_AQ_CACHE": "test_cache"})
+def test__fetch_in_situ_measurements__cache_supplied_reads_from_cache(fake_openaq):
+    with patch("builtins.open", new_callable=mock_open, read_data='["cached"]'):
+        with patch("os.path.exists") as mock_path_exists:
+            mock_path_exists.side_effect = lambda file: "London" in file
+            result = fetch_in_situ_measurements([london, dublin], date_from, date_to)
 
-    assert result["London"]["city"] == cities[0]
-    assert result["London"]["measurements"] == []
+    assert result["London"]["measurements"] == ["cached"]
+    assert len(result["Dublin"]["measurements"]) == 2
+    assert "/v3/sensors/0/measurements/hourly" not in fake_openaq.requests
+    mock_path_exists.assert_any_call("test_cache/London_2023122507_2023122607.json")
 
 
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-def test__fetch_in_situ_measurements__single_city_multiple_measurements(requests_patch):
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": [100, 200]}
-    requests_patch.return_value = response_mock
+def test__fetch_in_situ_measurements__retries_408_responses(httpserver: HTTPServer):
+    for _ in range(2):
+        httpserver.expect_ordered_request("/v3/locations").respond_with_data(
+            "{}", status=408, content_type="application/json"
+        )
+    httpserver.expect_ordered_request("/v3/locations").respond_with_json(
+        {"results": []}
+    )
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+    with mock.patch.dict(
+        os.environ, {"OPEN_AQ_API_URL": httpserver.url_for("").rstrip("/")}
+    ):
+        result = fetch_in_situ_measurements([london], date_from, date_to)
 
-    assert result["London"]["city"] == cities[0]
-    assert result["London"]["measurements"] == [100, 200]
+    assert result["London"]["measurements"] == []
+    assert len(httpserver.log) == 3
 
 
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-def test__fetch_in_situ_measurements__single_city_too_many_measurements(requests_patch):
-    response_mock = Mock()
+def test__fetch_in_situ_measurements__waits_after_429_responses(
+    httpserver: HTTPServer, monkeypatch
+):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        openaq_dao, "rate_limiter", RateLimiter(1_000_000, clock, clock.sleep)
+    )
+    httpserver.expect_ordered_request("/v3/locations").respond_with_data(
+        "{}", status=429
+    )
+    httpserver.expect_ordered_request("/v3/locations").respond_with_json(
+        {"results": []}
+    )
 
-    results = range(0, 3001)
-    response_mock.json.return_value = {"results": results}
-    requests_patch.return_value = response_mock
+    with mock.patch.dict(
+        os.environ, {"OPEN_AQ_API_URL": httpserver.url_for("").rstrip("/")}
+    ):
+        result = fetch_in_situ_measurements([london], date_from, date_to)
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+    assert result["London"]["measurements"] == []
+    assert clock.sleeps == [300]
 
-    assert result["London"]["city"] == cities[0]
-    assert result["London"]["measurements"] == results
 
+def test__rate_limiter__waits_for_tokens_to_refill():
+    clock = FakeClock()
+    limiter = RateLimiter(60, clock, clock.sleep)
 
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-def test__fetch_in_situ_measurements__multiple_cities(requests_patch):
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": []}
-    requests_patch.return_value = response_mock
+    for _ in range(61):
+        limiter.acquire()
 
-    cities = [
-        {"name": "London", "latitude": 11, "longitude": 22},
-        {"name": "Dublin", "latitude": 33, "longitude": 44},
-    ]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+    assert clock.sleeps == [pytest.approx(1)]
 
-    assert result["London"]["city"] == cities[0]
-    assert result["Dublin"]["city"] == cities[1]
 
+def test__rate_limiter__slows_down_to_remaining_quota():
+    clock = FakeClock()
+    limiter = RateLimiter(60, clock, clock.sleep)
+    limiter.acquire()
 
-@patch("json.load")
-@patch("os.path.exists")
-@patch.dict(os.environ, {"OPEN_AQ_CACHE": "test_cache"})
-def test__fetch_in_situ_measurements__cache_supplied_reads_from_cache(
-    mock_path_exists, mock_json_load
-):
-    with patch("builtins.open", new_callable=mock_open, read_data="data"):
-        mock_path_exists.return_value = True
-        mock_json_load.return_value = {"test_key": "test_value"}
+    limiter.wait_if_needed(mock.Mock(headers={"x-ratelimit-remaining": "2"}))
+    for _ in range(3):
+        limiter.acquire()
 
-        date_from_str = date_from.strftime("%Y%m%d%H")
-        date_to_str = date_to.strftime("%Y%m%d%H")
-        expected_file_name = f"test_cache/London_{date_from_str}_{date_to_str}.json"
+    assert limiter.get_api_calls() == 1
+    assert clock.sleeps == [pytest.approx(1)]
 
-        cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-        result = fetch_in_situ_measurements(cities, date_from, date_to)
 
-        assert result["London"]["city"] == cities[0]
-        assert result["London"]["measurements"] == {"test_key": "test_value"}
-        mock_path_exists.assert_called_with(expected_file_name)
+def test__rate_limiter__quota_used_waits_until_reset():
+    clock = FakeClock()
+    limiter = RateLimiter(60, clock, clock.sleep)
 
+    limiter.wait_if_needed(
+        mock.Mock(headers={"x-ratelimit-remaining": "0", "x-ratelimit-reset": "45"})
+    )
+    limiter.acquire()
 
-@patch("etl.src.in_situ.openaq_dao.requests.Session.get")
-@patch("os.path.exists")
-@patch.dict(os.environ, {"OPEN_AQ_CACHE": "test_cache"})
-def test__fetch_in_situ_measurements__cache_supplied_but_no_file_for_city_calls_api(
-    mock_path_exists, requests_patch
+    assert clock.now == pytest.approx(45)
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_SENSOR_CACHE_TTL_HOURS": "24"})
+def test__fetch_in_situ_measurements__sensor_catalog_reused_across_dates(
+    fake_openaq, sensor_catalog
 ):
-    mock_path_exists.return_value = False
-    response_mock = Mock()
-    response_mock.json.return_value = {"results": [100, 200]}
-    requests_patch.return_value = response_mock
+    for day in range(3):
+        result = fetch_in_situ_measurements(
+            [london, dublin], date_from + timedelta(days=day), date_to
+        )
+        assert len(result["London"]["measurements"]) == 2
 
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
+    assert fake_openaq.requests.count("/v3/locations") == 2
+    assert sensor_catalog.count_documents({}) == 2
 
-    assert result["London"]["city"] == cities[0]
-    assert result["London"]["measurements"] == [100, 200]
 
-    date_from_str = date_from.strftime("%Y%m%d%H")
-    date_to_str = date_to.strftime("%Y%m%d%H")
-    expected_file_name = f"test_cache/London_{date_from_str}_{date_to_str}.json"
-    mock_path_exists.assert_called_with(expected_file_name)
+@mock.patch.dict(os.environ, {"OPEN_AQ_SENSOR_CACHE_TTL_HOURS": "24"})
+def test__fetch_in_situ_measurements__expired_sensor_catalog_rediscovered(
+    fake_openaq, sensor_catalog
+):
+    sensor_catalog.insert_one(
+        {
+            "latitude": london["latitude"],
+            "longitude": london["longitude"],
+            "radius": 25000,
+            "locations": [],
+            "discovered_time": datetime.utcnow() - timedelta(hours=25),
+        }
+    )
 
+    result = fetch_in_situ_measurements([london], date_from, date_to)
 
-@pytest.fixture(scope="session")
-def httpserver_listen_address():
-    return "127.0.0.1", 9999
+    assert len(result["London"]["measurements"]) == 2
+    assert fake_openaq.requests.count("/v3/locations") == 1
+    assert len(sensor_catalog.find_one()["locations"]) == 1
 
 
-@mock.patch.dict(
-    os.environ,
-    {
-        "OPEN_AQ_API_URL": "http://localhost:9999",
-    },
+@pytest.mark.parametrize(
+    "date_from_hours_ago, last_data_hours_ago, expected_measurements",
+    [
+        # After discovery, locations silent for less than the TTL may have reported
+        (0.5, 3, 2),
+        (0.5, 30, 0),
+        # Before discovery, the cached last data time is known to be current
+        (3, 4, 0),
+        (3, 2, 2),
+    ],
 )
-def test__fetch_in_situ_measurements__retries_408_responses(httpserver: HTTPServer):
-    expected_retries = 2
-    for index in range(expected_retries):
-        httpserver.expect_ordered_request(
-            re.compile("^/v2/measurements"), method="GET"
-        ).respond_with_data("{}", status=408, content_type="application/json")
-    httpserver.expect_ordered_request(
-        re.compile("^/v2/measurements"), method="GET"
-    ).respond_with_json({"results": [123]})
-
-    cities = [{"name": "London", "latitude": 11, "longitude": 22}]
-    result = fetch_in_situ_measurements(cities, date_from, date_to)
-    assert result["London"]["city"] == cities[0]
-    assert result["London"]["measurements"] == [123]
+@mock.patch.dict(os.environ, {"OPEN_AQ_SENSOR_CACHE_TTL_HOURS": "24"})
+def test__fetch_in_situ_measurements__stale_locations_skipped_from_sensor_catalog(
+    fake_openaq,
+    sensor_catalog,
+    date_from_hours_ago,
+    last_data_hours_ago,
+    expected_measurements,
+):
+    now = datetime.utcnow()
+    location = fake_openaq._location(0, "London")
+    location["datetimeLast"] = {
+        "utc": (now - timedelta(hours=last_data_hours_ago)).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+    }
+    sensor_catalog.insert_one(
+        {
+            "latitude": london["latitude"],
+            "longitude": london["longitude"],
+            "radius": 25000,
+            "locations": [location],
+            "discovered_time": now - timedelta(hours=1),
+        }
+    )
+
+    result = fetch_in_situ_measurements(
+        [london], now - timedelta(hours=date_from_hours_ago), now
+    )
+
+    assert len(result["London"]["measurements"]) == expected_measurements
+    assert "/v3/locations" not in fake_openaq.requests
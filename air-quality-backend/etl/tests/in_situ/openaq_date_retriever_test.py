@@ -1,11 +1,15 @@
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
 import pytest
 from freezegun import freeze_time
 
-from etl.src.in_situ.openaq_date_retriever import retrieve_dates_requiring_in_situ_data
+from etl.src.in_situ.openaq_date_retriever import (
+    merge_in_situ_windows,
+    retrieve_dates_requiring_in_situ_data,
+    split_measurements_by_date,
+)
 
 
 @patch.dict(os.environ, {"IN_SITU_RETRIEVAL_PERIOD": "invalid"})
@@ -87,3 +91,40 @@ def test__retrieve_dates_requiring_in_situ_data__two_extra_dates_one_with_gap(
     assert len(result) == 2
     assert result[0] == datetime(2024, 8, 5, 12, 0, 0)
     assert result[1] == datetime(2024, 8, 7, 12, 0, 0)
+
+
+@pytest.mark.parametrize(
+    "days, max_period_hours, expected",
+    [
+        ([], 96, []),
+        ([5], 96, [(5, 24)]),
+        ([1, 2, 3], 96, [(3, 72)]),
+        ([3, 1, 2], 96, [(3, 72)]),
+        ([1, 2, 4, 5, 6], 96, [(2, 48), (6, 72)]),
+        ([1, 2, 3, 4, 5], 48, [(2, 48), (4, 48), (5, 24)]),
+        ([1, 2], 12, [(1, 24), (2, 24)]),
+    ],
+)
+def test__merge_in_situ_windows__merges_contiguous_windows(
+    days, max_period_hours, expected
+):
+    dates = [datetime(2024, 6, day) for day in days]
+
+    result = merge_in_situ_windows(dates, 24, max_period_hours)
+
+    assert result == [(datetime(2024, 6, day), hours) for day, hours in expected]
+
+
+def test__split_measurements_by_date__measurements_in_window_of_each_date():
+    dates = [datetime(2024, 6, 2), datetime(2024, 6, 3)]
+    measurements = [
+        {"measurement_date": datetime(2024, 6, 1, 0, tzinfo=timezone.utc)},
+        {"measurement_date": datetime(2024, 6, 2, 0, tzinfo=timezone.utc)},
+        {"measurement_date": datetime(2024, 6, 2, 1, tzinfo=timezone.utc)},
+        {"measurement_date": datetime(2024, 6, 3, 1, tzinfo=timezone.utc)},
+        {"measurement_date": datetime(2024, 6, 2, 12)},
+    ]
+
+    result = split_measurements_by_date(measurements, dates)
+
+    assert result == [measurements[:2], measurements[2:]]
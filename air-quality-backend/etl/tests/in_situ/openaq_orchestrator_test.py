@@ -1,14 +1,25 @@
+import csv
 import datetime
+import os
+from unittest import mock
 from unittest.mock import patch, call
 
 import pytest
 
+from src.forecast.forecast_data import RegionalForecastData
 from src.in_situ.openaq_orchestrator import (
+    fetch_forecast_data_for_areas,
+    get_forecast_areas,
+    get_forecast_data,
     retrieve_openaq_in_situ_data,
 )
 
 cities = "dummy_cities_var"
 end_date = datetime.datetime(2024, 3, 29, 9, 18)
+locations_file = os.path.join(
+    os.path.dirname(__file__),
+    "../../../system_tests/forecast_etl_suite/CAMS_locations_V1.csv",
+)
 
 
 @pytest.mark.parametrize(
@@ -82,3 +93,125 @@ def test__retrieve_openaq_in_situ_data__transform_calls_made_per_city(
             call(transformed_london_data, extracted_forecast),
         ]
     )
+
+
+@patch("src.in_situ.openaq_orchestrator.fetch_in_situ_measurements")
+@patch("src.in_situ.openaq_orchestrator.fetch_forecast_data")
+def test__retrieve_openaq_in_situ_data__requests_area_around_locations(
+    fetch_forecast_patch, fetch_in_situ_patch
+):
+    locations = [
+        {"name": "Dublin", "type": "city", "latitude": 53.3, "longitude": -6.3},
+        {"name": "London", "type": "city", "latitude": 51.5, "longitude": -0.1},
+    ]
+    start_date = end_date - datetime.timedelta(hours=12)
+
+    with mock.patch.dict(
+        os.environ,
+        {"IN_SITU_FORECAST_AREA": "locations", "IN_SITU_FORECAST_AREA_MARGIN": "2"},
+    ):
+        retrieve_openaq_in_situ_data(locations, end_date, 12)
+
+    fetch_forecast_patch.assert_called_with(
+        start_date, 12, [pytest.approx(55.3), -8.3, 49.5, pytest.approx(1.9)]
+    )
+
+
+def test__get_forecast_areas__invalid_mode_raises_error():
+    with mock.patch.dict(os.environ, {"IN_SITU_FORECAST_AREA": "europe"}):
+        with pytest.raises(ValueError):
+            get_forecast_areas([])
+
+
+def _grid_fraction(areas: list[list[float]]) -> float:
+    return sum(
+        (north - south) * (east - west) for north, west, south, east in areas
+    ) / (180 * 360)
+
+
+def _contains(area: list[float], city) -> bool:
+    north, west, south, east = area
+    return south <= city["latitude"] <= north and west <= city["longitude"] <= east
+
+
+def test__get_forecast_areas__real_cities_request_a_fraction_of_the_grid():
+    with open(locations_file) as file:
+        rows = list(csv.DictReader(file))
+    all_cities = [
+        {
+            "name": row["city"],
+            "type": "city",
+            "latitude": float(row["latitude"]),
+            "longitude": float(row["longitude"]),
+        }
+        for row in rows
+    ]
+    european_cities = [
+        city
+        for city, row in zip(all_cities, rows)
+        if row["timezone"].startswith("Europe/")
+    ]
+
+    with mock.patch.dict(os.environ, {"IN_SITU_FORECAST_AREA": "locations"}):
+        all_cities_areas = get_forecast_areas(all_cities)
+        european_cities_areas = get_forecast_areas(european_cities)
+
+    # One box around every city would cover more than half of the grid
+    assert len(all_cities_areas) <= 16
+    assert _grid_fraction(all_cities_areas) < 0.15
+    assert all(
+        any(_contains(area, city) for area in all_cities_areas) for city in all_cities
+    )
+    assert len(european_cities_areas) == 1
+    assert _grid_fraction(european_cities_areas) < 0.02
+
+
+@patch("src.in_situ.openaq_orchestrator.fetch_forecast_data")
+def test__fetch_forecast_data_for_areas__requests_each_area(fetch_forecast_patch):
+    areas = [[55.0, -8.0, 49.0, 2.0], [42.0, 138.0, 34.0, 142.0]]
+    start_date = end_date - datetime.timedelta(hours=12)
+
+    result = fetch_forecast_data_for_areas(start_date, 12, areas)
+
+    assert isinstance(result, RegionalForecastData)
+    assert fetch_forecast_patch.call_args_list == [
+        call(start_date, 12, areas[0]),
+        call(start_date, 12, areas[1]),
+    ]
+    assert result.forecast_data_by_area == [
+        (area, fetch_forecast_patch.return_value) for area in areas
+    ]
+
+
+@patch("src.in_situ.openaq_orchestrator.read_meteorological_series")
+@patch("src.in_situ.openaq_orchestrator.fetch_forecast_data")
+@mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": "/artifacts"})
+def test__get_forecast_data__uses_stored_meteorological_series(
+    fetch_forecast_patch, read_series_patch
+):
+    start_date = end_date - datetime.timedelta(hours=12)
+
+    result = get_forecast_data(start_date, 12, cities)
+
+    assert result is read_series_patch.return_value
+    assert read_series_patch.call_args.args[0] == os.path.join(
+        "/artifacts", "2024-03-28_12", "meteorological_series.npz"
+    )
+    fetch_forecast_patch.assert_not_called()
+    read_series_patch.call_args.kwargs["fallback"]()
+    fetch_forecast_patch.assert_called_with(start_date, 12)
+
+
+@patch("src.in_situ.openaq_orchestrator.read_meteorological_series")
+@patch("src.in_situ.openaq_orchestrator.fetch_forecast_data")
+@mock.patch.dict(os.environ, {"FORECAST_ARTIFACT_STORE": "/artifacts"})
+def test__get_forecast_data__fetches_forecast_without_meteorological_series(
+    fetch_forecast_patch, read_series_patch
+):
+    start_date = end_date - datetime.timedelta(hours=12)
+    read_series_patch.return_value = None
+
+    result = get_forecast_data(start_date, 12, cities)
+
+    assert result is fetch_forecast_patch.return_value
+    fetch_forecast_patch.assert_called_with(start_date, 12)
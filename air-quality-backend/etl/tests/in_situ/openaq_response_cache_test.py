@@ -0,0 +1,195 @@
+import os
+from datetime import datetime
+from unittest import mock
+
+from freezegun import freeze_time
+
+from etl.src.in_situ.openaq_response_cache import (
+    evict_cached_responses,
+    evict_responses,
+    get_buckets,
+    read_bucket,
+    read_cached_results,
+    results_between,
+    write_bucket,
+    write_results,
+)
+
+sensor_id = 7
+
+
+def _result(hour: int, value: float = 1.0) -> dict:
+    return {
+        "period": {
+            "datetimeFrom": {"utc": f"2024-05-20T{hour:02d}:00:00Z"},
+            "datetimeTo": {"utc": f"2024-05-20T{hour + 1:02d}:00:00Z"},
+        },
+        "summary": {"avg": value},
+    }
+
+
+def _files(path) -> list[str]:
+    return [
+        os.path.join(directory, file_name)
+        for directory, _, file_names in os.walk(path)
+        for file_name in file_names
+    ]
+
+
+def test__get_buckets__every_hour_overlapping_period():
+    assert get_buckets(datetime(2024, 5, 20, 6, 30), datetime(2024, 5, 20, 9)) == [
+        datetime(2024, 5, 20, 6),
+        datetime(2024, 5, 20, 7),
+        datetime(2024, 5, 20, 8),
+    ]
+
+
+def test__results_between__filters_on_period_start():
+    results = [_result(6), _result(7), _result(8)]
+
+    assert results_between(results, datetime(2024, 5, 20, 7), None) == results[1:]
+    assert results_between(results, None, datetime(2024, 5, 20, 7)) == results[:1]
+
+
+def test__write_bucket__read_back(tmp_path):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) == [_result(6)]
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 7)) is None
+
+
+def test__write_bucket__identical_contents_stored_once(tmp_path):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [])
+    write_bucket(tmp_path, sensor_id + 1, datetime(2024, 5, 20, 7), [])
+
+    objects = _files(os.path.join(tmp_path, "1", "objects"))
+    assert len(objects) == 1
+    assert objects[0].endswith(".json.gz")
+
+
+def test__read_bucket__corrupt_contents_ignored(tmp_path):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+    with open(_files(os.path.join(tmp_path, "1", "objects"))[0], "wb") as file:
+        file.write(b"not gzip")
+
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) is None
+
+
+def test__read_cached_results__uncached_periods_around_cached_hours(tmp_path):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 8), [_result(8)])
+
+    results, periods = read_cached_results(
+        tmp_path, sensor_id, datetime(2024, 5, 20, 6, 30), datetime(2024, 5, 20, 11)
+    )
+
+    # The period of the partly covered first hour starts before date_from
+    assert results == [_result(8)]
+    assert periods == [
+        (datetime(2024, 5, 20, 7), datetime(2024, 5, 20, 8)),
+        (datetime(2024, 5, 20, 9), datetime(2024, 5, 20, 11)),
+    ]
+
+
+@freeze_time("2024-05-21T09:00:00")
+def test__write_results__only_settled_fully_covered_hours(tmp_path):
+    write_results(
+        tmp_path,
+        sensor_id,
+        [_result(6, 6.0), _result(7, 7.0), _result(9, 9.0)],
+        datetime(2024, 5, 20, 5, 30),
+        datetime(2024, 5, 20, 9, 30),
+    )
+
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 5)) is None
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) == [
+        _result(6, 6.0)
+    ]
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 7)) == [
+        _result(7, 7.0)
+    ]
+    # No measurements for the hour is cached as well
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 8)) == []
+    # Not settled yet
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 9)) is None
+
+
+def test__evict_responses__deletes_hours_older_than_max_age(tmp_path):
+    with freeze_time("2024-05-20T00:00:00"):
+        write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+    with freeze_time("2024-05-22T00:00:00"):
+        write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 7), [_result(7)])
+        evict_responses(tmp_path, 24, 1024 * 1024)
+
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) is None
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 7)) == [_result(7)]
+    assert len(_files(os.path.join(tmp_path, "1", "objects"))) == 1
+
+
+def test__evict_responses__deletes_oldest_hours_over_max_size(tmp_path):
+    for hour in range(6, 10):
+        with freeze_time(datetime(2024, 5, 21, hour)):
+            write_bucket(
+                tmp_path, sensor_id, datetime(2024, 5, 20, hour), [_result(hour)]
+            )
+    object_size = max(
+        os.path.getsize(file) for file in _files(os.path.join(tmp_path, "1", "objects"))
+    )
+
+    with freeze_time(datetime(2024, 5, 21, 12)):
+        evict_responses(tmp_path, 24, object_size * 2)
+
+    assert [
+        read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, hour)) is not None
+        for hour in range(6, 10)
+    ] == [False, False, True, True]
+
+
+def test__evict_responses__rewritten_hour_releases_old_contents(tmp_path):
+    bucket = datetime(2024, 5, 20, 6)
+    write_bucket(tmp_path, sensor_id, bucket, [_result(6, 1.0)])
+    write_bucket(tmp_path, sensor_id, bucket, [_result(6, 2.0)])
+
+    evict_responses(tmp_path, 24, 1024 * 1024)
+
+    assert read_bucket(tmp_path, sensor_id, bucket) == [_result(6, 2.0)]
+    assert len(_files(os.path.join(tmp_path, "1", "objects"))) == 1
+    with open(os.path.join(tmp_path, "1", "index.jsonl")) as index_file:
+        assert len(index_file.readlines()) == 1
+
+
+def test__evict_responses__does_not_open_hours(tmp_path, mocker):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+    mock_read = mocker.patch(
+        "etl.src.in_situ.openaq_response_cache.read_bucket", side_effect=AssertionError
+    )
+    mock_walk = mocker.patch("os.walk", side_effect=AssertionError)
+
+    evict_responses(tmp_path, 24, 0)
+
+    mock_read.assert_not_called()
+    mock_walk.assert_not_called()
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) is None
+
+
+@mock.patch.dict(os.environ, {"OPEN_AQ_RESPONSE_CACHE_MAX_MB": "0"})
+def test__evict_cached_responses__uses_configured_cache(tmp_path):
+    write_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6), [_result(6)])
+
+    with mock.patch.dict(os.environ, {"OPEN_AQ_RESPONSE_CACHE": str(tmp_path)}):
+        evict_cached_responses()
+
+    assert read_bucket(tmp_path, sensor_id, datetime(2024, 5, 20, 6)) is None
+
+
+def test__evict_cached_responses__no_cache_configured(mocker):
+    mock_evict = mocker.patch("etl.src.in_situ.openaq_response_cache.evict_responses")
+
+    with mock.patch.dict(os.environ, {}, clear=True):
+        evict_cached_responses()
+
+    mock_evict.assert_not_called()
+
+
+def test__evict_responses__missing_cache_is_ignored(tmp_path):
+    evict_responses(os.path.join(tmp_path, "missing"), 24, 0)
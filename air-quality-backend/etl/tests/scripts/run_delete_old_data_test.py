@@ -65,3 +65,51 @@ def test__run_delete_old_data__positive_limit_processes_successfully(
     mock_delete_in_situ_data_before.assert_called_with(expected_date)
     mock_delete_data_texture_data_before.assert_called_with(expected_date)
     mock_delete_data_textures_before.assert_called_with(expected_date)
+
+
+@patch("etl.scripts.run_delete_old_data.delete_forecast_data_before")
+@patch("etl.scripts.run_delete_old_data.delete_in_situ_data_before")
+@patch("etl.scripts.run_delete_old_data.ensure_in_situ_data_expiry")
+@patch("etl.scripts.run_delete_old_data.delete_data_texture_data_before")
+@patch("etl.scripts.run_delete_old_data.delete_data_textures_before")
+@patch.dict(os.environ, {"DELETE_LIMIT_WEEKS": "3", "IN_SITU_STORAGE": "time_series"})
+@freeze_time("2024-08-07")
+def test__run_delete_old_data__time_series_in_situ_data_left_to_expire(
+    mock_delete_data_textures_before,
+    mock_delete_data_texture_data_before,
+    mock_ensure_in_situ_data_expiry,
+    mock_delete_in_situ_data_before,
+    mock_delete_forecast_data_before,
+):
+    expected_date = datetime.datetime(2024, 7, 17)
+
+    main()
+
+    mock_delete_forecast_data_before.assert_called_with(expected_date)
+    mock_ensure_in_situ_data_expiry.assert_called_once()
+    mock_delete_in_situ_data_before.assert_not_called()
+    mock_delete_data_texture_data_before.assert_called_with(expected_date)
+    mock_delete_data_textures_before.assert_called_with(expected_date)
+
+
+@patch("etl.scripts.run_delete_old_data.delete_forecast_data_before")
+@patch("etl.scripts.run_delete_old_data.delete_in_situ_data_before")
+@patch("etl.scripts.run_delete_old_data.delete_data_texture_data_before")
+@patch("etl.scripts.run_delete_old_data.delete_data_textures_before")
+@patch("etl.scripts.run_delete_old_data.delete_artifacts_before")
+@patch.dict(
+    os.environ, {"DELETE_LIMIT_WEEKS": "3", "FORECAST_ARTIFACT_STORE": "/artifacts"}
+)
+@freeze_time("2024-08-07")
+def test__run_delete_old_data__deletes_forecast_artifacts(
+    mock_delete_artifacts_before,
+    mock_delete_data_textures_before,
+    mock_delete_data_texture_data_before,
+    mock_delete_in_situ_data_before,
+    mock_delete_forecast_data_before,
+):
+    main()
+
+    mock_delete_artifacts_before.assert_called_with(
+        "/artifacts", datetime.datetime(2024, 7, 17)
+    )
@@ -1,4 +1,6 @@
+import os
 from datetime import datetime
+from unittest import mock
 from unittest.mock import patch
 
 from etl.scripts.run_forecast_etl import main
@@ -56,3 +58,41 @@ def test__run_forecast_etl__multiple_dates_processed(
     mock_process_forecast.assert_any_call(cities, multi_date_1)
     mock_process_forecast.assert_any_call(cities, multi_date_2)
     mock_process_forecast.assert_any_call(cities, multi_date_3)
+
+
+@mock.patch.dict(os.environ, {"FORECAST_BACKFILL_WORKERS": "3"})
+@patch("etl.scripts.run_forecast_etl.get_locations_by_type")
+@patch("etl.scripts.run_forecast_etl.retrieve_dates_requiring_forecast")
+@patch("etl.scripts.run_forecast_etl.process_forecast")
+@patch("etl.scripts.run_forecast_etl.process_forecasts")
+def test__run_forecast_etl__multiple_dates_backfilled_with_workers(
+    mock_process_forecasts, mock_process_forecast, mock_get_dates, mock_get_locations
+):
+    dates = [datetime(2024, 6, 1, 0, 0, 0, 0), datetime(2024, 6, 1, 12, 0, 0, 0)]
+
+    mock_get_locations.return_value = cities
+    mock_get_dates.return_value = dates
+
+    main()
+
+    mock_process_forecasts.assert_called_once_with(cities, dates, 3)
+    mock_process_forecast.assert_not_called()
+
+
+@mock.patch.dict(os.environ, {"FORECAST_BACKFILL_WORKERS": "3"})
+@patch("etl.scripts.run_forecast_etl.get_locations_by_type")
+@patch("etl.scripts.run_forecast_etl.retrieve_dates_requiring_forecast")
+@patch("etl.scripts.run_forecast_etl.process_forecast")
+@patch("etl.scripts.run_forecast_etl.process_forecasts")
+def test__run_forecast_etl__single_date_not_backfilled_with_workers(
+    mock_process_forecasts, mock_process_forecast, mock_get_dates, mock_get_locations
+):
+    single_date = datetime(2024, 6, 1, 17, 0, 0, 0)
+
+    mock_get_locations.return_value = cities
+    mock_get_dates.return_value = [single_date]
+
+    main()
+
+    mock_process_forecast.assert_called_with(cities, single_date)
+    mock_process_forecasts.assert_not_called()
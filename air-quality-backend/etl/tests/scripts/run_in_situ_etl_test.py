@@ -1,10 +1,11 @@
 import os
-from datetime import datetime
-from unittest.mock import patch
+from datetime import datetime, timezone
+from unittest.mock import call, patch
 
 from shared.src.database.locations import AirQualityLocationType
 from etl.scripts.run_in_situ_etl import main
 from shared.tests.util.mock_location import create_test_city
+from shared.tests.util.mock_measurement import create_mock_measurement_document
 
 cities = [
     create_test_city("Test_City_1", 90, 90),
@@ -12,7 +13,11 @@ cities = [
     create_test_city("Test_City_3", 110, 110),
     create_test_city("Test_City_4", 120, 120),
 ]
-in_situ_data = {"London": {"measurements": [], "city": cities[0]}}
+in_situ_data = [
+    create_mock_measurement_document(
+        {"measurement_date": datetime(2024, 6, 4, 12, tzinfo=timezone.utc)}
+    )
+]
 
 
 @patch("etl.scripts.run_in_situ_etl.insert_data")
@@ -53,10 +58,36 @@ def test__run_in_situ_etl__multiple_dates_no_cities_override(
     main()
 
     mock_locations.assert_called_with(AirQualityLocationType.CITY)
-    mock_fetch.assert_any_call(cities, datetime(2024, 6, 3), 24)
-    mock_fetch.assert_any_call(cities, datetime(2024, 6, 4), 24)
-    mock_fetch.assert_any_call(cities, datetime(2024, 6, 5), 24)
-    mock_insert.assert_called_with(in_situ_data)
+    mock_fetch.assert_called_once_with(cities, datetime(2024, 6, 5), 72)
+    mock_insert.assert_has_calls([call([]), call([]), call(in_situ_data)])
+
+
+@patch("etl.scripts.run_in_situ_etl.insert_data")
+@patch("etl.scripts.run_in_situ_etl.retrieve_openaq_in_situ_data")
+@patch("etl.scripts.run_in_situ_etl.retrieve_dates_requiring_in_situ_data")
+@patch("etl.scripts.run_in_situ_etl.get_locations_by_type")
+@patch.dict(os.environ, {"IN_SITU_MAX_WINDOW_HOURS": "48"})
+def test__run_in_situ_etl__windows_limited_to_max_window_hours(
+    mock_locations, mock_dates, mock_fetch, mock_insert
+):
+
+    mock_dates.return_value = [
+        datetime(2024, 6, 1),
+        datetime(2024, 6, 2),
+        datetime(2024, 6, 3),
+        datetime(2024, 6, 5),
+    ]
+    mock_locations.return_value = cities
+    mock_fetch.return_value = []
+
+    main()
+
+    assert mock_fetch.call_args_list == [
+        call(cities, datetime(2024, 6, 2), 48),
+        call(cities, datetime(2024, 6, 3), 24),
+        call(cities, datetime(2024, 6, 5), 24),
+    ]
+    assert mock_insert.call_count == 4
 
 
 @patch("etl.scripts.run_in_situ_etl.insert_data")
@@ -78,3 +109,23 @@ def test__run_in_situ_etl__one_date_with_cities_override_filters(
     mock_locations.assert_called_with(AirQualityLocationType.CITY)
     mock_fetch.assert_called_with(expected_cities, datetime(2024, 6, 5), 24)
     mock_insert.assert_called_with(in_situ_data)
+
+
+@patch("etl.scripts.run_in_situ_etl.evict_cached_responses")
+@patch("etl.scripts.run_in_situ_etl.insert_data")
+@patch("etl.scripts.run_in_situ_etl.retrieve_openaq_in_situ_data")
+@patch("etl.scripts.run_in_situ_etl.retrieve_dates_requiring_in_situ_data")
+@patch("etl.scripts.run_in_situ_etl.get_locations_by_type")
+@patch.dict(os.environ, {"IN_SITU_MAX_WINDOW_HOURS": "24"})
+def test__run_in_situ_etl__response_cache_evicted_once_per_run(
+    mock_locations, mock_dates, mock_fetch, mock_insert, mock_evict
+):
+
+    mock_dates.return_value = [datetime(2024, 6, 3), datetime(2024, 6, 5)]
+    mock_locations.return_value = cities
+    mock_fetch.return_value = []
+
+    main()
+
+    assert mock_fetch.call_count == 2
+    mock_evict.assert_called_once_with()
@@ -0,0 +1,12 @@
+from unittest.mock import patch
+
+from etl.scripts.run_migrate_forecast_columnar import main
+
+
+@patch("etl.scripts.run_migrate_forecast_columnar.migrate_to_columnar_forecasts")
+def test__run_migrate_forecast_columnar__forecasts_migrated(mock_migrate):
+    mock_migrate.return_value = 0
+
+    main()
+
+    mock_migrate.assert_called_once()
@@ -0,0 +1,12 @@
+import os
+from unittest.mock import patch
+
+from etl.scripts.run_migrate_in_situ_time_series import main
+
+
+@patch("etl.scripts.run_migrate_in_situ_time_series.migrate_to_time_series_collection")
+@patch.dict(os.environ, {"IN_SITU_MIGRATION_BATCH_SIZE": "500"})
+def test__run_migrate_in_situ_time_series__migrates_in_batches(mock_migrate):
+    main()
+
+    mock_migrate.assert_called_once_with(500)
@@ -0,0 +1,10 @@
+from unittest.mock import patch
+
+from etl.scripts.run_update_indexes import main
+
+
+@patch("etl.scripts.run_update_indexes.ensure_indexes")
+def test__run_update_indexes__indexes_ensured(mock_ensure_indexes):
+    main()
+
+    mock_ensure_indexes.assert_called_once()
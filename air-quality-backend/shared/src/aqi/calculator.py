@@ -1,3 +1,6 @@
+import numpy as np
+from numpy.typing import ArrayLike
+
 from .pollutant_type import PollutantType
 
 _aqi_ranges_by_pollutant = {
@@ -43,6 +46,16 @@ _aqi_ranges_by_pollutant = {
     ],
 }
 
+# Breakpoints as arrays so whole grids can be classified with np.searchsorted
+_aqi_breakpoints_by_pollutant = {
+    pollutant_type: np.array([max_value for _, max_value in ranges], dtype=float)
+    for pollutant_type, ranges in _aqi_ranges_by_pollutant.items()
+}
+_aqi_levels_by_pollutant = {
+    pollutant_type: np.array([aqi_level for aqi_level, _ in ranges], dtype=int)
+    for pollutant_type, ranges in _aqi_ranges_by_pollutant.items()
+}
+
 
 def get_pollutant_index_level(value: float, pollutant_type: PollutantType) -> int:
     ranges = _aqi_ranges_by_pollutant[pollutant_type]
@@ -84,5 +97,72 @@ def get_pollutant_fractional_index_level(
     return 9999.0
 
 
+def get_pollutant_index_levels(
+    values: ArrayLike, pollutant_type: PollutantType
+) -> np.ndarray:
+    """
+    Array equivalent of get_pollutant_index_level, classifying every value in a
+    single pass
+    :param values: array-like of concentrations (ndarray, DataArray, list)
+    :param pollutant_type:
+    :return: integer AQI levels with the same shape as values
+    """
+    breakpoints = _aqi_breakpoints_by_pollutant[pollutant_type]
+    levels = _aqi_levels_by_pollutant[pollutant_type]
+    # NaN sorts past the last breakpoint, matching the scalar fall-through
+    indices = np.searchsorted(breakpoints, np.asarray(values, dtype=float))
+    return levels[np.minimum(indices, len(levels) - 1)]
+
+
+def _fractional_segments(pollutant_type: PollutantType, dtype) -> tuple:
+    """
+    Per-segment terms of the fractional level formula, indexed by np.searchsorted
+    over the breakpoints: below the first breakpoint, each interior range, and
+    above the last breakpoint
+    """
+    breakpoints = _aqi_breakpoints_by_pollutant[pollutant_type]
+    levels = _aqi_levels_by_pollutant[pollutant_type]
+    offsets = np.concatenate([[1.0], 1.0 + levels[:-1], [7.0]])
+    multipliers = np.concatenate([levels[:1], np.diff(levels), [0]])
+    lower_bounds = np.concatenate([[0.0], breakpoints])
+    widths = np.concatenate([breakpoints[:1], np.diff(breakpoints), [1.0]])
+    return tuple(
+        segment.astype(dtype)
+        for segment in (offsets, multipliers, lower_bounds, widths)
+    )
+
+
+def get_pollutant_fractional_index_levels(
+    values: ArrayLike, pollutant_type: PollutantType
+) -> np.ndarray:
+    """
+    Array equivalent of get_pollutant_fractional_index_level, producing identical
+    floating point results for every value. Floating point inputs keep their
+    precision, so float32 grids are not promoted to float64.
+    :param values: array-like of concentrations (ndarray, DataArray, list)
+    :param pollutant_type:
+    :return: fractional AQI levels with the same shape as values
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(float)
+    breakpoints = _aqi_breakpoints_by_pollutant[pollutant_type].astype(values.dtype)
+    offsets, multipliers, lower_bounds, widths = _fractional_segments(
+        pollutant_type, values.dtype
+    )
+
+    flat_values = values.ravel()
+    segments = np.searchsorted(breakpoints, flat_values)
+    # Same evaluation order as the scalar version so results match exactly
+    with np.errstate(invalid="ignore"):
+        result = flat_values - lower_bounds.take(segments)
+        result *= multipliers.take(segments)
+        result /= widths.take(segments)
+        result += offsets.take(segments)
+    result[segments == len(breakpoints)] = 7.0
+    result[np.isnan(flat_values)] = 9999.0
+    return result.reshape(values.shape)
+
+
 def get_overall_aqi_level(aqi_values: list[int]) -> int:
     return max(aqi_values)
@@ -1,11 +1,26 @@
 import logging
+import os
 from datetime import datetime
 from typing import TypedDict, List
 
 from bson import ObjectId
 
 from shared.src.database.locations import AirQualityLocationType
-from .mongo_db_operations import get_collection, upsert_data, GeoJSONPoint
+from .mongo_db_operations import get_collection, upsert_data, run_query, GeoJSONPoint
+from ..aqi.pollutant_type import PollutantType
+
+forecast_collection_name = "forecast_data"
+columnar_forecast_collection_name = "forecast_data_columnar"
+
+# Columnar forecasts hold one document per location per base time, keyed on
+# these fields, with the values for each forecast_valid_time in a steps array
+columnar_forecast_keys = ["forecast_base_time", "location_type", "name", "source"]
+columnar_forecast_step_fields = [
+    "forecast_valid_time",
+    "forecast_range",
+    "overall_aqi_level",
+    *[pollutant_type.value for pollutant_type in PollutantType],
+]
 
 
 class PollutantData(TypedDict):
@@ -48,9 +63,64 @@ class DataTexture(TypedDict):
     created_time: datetime
 
 
+def uses_columnar_forecasts() -> bool:
+    storage = os.environ.get("FORECAST_STORAGE", "document")
+    if storage not in ["document", "columnar"]:
+        raise ValueError(
+            f"FORECAST_STORAGE must be 'document' or 'columnar', got {storage}"
+        )
+    return storage == "columnar"
+
+
+def _get_forecast_collection():
+    if uses_columnar_forecasts():
+        return get_collection(columnar_forecast_collection_name)
+    return get_collection(forecast_collection_name)
+
+
+def to_columnar_forecasts(data: List[Forecast]) -> list[dict]:
+    """
+    Group forecast documents into one document per location and base time,
+    with the per step values ordered by forecast_valid_time.
+    :param data: forecast documents, one per location per forecast_valid_time
+    :return: columnar forecast documents
+    """
+    columnar_forecasts = {}
+    for forecast in data:
+        key = tuple(forecast[field] for field in columnar_forecast_keys)
+        columnar_forecast = columnar_forecasts.get(key)
+        if columnar_forecast is None:
+            columnar_forecast = {
+                field: value
+                for field, value in forecast.items()
+                if field not in columnar_forecast_step_fields
+                and field not in ["_id", "created_time", "last_modified_time"]
+            }
+            columnar_forecast["steps"] = []
+            columnar_forecasts[key] = columnar_forecast
+        columnar_forecast["steps"].append(
+            {
+                field: forecast[field]
+                for field in columnar_forecast_step_fields
+                if field in forecast
+            }
+        )
+
+    for columnar_forecast in columnar_forecasts.values():
+        columnar_forecast["steps"].sort(key=lambda step: step["forecast_valid_time"])
+    return list(columnar_forecasts.values())
+
+
 def insert_data(data):
+    if uses_columnar_forecasts():
+        upsert_data(
+            columnar_forecast_collection_name,
+            columnar_forecast_keys,
+            to_columnar_forecasts(data),
+        )
+        return
     upsert_data(
-        "forecast_data",
+        forecast_collection_name,
         [
             "forecast_base_time",
             "forecast_valid_time",
@@ -62,6 +132,29 @@ def insert_data(data):
     )
 
 
+def migrate_to_columnar_forecasts() -> int:
+    """
+    Copy the forecast_data collection into the columnar forecast collection,
+    one forecast base time at a time. Base times already copied are replaced.
+    :return: the number of columnar forecast documents written
+    """
+    source = get_collection(forecast_collection_name)
+    migrated = 0
+    for forecast_base_time in sorted(source.distinct("forecast_base_time")):
+        forecasts = list(source.find({"forecast_base_time": forecast_base_time}))
+        columnar_forecasts = to_columnar_forecasts(forecasts)
+        logging.info(
+            f"Migrating {len(forecasts)} forecasts for base time {forecast_base_time}"
+        )
+        upsert_data(
+            columnar_forecast_collection_name,
+            columnar_forecast_keys,
+            columnar_forecasts,
+        )
+        migrated += len(columnar_forecasts)
+    return migrated
+
+
 def insert_textures(textures):
     upsert_data(
         "data_textures",
@@ -71,10 +164,71 @@ def insert_textures(textures):
 
 
 def delete_forecast_data_before(forecast_base_time: datetime):
-    result = get_collection("forecast_data").delete_many(
-        {"forecast_base_time": {"$lt": forecast_base_time}}
+    collection = _get_forecast_collection()
+    result = collection.delete_many({"forecast_base_time": {"$lt": forecast_base_time}})
+    logging.info(f"Deleted {result.deleted_count} documents from {collection.name}")
+
+
+def _get_columnar_forecast_data(
+    valid_time_from: datetime,
+    valid_time_to: datetime,
+    location_type: str,
+    forecast_base_time: datetime,
+    location_name: str = None,
+) -> List[Forecast]:
+    valid_time_range = {"$gte": valid_time_from, "$lte": valid_time_to}
+    match_criteria = {
+        "forecast_base_time": forecast_base_time,
+        "location_type": location_type,
+        "steps": {"$elemMatch": {"forecast_valid_time": valid_time_range}},
+    }
+    if location_name is not None:
+        match_criteria["name"] = location_name
+
+    location_fields = ["location", "created_time", "last_modified_time"]
+    location_projection = {
+        field: 1 for field in columnar_forecast_keys + location_fields
+    }
+    step_projection = {
+        field: f"$steps.{field}" for field in columnar_forecast_step_fields
+    }
+    results = _get_forecast_collection().aggregate(
+        [
+            {"$match": match_criteria},
+            {
+                "$project": {
+                    **location_projection,
+                    "steps": {
+                        "$filter": {
+                            "input": "$steps",
+                            "as": "step",
+                            "cond": {
+                                "$and": [
+                                    {
+                                        "$gte": [
+                                            "$$step.forecast_valid_time",
+                                            valid_time_from,
+                                        ]
+                                    },
+                                    {
+                                        "$lte": [
+                                            "$$step.forecast_valid_time",
+                                            valid_time_to,
+                                        ]
+                                    },
+                                ]
+                            },
+                        }
+                    },
+                }
+            },
+            {"$unwind": "$steps"},
+            # Every step shares the location document's _id, so it is left out
+            # rather than repeated on each row
+            {"$project": {"_id": 0, **location_projection, **step_projection}},
+        ]
     )
-    logging.info(f"Deleted {result.deleted_count} documents from forecast_data")
+    return list(results)
 
 
 def get_forecast_data_from_database(
@@ -84,7 +238,16 @@ def get_forecast_data_from_database(
     forecast_base_time: datetime,
     location_name: str = None,
 ) -> List[Forecast]:
-    collection = get_collection("forecast_data")
+    if uses_columnar_forecasts():
+        return _get_columnar_forecast_data(
+            valid_time_from,
+            valid_time_to,
+            location_type,
+            forecast_base_time,
+            location_name,
+        )
+
+    collection = get_collection(forecast_collection_name)
     query = {
         "location_type": location_type,
         "forecast_base_time": forecast_base_time,
@@ -98,11 +261,28 @@ def get_forecast_data_from_database(
     return list(collection.find(query))
 
 
+async def get_forecast_data_from_database_async(
+    valid_time_from: datetime,
+    valid_time_to: datetime,
+    location_type: str,
+    forecast_base_time: datetime,
+    location_name: str = None,
+) -> List[Forecast]:
+    return await run_query(
+        get_forecast_data_from_database,
+        valid_time_from,
+        valid_time_to,
+        location_type,
+        forecast_base_time,
+        location_name,
+    )
+
+
 def get_forecast_dates_between(
         forecast_base_search_start: datetime,
         forecast_base_search_end: datetime,
 ) -> List[datetime]:
-    collection = get_collection("forecast_data")
+    collection = _get_forecast_collection()
     query = {
         "forecast_base_time": {
             "$gte": forecast_base_search_start,
@@ -124,6 +304,12 @@ def get_data_textures_from_database(
     return list(collection.find(query))
 
 
+async def get_data_textures_from_database_async(
+    forecast_base_time: datetime,
+) -> List[DataTexture]:
+    return await run_query(get_data_textures_from_database, forecast_base_time)
+
+
 def delete_data_texture_data_before(forecast_base_time: datetime):
     result = get_collection("data_textures").delete_many(
         {"forecast_base_time": {"$lt": forecast_base_time}}
@@ -1,15 +1,43 @@
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import List, TypedDict, NotRequired, Optional
 
 from bson import ObjectId
 
 from shared.src.database.locations import AirQualityLocationType
-from .mongo_db_operations import get_collection, upsert_data, GeoJSONPoint
+from .mongo_db_operations import (
+    get_collection,
+    upsert_changed_data,
+    run_query,
+    GeoJSONPoint,
+)
 from ..aqi.pollutant_type import PollutantType
 
 collection_name = "in_situ_data"
+time_series_collection_name = "in_situ_data_time_series"
+# Every field of uniq_in_situ_idx, identifying a stored measurement
+in_situ_keys = [
+    "location_type",
+    "name",
+    "api_source",
+    "measurement_date",
+    "location_name",
+]
+
+# Fields describing the measurement location, stored under the metaField of
+# the time series collection so they are kept once per bucket
+time_series_meta_fields = [
+    "name",
+    "location_name",
+    "location_type",
+    "api_source",
+    "location",
+    "metadata",
+]
+
+_time_series_collection_ready = False
 
 
 class ApiSource(Enum):
@@ -38,6 +66,7 @@ class InSituMeasurement(TypedDict):
     api_source: ApiSource
     created_time: NotRequired[datetime]
     last_modified_time: NotRequired[datetime]
+    payload_hash: NotRequired[str]
     location: GeoJSONPoint
     location_type: AirQualityLocationType
     metadata: InSituMetadata
@@ -63,15 +92,214 @@ class InSituAveragedMeasurement(TypedDict):
     so2: PollutantAverages
 
 
+def uses_time_series_collection() -> bool:
+    storage = os.environ.get("IN_SITU_STORAGE", "collection")
+    if storage not in ["collection", "time_series"]:
+        raise ValueError(
+            f"IN_SITU_STORAGE must be 'collection' or 'time_series', got {storage}"
+        )
+    return storage == "time_series"
+
+
+def _get_expiry_seconds() -> int | None:
+    expiry_weeks = int(os.getenv("DELETE_LIMIT_WEEKS", 0))
+    if expiry_weeks <= 0:
+        return None
+    return int(timedelta(weeks=expiry_weeks).total_seconds())
+
+
+def in_situ_data_expires() -> bool:
+    """
+    :return: whether old in situ data is removed by the time series collection
+    expiry, so it does not need deleting
+    """
+    return uses_time_series_collection() and _get_expiry_seconds() is not None
+
+
+def _ensure_time_series_collection(collection):
+    database = collection.database
+    expiry_seconds = _get_expiry_seconds()
+    if time_series_collection_name not in database.list_collection_names(
+        filter={"name": time_series_collection_name}
+    ):
+        logging.info(f"Creating time series collection {time_series_collection_name}")
+        options = {}
+        if expiry_seconds is not None:
+            options["expireAfterSeconds"] = expiry_seconds
+        database.create_collection(
+            time_series_collection_name,
+            timeseries={
+                "timeField": "measurement_date",
+                "metaField": "meta",
+                "granularity": "hours",
+            },
+            **options,
+        )
+    elif expiry_seconds is not None:
+        database.command(
+            "collMod", time_series_collection_name, expireAfterSeconds=expiry_seconds
+        )
+    collection.create_index(
+        [("meta.location_type", 1), ("meta.name", 1), ("measurement_date", 1)],
+        name="meta_name_measurement_date_idx",
+    )
+
+
+def ensure_in_situ_data_expiry():
+    """
+    Create the time series collection, or update its expiry, so in situ data
+    expires after DELETE_LIMIT_WEEKS. The delete job calls this rather than
+    deleting in situ data, as other jobs may not have DELETE_LIMIT_WEEKS set.
+    """
+    global _time_series_collection_ready
+    _ensure_time_series_collection(get_collection(time_series_collection_name))
+    _time_series_collection_ready = True
+
+
+def _get_in_situ_collection():
+    if not uses_time_series_collection():
+        return get_collection(collection_name)
+
+    global _time_series_collection_ready
+    collection = get_collection(time_series_collection_name)
+    if not _time_series_collection_ready:
+        _ensure_time_series_collection(collection)
+        _time_series_collection_ready = True
+    return collection
+
+
+def _field(name: str) -> str:
+    if uses_time_series_collection() and name in time_series_meta_fields:
+        return f"meta.{name}"
+    return name
+
+
+def _to_time_series_document(measurement: InSituMeasurement) -> dict:
+    document = {
+        key: value
+        for key, value in measurement.items()
+        if key not in time_series_meta_fields and key != "_id"
+    }
+    document["meta"] = {
+        key: measurement[key] for key in time_series_meta_fields if key in measurement
+    }
+    return document
+
+
+def _from_time_series_document(document: dict) -> InSituMeasurement:
+    measurement = {key: value for key, value in document.items() if key != "meta"}
+    measurement.update(document["meta"])
+    return measurement
+
+
+def _time_series_key(measurement: InSituMeasurement) -> tuple:
+    key = []
+    for field in in_situ_keys:
+        value = measurement.get(field)
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        key.append(value)
+    return tuple(key)
+
+
+def _insert_time_series_data(collection, data) -> int:
+    """
+    Insert measurements not already in the time series collection, matched on
+    the same fields as the upserts into the in situ collection.
+    Stored measurements are not updated.
+    :return: the number of measurements inserted
+    """
+    if len(data) == 0:
+        return 0
+    measurement_dates = [measurement["measurement_date"] for measurement in data]
+    existing_query = {
+        "measurement_date": {
+            "$gte": min(measurement_dates),
+            "$lte": max(measurement_dates),
+        },
+        "meta.name": {"$in": list({measurement["name"] for measurement in data})},
+    }
+    existing_keys = {
+        _time_series_key(_from_time_series_document(document))
+        for document in collection.find(
+            existing_query,
+            {
+                f"meta.{field}" if field in time_series_meta_fields else field: 1
+                for field in in_situ_keys
+            },
+        )
+    }
+
+    now = datetime.utcnow()
+    documents = []
+    for measurement in data:
+        key = _time_series_key(measurement)
+        if key in existing_keys:
+            continue
+        existing_keys.add(key)
+        documents.append(
+            {
+                "created_time": now,
+                "last_modified_time": now,
+                **_to_time_series_document(measurement),
+            }
+        )
+
+    if len(documents) > 0:
+        collection.insert_many(documents, ordered=False)
+    logging.info(
+        f"{len(documents)} documents inserted, "
+        f"{len(data) - len(documents)} already stored"
+    )
+    return len(documents)
+
+
 def insert_data(data):
-    upsert_data(collection_name, ["measurement_date", "name", "location_name"], data)
+    if uses_time_series_collection():
+        _insert_time_series_data(_get_in_situ_collection(), data)
+        return
+    # Every field of uniq_in_situ_idx, so the upsert is an exact index lookup
+    upsert_changed_data(
+        collection_name,
+        in_situ_keys,
+        data,
+        "measurement_date",
+    )
+
+
+def migrate_to_time_series_collection(batch_size: int) -> int:
+    """
+    Copy in situ measurements from the in_situ_data collection into the time
+    series collection, resuming from the latest measurement already copied.
+    :param batch_size: the number of measurements inserted at once
+    :return: the number of measurements copied
+    """
+    source = get_collection(collection_name)
+    target = get_collection(time_series_collection_name)
+    _ensure_time_series_collection(target)
+
+    query = {}
+    latest = target.find_one({}, sort=[("measurement_date", -1)])
+    if latest is not None:
+        query["measurement_date"] = {"$gte": latest["measurement_date"]}
+        logging.info(f"Resuming migration from {latest['measurement_date']}")
+
+    migrated = 0
+    batch = []
+    for measurement in source.find(query).sort("measurement_date", 1):
+        batch.append(measurement)
+        if len(batch) == batch_size:
+            migrated += _insert_time_series_data(target, batch)
+            batch = []
+    migrated += _insert_time_series_data(target, batch)
+    logging.info(f"Migrated {migrated} documents to {time_series_collection_name}")
+    return migrated
 
 
 def delete_in_situ_data_before(measurement_date: datetime):
-    result = get_collection(collection_name).delete_many(
-        {"measurement_date": {"$lt": measurement_date}}
-    )
-    logging.info(f"Deleted {result.deleted_count} documents from in_situ_data")
+    collection = _get_in_situ_collection()
+    result = collection.delete_many({"measurement_date": {"$lt": measurement_date}})
+    logging.info(f"Deleted {result.deleted_count} documents from {collection.name}")
 
 
 def find_by_criteria(
@@ -86,14 +314,34 @@ def find_by_criteria(
             "$gte": measurement_date_from,
             "$lte": measurement_date_to,
         },
-        "location_type": location_type.value,
+        _field("location_type"): location_type.value,
     }
     if locations is not None:
-        criteria["name"] = {"$in": locations}
+        criteria[_field("name")] = {"$in": locations}
     if api_source is not None:
-        criteria["api_source"] = api_source.value
+        criteria[_field("api_source")] = api_source.value
     logging.info(f"Querying collection with criteria: {criteria}")
-    return list(get_collection(collection_name).find(criteria))
+    results = _get_in_situ_collection().find(criteria)
+    if uses_time_series_collection():
+        return [_from_time_series_document(document) for document in results]
+    return list(results)
+
+
+async def find_by_criteria_async(
+    measurement_date_from: datetime,
+    measurement_date_to: datetime,
+    location_type: AirQualityLocationType,
+    locations: List[str] = None,
+    api_source: ApiSource = None,
+) -> list[InSituMeasurement]:
+    return await run_query(
+        find_by_criteria,
+        measurement_date_from,
+        measurement_date_to,
+        location_type,
+        locations,
+        api_source,
+    )
 
 
 def get_averaged(
@@ -110,11 +358,11 @@ def get_averaged(
             "$gte": date_from,
             "$lte": date_to,
         },
-        "location_type": location_type.value,
+        _field("location_type"): location_type.value,
     }
 
     group_by_criteria = {
-        "_id": "$name",
+        "_id": f"${_field('name')}",
     }
     project_criteria = {
         "measurement_base_time": measurement_base_time,
@@ -135,7 +383,7 @@ def get_averaged(
             date_from, date_to
         )
     )
-    results = get_collection(collection_name).aggregate(
+    results = _get_in_situ_collection().aggregate(
         [
             {"$match": match_criteria},
             {"$group": group_by_criteria},
@@ -145,11 +393,24 @@ def get_averaged(
     return list(results)
 
 
+async def get_averaged_async(
+    measurement_base_time: datetime,
+    measurement_time_range_minutes: int,
+    location_type: AirQualityLocationType,
+) -> [InSituAveragedMeasurement]:
+    return await run_query(
+        get_averaged,
+        measurement_base_time,
+        measurement_time_range_minutes,
+        location_type,
+    )
+
+
 def get_in_situ_dates_between(
         in_situ_base_search_start: datetime,
         in_situ_base_search_end: datetime,
 ) -> List[datetime]:
-    collection = get_collection(collection_name)
+    collection = _get_in_situ_collection()
     query = {
         "measurement_date": {
             "$gte": in_situ_base_search_start,
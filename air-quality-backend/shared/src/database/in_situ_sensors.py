@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from typing import NotRequired, TypedDict
+
+from bson import ObjectId
+
+from .mongo_db_operations import get_collection
+
+collection_name = "in_situ_sensors"
+
+
+class InSituSensorCatalog(TypedDict):
+    """
+    The OpenAQ locations, with their sensors, found within radius metres of a
+    point when they were last discovered
+    """
+
+    _id: NotRequired[ObjectId]
+    latitude: float
+    longitude: float
+    radius: int
+    locations: list[dict]
+    discovered_time: datetime
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def get_sensor_catalog(
+    latitude: float, longitude: float, radius: int, discovered_after: datetime
+) -> InSituSensorCatalog | None:
+    """
+    :param latitude:
+    :param longitude:
+    :param radius:
+    :param discovered_after: oldest discovery time, in UTC, still considered fresh
+    :return: the catalog for the point and radius, or None if there is no fresh
+    catalog
+    """
+    catalog = get_collection(collection_name).find_one(
+        {
+            "latitude": latitude,
+            "longitude": longitude,
+            "radius": radius,
+            "discovered_time": {"$gte": discovered_after},
+        }
+    )
+    if catalog is None:
+        return None
+    catalog["discovered_time"] = _to_naive_utc(catalog["discovered_time"])
+    return catalog
+
+
+def upsert_sensor_catalog(catalog: InSituSensorCatalog):
+    get_collection(collection_name).update_one(
+        {
+            "latitude": catalog["latitude"],
+            "longitude": catalog["longitude"],
+            "radius": catalog["radius"],
+        },
+        {"$set": catalog},
+        upsert=True,
+    )
@@ -0,0 +1,108 @@
+import logging
+
+from pymongo import ASCENDING, IndexModel
+
+from .mongo_db_operations import get_collection
+
+# Compound keys follow equality, sort, range order for the queries in
+# shared.src.database: equality matched fields first, date ranges last.
+collection_indexes: dict[str, list[IndexModel]] = {
+    "forecast_data": [
+        # get_forecast_data_from_database, insert_data, range on base time
+        IndexModel(
+            [
+                ("forecast_base_time", ASCENDING),
+                ("location_type", ASCENDING),
+                ("name", ASCENDING),
+                ("forecast_valid_time", ASCENDING),
+                ("source", ASCENDING),
+            ],
+            unique=True,
+            name="uniq_forecast_idx",
+        ),
+    ],
+    "forecast_data_columnar": [
+        # The columnar forecast layout, selected by FORECAST_STORAGE
+        IndexModel(
+            [
+                ("forecast_base_time", ASCENDING),
+                ("location_type", ASCENDING),
+                ("name", ASCENDING),
+                ("source", ASCENDING),
+            ],
+            unique=True,
+            name="uniq_forecast_columnar_idx",
+        ),
+    ],
+    "data_textures": [
+        # get_data_textures_from_database, insert_textures, range on base time
+        IndexModel(
+            [
+                ("forecast_base_time", ASCENDING),
+                ("variable", ASCENDING),
+                ("source", ASCENDING),
+                ("time_start", ASCENDING),
+                ("time_end", ASCENDING),
+            ],
+            unique=True,
+            name="uniq_texture_idx",
+        ),
+    ],
+    "in_situ_data": [
+        # find_by_criteria, get_averaged and insert_data
+        IndexModel(
+            [
+                ("location_type", ASCENDING),
+                ("name", ASCENDING),
+                ("api_source", ASCENDING),
+                ("measurement_date", ASCENDING),
+                ("location_name", ASCENDING),
+            ],
+            unique=True,
+            name="uniq_in_situ_idx",
+        ),
+        # get_in_situ_dates_between, delete_in_situ_data_before and insert_data
+        IndexModel([("measurement_date", ASCENDING)], name="measurement_date_idx"),
+    ],
+    "locations": [
+        # get_locations_by_type
+        IndexModel([("type", ASCENDING)], name="type_1"),
+    ],
+    "in_situ_sensors": [
+        # get_sensor_catalog and upsert_sensor_catalog
+        IndexModel(
+            [
+                ("latitude", ASCENDING),
+                ("longitude", ASCENDING),
+                ("radius", ASCENDING),
+            ],
+            unique=True,
+            name="uniq_in_situ_sensors_idx",
+        ),
+    ],
+}
+
+
+def ensure_indexes():
+    """
+    Create the indexes for every collection, replacing any existing index with
+    the same name but different keys or options. Mirrors the Liquibase changelogs.
+    """
+    for collection_name, indexes in collection_indexes.items():
+        collection = get_collection(collection_name)
+        existing_indexes = collection.index_information()
+        for index in indexes:
+            document = index.document
+            existing_index = existing_indexes.get(document["name"])
+            if existing_index is None:
+                continue
+            same_keys = list(existing_index["key"]) == list(document["key"].items())
+            same_unique = existing_index.get("unique", False) == document.get(
+                "unique", False
+            )
+            if not same_keys or not same_unique:
+                logging.info(f"Replacing index {document['name']} on {collection_name}")
+                collection.drop_index(document["name"])
+
+        created = collection.create_indexes(indexes)
+        logging.info(f"Ensured indexes {created} on {collection_name}")
@@ -1,6 +1,12 @@
-from datetime import datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+import hashlib
+import json
 import logging
 import os
+from threading import Lock
 from pymongo import MongoClient, UpdateOne
 from typing import Literal, TypedDict, Tuple
 
@@ -10,11 +16,111 @@ class GeoJSONPoint(TypedDict):
     coordinates: Tuple[float, float]
 
 
+_client_option_env_vars = {
+    "maxPoolSize": "MONGO_DB_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_DB_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_DB_MAX_IDLE_TIME_MS",
+    "connectTimeoutMS": "MONGO_DB_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGO_DB_SOCKET_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_DB_SERVER_SELECTION_TIMEOUT_MS",
+}
+
+# Stored with each document written by upsert_changed_data
+payload_hash_field = "payload_hash"
+_bookkeeping_fields = ["_id", "created_time", "last_modified_time", payload_hash_field]
+
+_clients: dict[str, MongoClient] = {}
+_clients_lock = Lock()
+_query_executor: ThreadPoolExecutor | None = None
+
+
+def _get_client_options() -> dict[str, int]:
+    return {
+        option: int(os.environ[env_var])
+        for option, env_var in _client_option_env_vars.items()
+        if env_var in os.environ
+    }
+
+
+def get_client(uri: str = None) -> MongoClient:
+    """
+    Get the process wide client for a MongoDB URI, creating it on first use.
+    Pool sizes and timeouts are read from the MONGO_DB_* environment variables
+    when the client is created.
+    :param uri: the MongoDB URI, defaults to MONGO_DB_URI
+    :return: a MongoClient shared by all callers in this process
+    """
+    if uri is None:
+        uri = os.environ.get("MONGO_DB_URI")
+    client = _clients.get(uri)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = MongoClient(uri, tz_aware=True, **_get_client_options())
+            _clients[uri] = client
+        return client
+
+
+def _get_query_executor() -> ThreadPoolExecutor:
+    global _query_executor
+    with _clients_lock:
+        if _query_executor is None:
+            workers = os.environ.get("MONGO_DB_QUERY_WORKERS")
+            _query_executor = ThreadPoolExecutor(
+                max_workers=int(workers) if workers is not None else None,
+                thread_name_prefix="mongo-query",
+            )
+        return _query_executor
+
+
+async def run_query(query, *args, **kwargs):
+    """
+    Run a blocking query function on the query worker threads, so awaiting it
+    does not block the event loop. The number of worker threads is read from
+    MONGO_DB_QUERY_WORKERS, defaulting to the ThreadPoolExecutor default.
+    :param query: the blocking query function
+    :return: the result of the query function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_query_executor(), partial(query, *args, **kwargs)
+    )
+
+
+def close_clients():
+    """
+    Close every client created by get_client and stop the query worker
+    threads, e.g. on application shutdown. Both are created again on next use.
+    """
+    global _query_executor
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        query_executor, _query_executor = _query_executor, None
+    if query_executor is not None:
+        query_executor.shutdown()
+    for client in clients:
+        client.close()
+
+
+def _forget_clients_after_fork():
+    # MongoClient is not fork safe: a child process must not reuse or close
+    # the parent's connections, so it starts with an empty registry instead
+    global _clients_lock, _query_executor
+    _clients_lock = Lock()
+    _clients.clear()
+    _query_executor = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
+
+
 def get_collection(name: str):
-    uri = os.environ.get("MONGO_DB_URI")
     db_name = os.environ.get("MONGO_DB_NAME")
-    client = MongoClient(uri, tz_aware=True)
-    return client[db_name][name]
+    return get_client()[db_name][name]
 
 
 def upsert_data(collection_name: str, keys: list[str], data):
@@ -51,3 +157,90 @@ def upsert_data(collection_name: str, keys: list[str], data):
     logging.info(
         f"{result.upserted_count} documents upserted, {result.modified_count} modified"
     )
+
+
+def _to_naive_utc(value):
+    # Stored dates are read back timezone aware, documents may hold naive UTC
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def get_payload_hash(doc) -> str:
+    """
+    :param doc:
+    :return: a hash of every field of the document except the bookkeeping fields
+    """
+    payload = {
+        field: value for field, value in doc.items() if field not in _bookkeeping_fields
+    }
+    content = json.dumps(
+        payload,
+        sort_keys=True,
+        default=lambda value: str(_to_naive_utc(value)),
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def upsert_changed_data(collection_name: str, keys: list[str], data, range_key: str):
+    """
+    Upsert only the documents that are new or have changed since they were
+    stored. The payload hashes of the stored documents between the smallest and
+    largest range_key value in data are fetched in one query, and documents with
+    the same hash are skipped.
+    :param collection_name:
+    :param keys: fields identifying a document
+    :param data: documents to store
+    :param range_key: one of keys, indexed, to find the stored documents by
+    """
+    if len(data) == 0:
+        return
+    collection = get_collection(collection_name)
+    range_values = [doc[range_key] for doc in data]
+    stored_hashes = {
+        tuple(_to_naive_utc(document.get(key)) for key in keys): document.get(
+            payload_hash_field
+        )
+        for document in collection.find(
+            {range_key: {"$gte": min(range_values), "$lte": max(range_values)}},
+            {"_id": 0, payload_hash_field: 1, **{key: 1 for key in keys}},
+        )
+    }
+
+    now = datetime.utcnow()
+    update_operations = []
+    for doc in data:
+        document_key = tuple(_to_naive_utc(doc[key]) for key in keys)
+        payload_hash = get_payload_hash(doc)
+        if stored_hashes.get(document_key) == payload_hash:
+            continue
+        stored_hashes[document_key] = payload_hash
+        update_operations.append(
+            UpdateOne(
+                {key: doc[key] for key in keys},
+                {
+                    "$set": {
+                        "last_modified_time": now,
+                        payload_hash_field: payload_hash,
+                        **{
+                            field: value
+                            for field, value in doc.items()
+                            if field != "created_time"
+                        },
+                    },
+                    "$setOnInsert": {"created_time": now},
+                },
+                upsert=True,
+            )
+        )
+
+    unchanged = len(data) - len(update_operations)
+    if len(update_operations) == 0:
+        logging.info(f"All {unchanged} documents already stored unchanged")
+        return
+    logging.info(f"Persisting {len(update_operations)} new or changed documents")
+    result = collection.bulk_write(update_operations, ordered=False)
+    logging.info(
+        f"{result.upserted_count} documents upserted, {result.modified_count} "
+        f"modified, {unchanged} unchanged"
+    )
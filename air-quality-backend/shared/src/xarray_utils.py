@@ -34,3 +34,23 @@ def get_dim_names(
     lon = _get_dimension_by_attr(dataset, "units", "degrees_east")
     time = _get_dimension_by_attr(dataset, "standard_name", "time")
     return lat, lon, time
+
+
+def get_chunk_slices(data: xr.DataArray, dim: str) -> list[slice]:
+    """
+    Get slices along a dimension covering one dask chunk each, so lazy data can
+    be computed a chunk at a time.
+
+    :param data: The data to slice.
+    :param dim: The dimension to slice along.
+
+    :return: A slice per chunk, or a single slice for data held in memory.
+    """
+    if data.chunks is None or dim not in data.dims:
+        return [slice(None)]
+    slices = []
+    start = 0
+    for size in data.chunksizes[dim]:
+        slices.append(slice(start, start + size))
+        start += size
+    return slices
@@ -1,9 +1,12 @@
+import numpy as np
 import pytest
 from shared.src.aqi.pollutant_type import PollutantType
 from shared.src.aqi.calculator import (
     get_overall_aqi_level,
     get_pollutant_index_level,
+    get_pollutant_index_levels,
     get_pollutant_fractional_index_level,
+    get_pollutant_fractional_index_levels,
 )
 
 
@@ -232,3 +235,41 @@ def test__get_pollutant_fractional_index_level(
 )
 def test__get_overall_aqi_level(values: list[int], expected: int):
     assert get_overall_aqi_level(values) == expected
+
+
+@pytest.mark.parametrize("pollutant_type", list(PollutantType))
+def test__get_pollutant_index_levels__matches_scalar_calculation(
+    pollutant_type: PollutantType,
+):
+    values = np.concatenate(
+        [np.linspace(-10, 1500, 3021), [0, 10, 20, 50, 100, 800, 1250, np.nan]]
+    )
+    expected = [get_pollutant_index_level(value, pollutant_type) for value in values]
+
+    result = get_pollutant_index_levels(values, pollutant_type)
+
+    assert result.tolist() == expected
+
+
+def test__get_pollutant_index_levels__preserves_shape():
+    values = np.array([[0.0, 45.0], [95.0, 2000.0]])
+
+    result = get_pollutant_index_levels(values, PollutantType.NITROGEN_DIOXIDE)
+
+    np.testing.assert_array_equal(result, np.array([[1, 2], [3, 6]]))
+
+
+@pytest.mark.parametrize("pollutant_type", list(PollutantType))
+def test__get_pollutant_fractional_index_levels__matches_scalar_calculation(
+    pollutant_type: PollutantType,
+):
+    values = np.concatenate(
+        [np.linspace(-10, 1500, 3021), [0, 10, 20, 50, 100, 800, 1250, np.nan]]
+    )
+    expected = [
+        get_pollutant_fractional_index_level(value, pollutant_type) for value in values
+    ]
+
+    result = get_pollutant_fractional_index_levels(values, pollutant_type)
+
+    assert result.tolist() == expected
@@ -1,4 +1,7 @@
-from datetime import datetime, timezone
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 from unittest.mock import patch
 
 import mongomock
@@ -6,13 +9,18 @@ import pytest
 from bson.tz_util import utc
 from freezegun import freeze_time
 
+from shared.src.database import forecasts
 from shared.src.database.forecasts import (
     get_forecast_data_from_database,
+    get_forecast_data_from_database_async,
     get_data_textures_from_database,
+    get_data_textures_from_database_async,
     get_forecast_dates_between,
     insert_data,
     delete_forecast_data_before,
-    delete_data_texture_data_before
+    delete_data_texture_data_before,
+    migrate_to_columnar_forecasts,
+    to_columnar_forecasts,
 )
 from shared.tests.util.mock_forecast_data import create_mock_forecast_document
 from shared.tests.util.mock_texture_data import create_mock_texture_document
@@ -273,3 +281,223 @@ def test__delete_data_textures_before(mock_collection):
     assert len(results) == 2
     assert len([x for x in results if x["forecast_base_time"] == date2]) == 1
     assert len([x for x in results if x["forecast_base_time"] == date3]) == 1
+
+
+def test__get_forecast_from_database_async__same_results_as_blocking_query(
+    mock_collection,
+):
+    mock_collection.insert_many(
+        [
+            create_mock_forecast_document({"name": "Abidjan"}),
+            create_mock_forecast_document({"name": "Not Abidjan"}),
+        ]
+    )
+    params = (
+        datetime(2024, 5, 27, 12, 0, tzinfo=timezone.utc),
+        datetime(2024, 5, 27, 23, 0, tzinfo=timezone.utc),
+        "city",
+        datetime(2024, 5, 27, 12, 0, tzinfo=timezone.utc),
+        "Abidjan",
+    )
+
+    result = asyncio.run(get_forecast_data_from_database_async(*params))
+
+    assert result == get_forecast_data_from_database(*params)
+    assert len(result) == 1
+
+
+def test__get_data_textures_from_database_async__same_results_as_blocking_query(
+    mock_collection,
+):
+    base_time = datetime(2024, 5, 27, 12, 0, tzinfo=timezone.utc)
+    mock_collection.insert_many(
+        [create_mock_texture_document({"forecast_base_time": base_time})]
+    )
+
+    result = asyncio.run(get_data_textures_from_database_async(base_time))
+
+    assert result == get_data_textures_from_database(base_time)
+    assert len(result) == 1
+
+
+@pytest.fixture
+def mock_database():
+    database = mongomock.MongoClient(tz_aware=True).db
+    with (
+        patch(
+            "shared.src.database.forecasts.get_collection",
+            side_effect=lambda name: database[name],
+        ),
+        patch(
+            "shared.src.database.mongo_db_operations.get_collection",
+            side_effect=lambda name: database[name],
+        ),
+    ):
+        yield database
+
+
+forecast_base_time = datetime(2024, 5, 27, 12, 0, tzinfo=timezone.utc)
+
+
+def _create_forecast_documents():
+    return [
+        create_mock_forecast_document(
+            {
+                "name": name,
+                "forecast_valid_time": forecast_base_time + timedelta(hours=3 * step),
+                "forecast_range": 3 * step,
+                "overall_aqi_level": step % 6 + 1,
+                "no2": {"aqi_level": step % 6 + 1, "value": float(step)},
+            }
+        )
+        # Steps deliberately out of order
+        for step in [2, 0, 3, 1]
+        for name in ["Abidjan", "Accra"]
+    ]
+
+
+def _comparable(documents):
+    bookkeeping_fields = ["_id", "created_time", "last_modified_time"]
+    return sorted(
+        [
+            {k: v for k, v in document.items() if k not in bookkeeping_fields}
+            for document in documents
+        ],
+        key=lambda document: (document["name"], document["forecast_valid_time"]),
+    )
+
+
+def test__to_columnar_forecasts__one_document_per_location_with_ordered_steps():
+    columnar_forecasts = to_columnar_forecasts(_create_forecast_documents())
+
+    assert [forecast["name"] for forecast in columnar_forecasts] == [
+        "Abidjan",
+        "Accra",
+    ]
+    assert columnar_forecasts[0]["location"] == {
+        "type": "Point",
+        "coordinates": [90, 50],
+    }
+    assert [step["forecast_range"] for step in columnar_forecasts[0]["steps"]] == [
+        0,
+        3,
+        6,
+        9,
+    ]
+    assert columnar_forecasts[0]["steps"][1]["no2"] == {"aqi_level": 2, "value": 1.0}
+    assert "forecast_valid_time" not in columnar_forecasts[0]
+    assert "created_time" not in columnar_forecasts[0]
+
+
+@pytest.mark.parametrize("location_name", [None, "Accra"])
+def test__get_forecast_from_database__columnar_same_results_as_documents(
+    mock_database, location_name
+):
+    params = (
+        forecast_base_time + timedelta(hours=3),
+        forecast_base_time + timedelta(hours=6),
+        "city",
+        forecast_base_time,
+        location_name,
+    )
+    with freeze_time("2024-05-28"):
+        with mock.patch.dict(os.environ, {"FORECAST_STORAGE": "document"}):
+            insert_data(_create_forecast_documents())
+            document_results = get_forecast_data_from_database(*params)
+        with mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"}):
+            insert_data(_create_forecast_documents())
+            columnar_results = get_forecast_data_from_database(*params)
+
+    assert len(document_results) == (2 if location_name else 4)
+    assert _comparable(columnar_results) == _comparable(document_results)
+    assert all("_id" not in forecast for forecast in columnar_results)
+    columnar_collection = mock_database[forecasts.columnar_forecast_collection_name]
+    assert columnar_collection.count_documents({}) == 2
+
+
+@mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"})
+def test__get_forecast_from_database__columnar_no_steps_in_range(mock_database):
+    insert_data(_create_forecast_documents())
+
+    results = get_forecast_data_from_database(
+        forecast_base_time + timedelta(days=1),
+        forecast_base_time + timedelta(days=2),
+        "city",
+        forecast_base_time,
+    )
+
+    assert results == []
+
+
+@mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"})
+def test__insert_data__columnar_replaces_stored_steps(mock_database):
+    documents = _create_forecast_documents()
+    insert_data(documents)
+    updated = [{**document, "overall_aqi_level": 6} for document in documents]
+
+    insert_data(updated)
+
+    collection = mock_database[forecasts.columnar_forecast_collection_name]
+    assert collection.count_documents({}) == 2
+    for columnar_forecast in collection.find({}):
+        assert [step["overall_aqi_level"] for step in columnar_forecast["steps"]] == [
+            6,
+            6,
+            6,
+            6,
+        ]
+
+
+@mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"})
+def test__delete_forecasts_before__columnar(mock_database):
+    insert_data(_create_forecast_documents())
+    insert_data(
+        [
+            create_mock_forecast_document(
+                {"forecast_base_time": forecast_base_time + timedelta(days=1)}
+            )
+        ]
+    )
+
+    delete_forecast_data_before(forecast_base_time + timedelta(hours=12))
+
+    collection = mock_database[forecasts.columnar_forecast_collection_name]
+    assert [document["forecast_base_time"] for document in collection.find({})] == [
+        forecast_base_time + timedelta(days=1)
+    ]
+
+
+@mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"})
+def test__get_forecast_dates_between__columnar(mock_database):
+    insert_data(_create_forecast_documents())
+
+    result = get_forecast_dates_between(
+        datetime(2024, 5, 27, 0), datetime(2024, 5, 28, 0)
+    )
+
+    assert result == [datetime(2024, 5, 27, 12, 0)]
+
+
+def test__migrate_to_columnar_forecasts__same_results_as_documents(mock_database):
+    documents = _create_forecast_documents()
+    mock_database[forecasts.forecast_collection_name].insert_many(documents)
+    params = (
+        forecast_base_time,
+        forecast_base_time + timedelta(hours=9),
+        "city",
+        forecast_base_time,
+    )
+
+    assert migrate_to_columnar_forecasts() == 2
+    assert migrate_to_columnar_forecasts() == 2
+
+    document_results = get_forecast_data_from_database(*params)
+    with mock.patch.dict(os.environ, {"FORECAST_STORAGE": "columnar"}):
+        columnar_results = get_forecast_data_from_database(*params)
+    assert _comparable(columnar_results) == _comparable(document_results)
+
+
+@mock.patch.dict(os.environ, {"FORECAST_STORAGE": "rows"})
+def test__forecast_storage__unknown_storage_raises_error():
+    with pytest.raises(ValueError, match="FORECAST_STORAGE"):
+        forecasts.uses_columnar_forecasts()
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from unittest.mock import patch
+
+from shared.src.database.in_situ_sensors import (
+    get_sensor_catalog,
+    upsert_sensor_catalog,
+)
+
+discovered_time = datetime(2024, 6, 4, 12, 0)
+
+
+@pytest.fixture
+def mock_collection():
+    collection = mongomock.MongoClient().db.in_situ_sensors
+    with patch(
+        "shared.src.database.in_situ_sensors.get_collection", return_value=collection
+    ):
+        yield collection
+
+
+def _create_catalog(locations: list[dict], discovered: datetime = discovered_time):
+    return {
+        "latitude": 51.5,
+        "longitude": -0.1,
+        "radius": 25000,
+        "locations": locations,
+        "discovered_time": discovered,
+    }
+
+
+def test__get_sensor_catalog__returns_fresh_catalog(mock_collection):
+    upsert_sensor_catalog(_create_catalog([{"name": "London Centre"}]))
+
+    result = get_sensor_catalog(51.5, -0.1, 25000, discovered_time - timedelta(hours=1))
+
+    assert result["locations"] == [{"name": "London Centre"}]
+    assert result["discovered_time"] == discovered_time
+
+
+@pytest.mark.parametrize(
+    "latitude, radius, discovered_after",
+    [
+        (53.3, 25000, discovered_time - timedelta(hours=1)),
+        (51.5, 10000, discovered_time - timedelta(hours=1)),
+        (51.5, 25000, discovered_time + timedelta(hours=1)),
+    ],
+)
+def test__get_sensor_catalog__other_point_or_expired_returns_none(
+    mock_collection, latitude, radius, discovered_after
+):
+    upsert_sensor_catalog(_create_catalog([{"name": "London Centre"}]))
+
+    assert get_sensor_catalog(latitude, -0.1, radius, discovered_after) is None
+
+
+def test__get_sensor_catalog__discovered_time_returned_as_naive_utc(mock_collection):
+    mock_collection.insert_one(
+        _create_catalog(
+            [], datetime(2024, 6, 4, 13, 0, tzinfo=timezone(timedelta(hours=1)))
+        )
+    )
+
+    result = get_sensor_catalog(51.5, -0.1, 25000, datetime(2024, 6, 4))
+
+    assert result["discovered_time"] == discovered_time
+
+
+def test__upsert_sensor_catalog__replaces_catalog_for_point(mock_collection):
+    upsert_sensor_catalog(_create_catalog([{"name": "Old"}]))
+    upsert_sensor_catalog(
+        _create_catalog([{"name": "New"}], discovered_time + timedelta(days=1))
+    )
+
+    assert mock_collection.count_documents({}) == 1
+    result = get_sensor_catalog(51.5, -0.1, 25000, discovered_time)
+    assert result["locations"] == [{"name": "New"}]
@@ -1,17 +1,26 @@
-from datetime import datetime
+import asyncio
+import os
+from datetime import datetime, timezone
 from freezegun import freeze_time
 import mongomock
 import pytest
+from unittest import mock
 from unittest.mock import patch
 
+from shared.src.database import in_situ
 from shared.src.database.in_situ import (
     find_by_criteria,
+    find_by_criteria_async,
     insert_data,
     delete_in_situ_data_before,
     get_averaged,
+    get_averaged_async,
+    in_situ_data_expires,
+    migrate_to_time_series_collection,
     ApiSource, get_in_situ_dates_between,
 )
 from shared.src.database.locations import AirQualityLocationType
+from shared.src.database.mongo_db_operations import get_payload_hash
 from shared.tests.util.mock_measurement import create_mock_measurement_document
 
 
@@ -36,6 +45,8 @@ def test__insert_new_data():
             "measurement_date": date,
             "name": "location1",
             "location_name": "API",
+            "location_type": "city",
+            "api_source": "OpenAQ",
             "o3": 123,
         }
         insert_data([in_situ_1])
@@ -47,13 +58,103 @@ def test__insert_new_data():
             **in_situ_1,
             "created_time": date,
             "last_modified_time": date,
+            "payload_hash": get_payload_hash(in_situ_1),
+        }
+
+
+def test__insert_data__unchanged_measurements_not_written_again():
+    test_mock_collection = mongomock.MongoClient().db.collection
+    measurements = [
+        {
+            "measurement_date": datetime(2024, 5, 24, hour),
+            "name": "location1",
+            "location_name": "API",
+            "location_type": "city",
+            "api_source": "OpenAQ",
+            "o3": 123,
         }
+        for hour in range(3)
+    ]
+    with patch(
+        "shared.src.database.mongo_db_operations.get_collection",
+        return_value=test_mock_collection,
+    ):
+        with freeze_time("2024-05-24"):
+            insert_data(measurements)
+        with freeze_time("2024-05-25"):
+            with patch.object(
+                test_mock_collection,
+                "bulk_write",
+                wraps=test_mock_collection.bulk_write,
+            ) as bulk_write:
+                insert_data(
+                    [measurements[0], {**measurements[1], "o3": 456}, measurements[2]]
+                )
+
+    bulk_write.assert_called_once()
+    assert len(bulk_write.call_args.args[0]) == 1
+    results = list(test_mock_collection.find({}, sort=[("measurement_date", 1)]))
+    assert [result["o3"] for result in results] == [123, 456, 123]
+    assert [result["created_time"] for result in results] == [
+        datetime(2024, 5, 24)
+    ] * 3
+    assert [result["last_modified_time"] for result in results] == [
+        datetime(2024, 5, 24),
+        datetime(2024, 5, 25),
+        datetime(2024, 5, 24),
+    ]
+
+
+def test__insert_data__measurements_from_other_api_source_kept():
+    test_mock_collection = mongomock.MongoClient().db.collection
+    measurement = {
+        "measurement_date": datetime(2024, 5, 24),
+        "name": "location1",
+        "location_name": "API",
+        "location_type": "city",
+        "api_source": "OpenAQ",
+        "o3": 123,
+    }
+    with patch(
+        "shared.src.database.mongo_db_operations.get_collection",
+        return_value=test_mock_collection,
+    ):
+        insert_data([measurement, {**measurement, "api_source": "other", "o3": 456}])
+
+    results = list(test_mock_collection.find({}, sort=[("api_source", 1)]))
+    assert [(result["api_source"], result["o3"]) for result in results] == [
+        ("OpenAQ", 123),
+        ("other", 456),
+    ]
+
+
+def test__insert_data__all_unchanged_measurements_skip_write():
+    test_mock_collection = mongomock.MongoClient().db.collection
+    measurement = {
+        "measurement_date": datetime(2024, 5, 24),
+        "name": "location1",
+        "location_name": "API",
+        "location_type": "city",
+        "api_source": "OpenAQ",
+        "o3": 123,
+    }
+    with patch(
+        "shared.src.database.mongo_db_operations.get_collection",
+        return_value=test_mock_collection,
+    ):
+        insert_data([measurement])
+        with patch.object(test_mock_collection, "bulk_write") as bulk_write:
+            insert_data([measurement])
+
+    bulk_write.assert_not_called()
 
 
 def test__delete_in_situ_data_before(mock_collection):
     in_situ = {
         "name": "location1",
         "location_name": "API",
+        "location_type": "city",
+        "api_source": "OpenAQ",
         "o3": 123,
     }
     mock_collection.insert_many(
@@ -298,3 +399,269 @@ def test__get_in_situ_dates_between__dates_inside_range(mock_collection):
         datetime(2024, 5, 29, 0))
 
     assert len(result) == 3
+
+
+def test__find_by_criteria_async__same_results_as_blocking_query(mock_collection):
+    mock_collection.insert_many(
+        [
+            create_mock_measurement_document(
+                {"name": "London", "measurement_date": datetime(2024, 5, 1, 5, 0)}
+            ),
+            create_mock_measurement_document(
+                {"name": "Paris", "measurement_date": datetime(2024, 5, 1, 11, 0)}
+            ),
+        ]
+    )
+    params = (
+        datetime(2024, 5, 1, 0, 0),
+        datetime(2024, 5, 1, 6, 0),
+        AirQualityLocationType.CITY,
+    )
+
+    result = asyncio.run(find_by_criteria_async(*params))
+
+    assert result == find_by_criteria(*params)
+    assert [measurement["name"] for measurement in result] == ["London"]
+
+
+def test__get_averaged_async__same_results_as_blocking_query(mock_collection):
+    mock_collection.insert_many(
+        [
+            create_mock_measurement_document(
+                {
+                    "name": "city 1",
+                    "measurement_date": datetime(2024, 6, 5, 3, 0),
+                    "o3": {"value": 5.0},
+                }
+            ),
+        ]
+    )
+    params = (datetime(2024, 6, 5, 3, 0), 90, AirQualityLocationType.CITY)
+
+    result = asyncio.run(get_averaged_async(*params))
+
+    assert result == get_averaged(*params)
+    assert result[0]["o3"] == {"mean": 5.0}
+
+
+@pytest.fixture
+def mock_database(monkeypatch):
+    database = mongomock.MongoClient(tz_aware=True).db
+    # mongomock cannot create time series collections, so a plain collection
+    # stands in for one
+    database.create_collection(in_situ.time_series_collection_name)
+    monkeypatch.setattr(in_situ, "_time_series_collection_ready", False)
+    with patch(
+        "shared.src.database.in_situ.get_collection",
+        side_effect=lambda name: database[name],
+    ):
+        yield database
+
+
+def _create_time_series_measurements():
+    return [
+        create_mock_measurement_document(
+            {
+                "name": name,
+                "location_name": f"{name}, Site 1",
+                "api_source": ApiSource.OPENAQ.value,
+                "measurement_date": datetime(2024, 6, 5, hour, 0, tzinfo=timezone.utc),
+                "o3": {"value": float(hour)},
+            }
+        )
+        for name in ["London", "Paris"]
+        for hour in range(4)
+    ]
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__insert_data__time_series_stores_location_fields_in_meta(mock_database):
+    measurement = _create_time_series_measurements()[0]
+
+    insert_data([measurement])
+
+    documents = list(mock_database[in_situ.time_series_collection_name].find({}))
+    assert len(documents) == 1
+    assert documents[0]["meta"] == {
+        key: measurement[key]
+        for key in in_situ.time_series_meta_fields
+        if key in measurement
+    }
+    assert documents[0]["o3"] == measurement["o3"]
+    assert "name" not in documents[0]
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__insert_data__time_series_stored_measurements_not_duplicated(mock_database):
+    measurements = _create_time_series_measurements()
+
+    insert_data(measurements[:5])
+    insert_data(measurements)
+
+    collection = mock_database[in_situ.time_series_collection_name]
+    assert collection.count_documents({}) == len(measurements)
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__insert_data__time_series_deduplicated_on_in_situ_index_fields(
+    mock_database,
+):
+    measurements = _create_time_series_measurements()
+    other_source_measurements = [
+        {**measurement, "api_source": "other source"} for measurement in measurements
+    ]
+
+    insert_data(measurements)
+    insert_data(other_source_measurements)
+
+    collection = mock_database[in_situ.time_series_collection_name]
+    assert collection.count_documents({}) == 2 * len(measurements)
+    assert collection.count_documents({"meta.api_source": "other source"}) == len(
+        measurements
+    )
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__find_by_criteria__time_series_returns_measurements(mock_database):
+    measurements = _create_time_series_measurements()
+    insert_data(measurements)
+
+    results = find_by_criteria(
+        datetime(2024, 6, 5, 1, 0, tzinfo=timezone.utc),
+        datetime(2024, 6, 5, 2, 0, tzinfo=timezone.utc),
+        AirQualityLocationType.CITY,
+        ["Paris"],
+        ApiSource.OPENAQ,
+    )
+
+    assert [(result["name"], result["o3"]["value"]) for result in results] == [
+        ("Paris", 1.0),
+        ("Paris", 2.0),
+    ]
+    assert results[0]["location"] == measurements[0]["location"]
+    assert "meta" not in results[0]
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__get_averaged__time_series_same_results_as_collection(mock_database):
+    measurements = _create_time_series_measurements()
+    insert_data(measurements)
+    mock_database[in_situ.collection_name].insert_many(measurements)
+    params = (
+        datetime(2024, 6, 5, 2, 0, tzinfo=timezone.utc),
+        60,
+        AirQualityLocationType.CITY,
+    )
+
+    time_series_results = get_averaged(*params)
+    with mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "collection"}):
+        collection_results = get_averaged(*params)
+
+    sort_by_name = lambda results: sorted(results, key=lambda x: x["name"])  # noqa
+    assert sort_by_name(time_series_results) == sort_by_name(collection_results)
+    assert sort_by_name(time_series_results)[0]["o3"] == {"mean": 2.0}
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "time_series"})
+def test__delete_in_situ_data_before__time_series_deletes_old_measurements(
+    mock_database,
+):
+    insert_data(_create_time_series_measurements())
+
+    delete_in_situ_data_before(datetime(2024, 6, 5, 2, 0, tzinfo=timezone.utc))
+
+    collection = mock_database[in_situ.time_series_collection_name]
+    assert collection.count_documents({}) == 4
+
+
+def test__migrate_to_time_series_collection__all_measurements_copied(mock_database):
+    measurements = _create_time_series_measurements()
+    mock_database[in_situ.collection_name].insert_many(measurements)
+
+    assert migrate_to_time_series_collection(batch_size=3) == len(measurements)
+    assert migrate_to_time_series_collection(batch_size=3) == 0
+
+    target = mock_database[in_situ.time_series_collection_name]
+    assert target.count_documents({}) == len(measurements)
+    assert target.count_documents({"meta.name": "Paris"}) == 4
+
+
+def test__migrate_to_time_series_collection__resumes_interrupted_migration(
+    mock_database,
+):
+    measurements = sorted(
+        _create_time_series_measurements(), key=lambda x: x["measurement_date"]
+    )
+    mock_database[in_situ.collection_name].insert_many(measurements)
+    target = mock_database[in_situ.time_series_collection_name]
+    in_situ._insert_time_series_data(target, measurements[:3])
+
+    with patch.object(
+        in_situ, "_insert_time_series_data", wraps=in_situ._insert_time_series_data
+    ) as mock_insert:
+        assert migrate_to_time_series_collection(batch_size=100) == 5
+
+    # Only measurements from the latest copied measurement date are read again
+    assert len(mock_insert.call_args_list[0].args[1]) == 6
+    assert target.count_documents({}) == len(measurements)
+
+
+def test__ensure_time_series_collection__created_with_expiry():
+    database = mock.MagicMock()
+    database.list_collection_names.return_value = []
+    collection = mock.MagicMock(database=database)
+
+    with mock.patch.dict(os.environ, {"DELETE_LIMIT_WEEKS": "2"}):
+        in_situ._ensure_time_series_collection(collection)
+
+    database.create_collection.assert_called_once_with(
+        in_situ.time_series_collection_name,
+        timeseries={
+            "timeField": "measurement_date",
+            "metaField": "meta",
+            "granularity": "hours",
+        },
+        expireAfterSeconds=1209600,
+    )
+
+
+def test__ensure_in_situ_data_expiry__existing_collection_expiry_updated(
+    monkeypatch,
+):
+    database = mock.MagicMock()
+    database.list_collection_names.return_value = [
+        in_situ.time_series_collection_name
+    ]
+    collection = mock.MagicMock(database=database)
+    monkeypatch.setattr(in_situ, "_time_series_collection_ready", False)
+
+    with patch(
+        "shared.src.database.in_situ.get_collection", return_value=collection
+    ) as mock_get_collection:
+        with mock.patch.dict(os.environ, {"DELETE_LIMIT_WEEKS": "2"}):
+            in_situ.ensure_in_situ_data_expiry()
+
+    mock_get_collection.assert_called_once_with(in_situ.time_series_collection_name)
+    database.command.assert_called_once_with(
+        "collMod", in_situ.time_series_collection_name, expireAfterSeconds=1209600
+    )
+    assert in_situ._time_series_collection_ready
+
+
+@pytest.mark.parametrize(
+    "environment, expected",
+    [
+        ({"IN_SITU_STORAGE": "collection", "DELETE_LIMIT_WEEKS": "2"}, False),
+        ({"IN_SITU_STORAGE": "time_series", "DELETE_LIMIT_WEEKS": "0"}, False),
+        ({"IN_SITU_STORAGE": "time_series", "DELETE_LIMIT_WEEKS": "2"}, True),
+    ],
+)
+def test__in_situ_data_expires(environment, expected):
+    with mock.patch.dict(os.environ, environment):
+        assert in_situ_data_expires() == expected
+
+
+@mock.patch.dict(os.environ, {"IN_SITU_STORAGE": "bucketed"})
+def test__in_situ_storage__unknown_storage_raises_error():
+    with pytest.raises(ValueError, match="IN_SITU_STORAGE"):
+        in_situ_data_expires()
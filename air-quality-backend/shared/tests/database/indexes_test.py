@@ -0,0 +1,73 @@
+import mongomock
+import pytest
+from unittest.mock import patch
+
+from shared.src.database.indexes import collection_indexes, ensure_indexes
+
+
+@pytest.fixture
+def mock_database():
+    database = mongomock.MongoClient().db
+    with patch(
+        "shared.src.database.indexes.get_collection",
+        side_effect=lambda name: database[name],
+    ):
+        yield database
+
+
+def test__ensure_indexes__indexes_created_for_each_collection(mock_database):
+    ensure_indexes()
+
+    for collection_name, indexes in collection_indexes.items():
+        index_information = mock_database[collection_name].index_information()
+        for index in indexes:
+            created = index_information[index.document["name"]]
+            assert list(created["key"]) == list(index.document["key"].items())
+            assert created.get("unique", False) == index.document.get("unique", False)
+
+
+def test__ensure_indexes__query_keys_lead_unique_indexes():
+    def index_keys(collection_name, index_name):
+        for index in collection_indexes[collection_name]:
+            if index.document["name"] == index_name:
+                return list(index.document["key"].keys())
+
+    assert index_keys("forecast_data", "uniq_forecast_idx")[:4] == [
+        "forecast_base_time",
+        "location_type",
+        "name",
+        "forecast_valid_time",
+    ]
+    assert "variable" in index_keys("data_textures", "uniq_texture_idx")
+    assert index_keys("in_situ_data", "uniq_in_situ_idx")[:2] == [
+        "location_type",
+        "name",
+    ]
+
+
+def test__ensure_indexes__index_with_outdated_keys_replaced(mock_database):
+    mock_database["forecast_data"].create_index(
+        [
+            ("forecast_valid_time", 1),
+            ("forecast_base_time", 1),
+            ("location_type", 1),
+            ("name", 1),
+            ("source", 1),
+        ],
+        unique=True,
+        name="uniq_forecast_idx",
+    )
+
+    ensure_indexes()
+
+    index = mock_database["forecast_data"].index_information()["uniq_forecast_idx"]
+    assert list(index["key"])[0] == ("forecast_base_time", 1)
+
+
+def test__ensure_indexes__repeated_calls_leave_indexes_unchanged(mock_database):
+    ensure_indexes()
+    before = mock_database["in_situ_data"].index_information()
+
+    ensure_indexes()
+
+    assert mock_database["in_situ_data"].index_information() == before
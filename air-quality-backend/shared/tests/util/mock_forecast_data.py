@@ -220,6 +220,35 @@ multi_level_data_set = xarray.Dataset(
     data_vars=dict(no2=no2, go3=go3, so2=so2, t=t),
 )
 
+# Attributes cfgrib gives the time coordinates when opened with decode_times=False
+cfgrib_time_attributes = {
+    "time": {
+        "long_name": "initial time of forecast",
+        "standard_name": "forecast_reference_time",
+        "units": "seconds since 1970-01-01T00:00:00",
+        "calendar": "proleptic_gregorian",
+    },
+    "step": {
+        "long_name": "time since forecast_reference_time",
+        "standard_name": "forecast_period",
+        "units": "hours",
+    },
+    "valid_time": {
+        "long_name": "time",
+        "standard_name": "time",
+        "units": "seconds since 1970-01-01T00:00:00",
+        "calendar": "proleptic_gregorian",
+    },
+}
+
+
+def with_cfgrib_time_attributes(dataset: xarray.Dataset) -> xarray.Dataset:
+    dataset = dataset.copy(deep=True)
+    for name, attributes in cfgrib_time_attributes.items():
+        dataset[name].attrs.update(attributes)
+    return dataset
+
+
 gridded_data_single_level = xarray.Dataset(
     {
         "latitude": (("x",), np.linspace(0, 10, 11), {"units": "degrees_north"}),
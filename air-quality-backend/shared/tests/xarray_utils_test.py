@@ -1,5 +1,6 @@
 from shared.src.xarray_utils import (
     _get_dimension_by_attr,
+    get_chunk_slices,
     get_dim_names,
 )
 
@@ -34,3 +35,15 @@ def test__get_dim_names():
     assert lat.attrs["units"] == "degrees_north"
     assert lon.attrs["units"] == "degrees_east"
     assert time.attrs["standard_name"] == "time"
+
+
+def test__get_chunk_slices__in_memory_data_returns_single_slice():
+    data = gridded_data_single_level["pm10"]
+
+    assert get_chunk_slices(data, "t") == [slice(None)]
+
+
+def test__get_chunk_slices__returns_slice_per_chunk():
+    data = gridded_data_single_level["pm10"].chunk({"t": 4})
+
+    assert get_chunk_slices(data, "t") == [slice(0, 4), slice(4, 8), slice(8, 11)]
@@ -0,0 +1,87 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+import pytest
+from dotenv import load_dotenv
+
+from etl.src.forecast.forecast_adapter import transform
+from etl.src.forecast.forecast_dao import fetch_forecast_data
+from etl.src.forecast.forecast_data import ForecastData, convert_longitude
+from shared.src.aqi.pollutant_type import PollutantType
+from shared.src.database.locations import AirQualityLocationType
+
+load_dotenv()
+
+# The known forecast behind the 2024-06-04_00 texture comparisons
+forecast_base_time = datetime(2024, 6, 4, 0)
+
+
+@pytest.fixture(scope="module")
+def known_grib_data():
+    # Keep the datasets as read from the GRIB files, before any conversion
+    with mock.patch(
+        "etl.src.forecast.forecast_dao.ForecastData",
+        side_effect=lambda single, multi, **kwargs: (single, multi),
+    ):
+        single_level_data, multi_level_data = fetch_forecast_data(forecast_base_time, 3)
+    yield single_level_data.load(), multi_level_data.load()
+
+
+def _convert_longitude_with_decimal(longitude_value: float) -> float:
+    if 180 < longitude_value <= 360:
+        return float(Decimal(str(longitude_value)) - Decimal("360"))
+    return longitude_value
+
+
+def _locations() -> list:
+    # Grid of points over the globe, including either side of the antimeridian
+    return [
+        {
+            "name": f"{latitude}, {longitude}",
+            "type": AirQualityLocationType.CITY,
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+        for latitude in np.arange(-75.0, 80.0, 15.0).tolist()
+        for longitude in np.arange(-179.9, 180.0, 12.4).tolist() + [179.9]
+    ]
+
+
+@pytest.mark.parametrize("level", [0, 1], ids=["single_level", "multi_level"])
+def test__convert_longitude__matches_decimal_conversion(known_grib_data, level):
+    dataset = known_grib_data[level]
+    expected = sorted(
+        _convert_longitude_with_decimal(lon)
+        for lon in dataset["longitude"].values.tolist()
+    )
+
+    result = convert_longitude(dataset)
+
+    assert result["longitude"].values.tolist() == expected
+
+
+def test__transform__matches_decimal_unit_conversion(known_grib_data):
+    single_level_data, multi_level_data = known_grib_data
+    forecast_data = ForecastData(
+        single_level_data.copy(deep=True), multi_level_data.copy(deep=True)
+    )
+    locations = _locations()
+
+    results = transform(forecast_data, locations)
+
+    steps = forecast_data.get_step_values().size
+    pollutant_data = forecast_data.get_pollutant_data_for_locations(
+        locations, list(PollutantType)
+    )
+    assert len(results) == len(locations) * steps
+    for i, (_, data_by_pollutant) in enumerate(pollutant_data):
+        for pollutant_type, values in data_by_pollutant.items():
+            expected = [float(Decimal(str(x)) * Decimal(10**9)) for x in values]
+            result = [
+                document[pollutant_type.value]["value"]
+                for document in results[i * steps : (i + 1) * steps]
+            ]
+            # At most one unit in the last place from the decimal result
+            assert result == pytest.approx(expected, rel=1e-15)
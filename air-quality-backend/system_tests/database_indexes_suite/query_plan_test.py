@@ -0,0 +1,196 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+from dotenv import load_dotenv
+
+from shared.src.database import forecasts, in_situ, locations
+from shared.src.database.in_situ import ApiSource
+from shared.src.database.indexes import ensure_indexes
+from shared.src.database.locations import AirQualityLocationType
+from shared.src.database.mongo_db_operations import close_clients, get_collection
+from system_tests.data.forecast_api_test_data import (
+    create_forecast_database_data_with_overrides,
+)
+from system_tests.data.measurement_summary_api_test_data import (
+    create_in_situ_database_data_with_overrides,
+)
+from system_tests.utils.database_utilities import (
+    delete_database_data,
+    seed_api_test_data,
+)
+from system_tests.utils.query_plan_utilities import (
+    RecordingCollection,
+    explain_query,
+    find_query_plan_problems,
+)
+
+base_time = datetime.datetime(2024, 6, 10, 0, 0, 0, tzinfo=datetime.timezone.utc)
+city_names = [f"Test City {index}" for index in range(10)]
+texture_variables = ["aqi", "no2", "o3", "pm10", "pm2_5", "so2", "winds_10m"]
+
+
+def _seed_forecast_data():
+    return [
+        create_forecast_database_data_with_overrides(
+            {
+                "forecast_base_time": base_time + datetime.timedelta(hours=12 * day),
+                "forecast_valid_time": base_time
+                + datetime.timedelta(hours=12 * day + 3 * step),
+                "name": name,
+            }
+        )
+        for day in range(3)
+        for step in range(20)
+        for name in city_names
+    ]
+
+
+def _seed_data_textures():
+    return [
+        {
+            "forecast_base_time": base_time + datetime.timedelta(hours=12 * day),
+            "variable": variable,
+            "source": "cams-production",
+            "time_start": base_time,
+            "time_end": base_time + datetime.timedelta(days=5),
+            "texture_uri": f"/{variable}_{day}.webp",
+        }
+        for day in range(3)
+        for variable in texture_variables
+    ]
+
+
+def _seed_in_situ_data():
+    return [
+        create_in_situ_database_data_with_overrides(
+            {
+                "measurement_date": base_time + datetime.timedelta(hours=hour),
+                "name": name,
+                "location_name": f"{name}, Site {site}",
+                "api_source": api_source.value,
+            }
+        )
+        for hour in range(48)
+        for name in city_names
+        for site in range(3)
+        for api_source in ApiSource
+    ]
+
+
+def _seed_locations():
+    return [{"name": name, "type": "city"} for name in city_names]
+
+
+@pytest.fixture(scope="module")
+def seeded_database():
+    load_dotenv()
+    seeded_collections = {
+        "forecast_data": _seed_forecast_data(),
+        "data_textures": _seed_data_textures(),
+        "in_situ_data": _seed_in_situ_data(),
+        "locations": _seed_locations(),
+    }
+    for collection_name in seeded_collections:
+        delete_database_data(collection_name)
+    ensure_indexes()
+    for collection_name, documents in seeded_collections.items():
+        seed_api_test_data(collection_name, documents)
+    yield get_collection("forecast_data").database
+    for collection_name in seeded_collections:
+        delete_database_data(collection_name)
+    close_clients()
+
+
+def _record_queries(database, query):
+    queries = []
+
+    def get_recording_collection(name):
+        return RecordingCollection(database[name], queries)
+
+    with (
+        patch.object(forecasts, "get_collection", get_recording_collection),
+        patch.object(in_situ, "get_collection", get_recording_collection),
+        patch.object(locations, "get_collection", get_recording_collection),
+        patch(
+            "shared.src.database.mongo_db_operations.get_collection",
+            get_recording_collection,
+        ),
+    ):
+        query()
+    return queries
+
+
+forecast_valid_from = base_time + datetime.timedelta(hours=12)
+forecast_valid_to = base_time + datetime.timedelta(hours=36)
+
+dao_queries = {
+    "get_forecast_data_from_database": lambda: (
+        forecasts.get_forecast_data_from_database(
+            forecast_valid_from, forecast_valid_to, "city", base_time
+        )
+    ),
+    "get_forecast_data_from_database__location": lambda: (
+        forecasts.get_forecast_data_from_database(
+            forecast_valid_from, forecast_valid_to, "city", base_time, "Test City 1"
+        )
+    ),
+    "get_forecast_dates_between": lambda: forecasts.get_forecast_dates_between(
+        base_time, base_time + datetime.timedelta(hours=12)
+    ),
+    "delete_forecast_data_before": lambda: forecasts.delete_forecast_data_before(
+        base_time + datetime.timedelta(hours=12)
+    ),
+    "insert_forecast_data": lambda: forecasts.insert_data(_seed_forecast_data()[:1]),
+    "get_data_textures_from_database": lambda: (
+        forecasts.get_data_textures_from_database(base_time)
+    ),
+    "delete_data_texture_data_before": lambda: (
+        forecasts.delete_data_texture_data_before(
+            base_time + datetime.timedelta(hours=12)
+        )
+    ),
+    "insert_textures": lambda: forecasts.insert_textures(_seed_data_textures()[:1]),
+    "find_by_criteria": lambda: in_situ.find_by_criteria(
+        base_time,
+        base_time + datetime.timedelta(hours=6),
+        AirQualityLocationType.CITY,
+    ),
+    "find_by_criteria__locations": lambda: in_situ.find_by_criteria(
+        base_time,
+        base_time + datetime.timedelta(hours=6),
+        AirQualityLocationType.CITY,
+        ["Test City 1", "Test City 2"],
+    ),
+    "find_by_criteria__api_source": lambda: in_situ.find_by_criteria(
+        base_time,
+        base_time + datetime.timedelta(hours=6),
+        AirQualityLocationType.CITY,
+        None,
+        ApiSource.OPENAQ,
+    ),
+    "get_averaged": lambda: in_situ.get_averaged(
+        base_time + datetime.timedelta(hours=3), 90, AirQualityLocationType.CITY
+    ),
+    "get_in_situ_dates_between": lambda: in_situ.get_in_situ_dates_between(
+        base_time, base_time + datetime.timedelta(hours=6)
+    ),
+    "delete_in_situ_data_before": lambda: in_situ.delete_in_situ_data_before(
+        base_time + datetime.timedelta(hours=6)
+    ),
+    "insert_in_situ_data": lambda: in_situ.insert_data(_seed_in_situ_data()[:1]),
+    "get_locations_by_type": lambda: locations.get_locations_by_type(
+        AirQualityLocationType.CITY
+    ),
+}
+
+
+@pytest.mark.parametrize("dao_query", dao_queries.values(), ids=dao_queries.keys())
+def test__dao_query_plans__use_indexes_efficiently(seeded_database, dao_query):
+    queries = _record_queries(seeded_database, dao_query)
+    assert len(queries) > 0
+
+    for collection_name, query_type, query in queries:
+        explained = explain_query(seeded_database, collection_name, query_type, query)
+        problems = find_query_plan_problems(explained)
+        assert problems == [], f"{query_type} on {collection_name}: {query}"
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+from pymongo.collection import Collection
+
+# Index scans may seek past a few keys per unbounded field, but should not
+# examine many more keys or documents than the query returns
+MAX_EXAMINED_PER_RETURNED = 3
+
+
+class RecordingCollection:
+    """
+    Wraps a collection to record the queries issued against it by the
+    shared.src.database functions. Reads run as normal, writes are only recorded.
+    """
+
+    def __init__(self, collection: Collection, queries: list):
+        self.collection = collection
+        self.queries = queries
+
+    def find(self, query_filter=None, *args, **kwargs):
+        self.queries.append((self.collection.name, "find", query_filter or {}))
+        return self.collection.find(query_filter, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        self.queries.append((self.collection.name, "aggregate", pipeline))
+        return self.collection.aggregate(pipeline, *args, **kwargs)
+
+    def delete_many(self, query_filter, *args, **kwargs):
+        self.queries.append((self.collection.name, "delete", query_filter))
+        return SimpleNamespace(deleted_count=0)
+
+    def bulk_write(self, operations, *args, **kwargs):
+        # Upserts look up the existing document by the upsert keys
+        for operation in operations[:1]:
+            self.queries.append((self.collection.name, "find", operation._filter))
+        return SimpleNamespace(upserted_ids={}, upserted_count=0, modified_count=0)
+
+
+def explain_query(database, collection_name: str, query_type: str, query) -> dict:
+    if query_type == "find":
+        command = {"find": collection_name, "filter": query}
+    elif query_type == "aggregate":
+        command = {"aggregate": collection_name, "pipeline": query, "cursor": {}}
+    elif query_type == "delete":
+        command = {"delete": collection_name, "deletes": [{"q": query, "limit": 0}]}
+    else:
+        raise ValueError(f"Cannot explain query type {query_type}")
+    return database.command("explain", command, verbosity="executionStats")
+
+
+def _find_plan_stages(plan) -> list[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key, value in plan.items():
+            if key not in ["rejectedPlans", "allPlansExecution"]:
+                stages.extend(_find_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_find_plan_stages(value))
+    return stages
+
+
+def _find_execution_stats(explained) -> dict | None:
+    if isinstance(explained, dict):
+        if "executionStats" in explained:
+            return explained["executionStats"]
+        values = explained.values()
+    elif isinstance(explained, list):
+        values = explained
+    else:
+        return None
+    for value in values:
+        execution_stats = _find_execution_stats(value)
+        if execution_stats is not None:
+            return execution_stats
+    return None
+
+
+def _find_stage_value(plan, key: str) -> int:
+    if isinstance(plan, dict):
+        if key in plan:
+            return plan[key]
+        values = plan.values()
+    elif isinstance(plan, list):
+        values = plan
+    else:
+        return 0
+    return max((_find_stage_value(value, key) for value in values), default=0)
+
+
+def find_query_plan_problems(explained: dict) -> list[str]:
+    """
+    Check an explain() output in executionStats verbosity for collection
+    scans and for examining many more keys or documents than are returned.
+    :return: a description of each problem found
+    """
+    problems = []
+    execution_stats = _find_execution_stats(explained)
+    if "COLLSCAN" in _find_plan_stages(explained):
+        problems.append("query plan uses a collection scan")
+    if execution_stats is None:
+        return problems
+
+    returned = max(
+        execution_stats.get("nReturned", 0),
+        _find_stage_value(execution_stats, "nWouldDelete"),
+        1,
+    )
+    for examined_key in ["totalKeysExamined", "totalDocsExamined"]:
+        examined = execution_stats.get(examined_key, 0)
+        if examined > MAX_EXAMINED_PER_RETURNED * returned:
+            problems.append(f"{examined_key} {examined} for {returned} returned")
+    return problems